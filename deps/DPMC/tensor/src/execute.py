@@ -20,6 +20,13 @@ import util
     default="-",
     help="Join tree to use",
 )
+@click.option(
+    "--evidence",
+    required=False,
+    type=click.File(mode="r"),
+    default=None,
+    help="Sets of evidence to count under, one per line (a name followed by literals)",
+)
 @click.option(
     "--timeout",
     required=False,
@@ -38,7 +45,8 @@ import util
     default="float64",
     help="Data type to use for all tensor computations",
     type=click.Choice(
-        ["uint", "int", "bigint", "float16", "float32", "float64"], case_sensitive=False
+        ["uint", "int", "bigint", "float16", "float32", "float64", "scaled"],
+        case_sensitive=False,
     ),
 )
 @click.option(
@@ -47,6 +55,15 @@ import util
     help="Tensor library to use",
     type=util.TaggedChoice(tensor_network.ALL_APIS, case_sensitive=False),
 )
+@click.option(
+    "--contraction",
+    default="greedy",
+    help="How the tensors at each node of the join tree are contracted: one at a "
+    "time in the order of the join tree (fold) or in an order planned greedily "
+    "or optimally (for up to 6 tensors and weight vectors) by the sizes of "
+    "intermediate tensors",
+    type=click.Choice(["fold", "greedy", "optimal"], case_sensitive=False),
+)
 @click.option(
     "--max_width",
     type=int,
@@ -65,10 +82,12 @@ import util
 def run(
     formula,
     join_tree,
+    evidence,
     timeout,
     output,
     entry_type,
     tensor_library,
+    contraction,
     max_width,
     thread_limit,
     performance_factor,
@@ -79,19 +98,40 @@ def run(
     stopwatch = util.Stopwatch()
     with util.TimeoutTimer(timeout) as timer:
         try:
-            formula = util.Formula.parse_DIMACS(formula)
+            if util.is_binary_formula(formula.name):
+                formula = util.BinaryFormula(formula.name)
+            else:
+                formula = util.Formula.parse_DIMACS(formula)
             stopwatch.record_interval("Parse Formula")
 
             tree = get_join_tree(
-                formula, join_tree, timer, output, max_width, performance_factor
+                formula,
+                join_tree,
+                timer,
+                output,
+                max_width,
+                performance_factor,
+                contraction,
             )
             if tree is not None:
                 timer.reset_timeout(timeout)
                 stopwatch.record_interval("Parse Join Tree")
 
-                count = execute_join_tree(formula, tree, tensor_library, output)
-                if count is not None:
-                    output.output_pair("Count", count)
+                if evidence is None:
+                    count = execute_join_tree(
+                        formula, tree, tensor_library, output, contraction=contraction
+                    )
+                    if count is not None:
+                        output.output_pair("Count", count)
+                        stopwatch.record_interval("Execution")
+                else:
+                    # The same formula and join tree are used for all evidence
+                    for name, literals in parse_evidence(evidence):
+                        count = execute_join_tree(
+                            formula, tree, tensor_library, output, literals, contraction
+                        )
+                        if count is not None:
+                            output.output_pair("Count " + name, count)
                     stopwatch.record_interval("Execution")
             stopwatch.record_total("Total")
         except TimeoutError:
@@ -107,7 +147,13 @@ def run(
 
 
 def get_join_tree(
-    formula, join_tree_stream, timer, output, max_width, performance_factor
+    formula,
+    join_tree_stream,
+    timer,
+    output,
+    max_width,
+    performance_factor,
+    contraction="greedy",
 ):
     best_join_tree = None
     best_time = None
@@ -122,7 +168,7 @@ def get_join_tree(
             )
             if next_join_tree is None:
                 break
-            width = next_join_tree.tensor_width(formula)
+            width = next_join_tree.tensor_width(formula, contraction)
             util.log("Parsed join tree with tensor width " + str(width), flush=True)
 
             if new_pid is not None:
@@ -134,7 +180,7 @@ def get_join_tree(
                 best_width = width
 
                 if width <= max_width:
-                    flops = next_join_tree.tensor_flops(formula)
+                    flops = next_join_tree.tensor_flops(formula, contraction)
                     timer.recap_timeout(flops * performance_factor)
     except TimeoutError:
         timed_out = True
@@ -168,16 +214,54 @@ def get_join_tree(
         return best_join_tree
 
 
-def execute_join_tree(formula, join_tree, tensor_library, output):
+def parse_evidence(file):
+    """
+    Parse a file of evidence, as written by the -b option of encode.py.
+
+    Each line holds the name of a set of evidence followed by the DIMACS literals
+    that are true under the evidence.
+
+    :param file: A handler to the file to read
+    :return: an iterator of (name, list of literals) pairs
+    """
+    for line in file:
+        words = line.split()
+        if len(words) > 0:
+            yield words[0], [int(lit) for lit in words[1:]]
+
+
+def execute_join_tree(
+    formula, join_tree, tensor_library, output, evidence=(), contraction="greedy"
+):
+    """
+    Compute the weighted model count of the formula with the join tree.
+
+    Evidence (a list of literals) is applied by slicing every clause tensor at the
+    values of the evidence variables instead of adding unit clauses, so the same
+    join tree can be used for any evidence. The weights of the evidence literals
+    (and the constant factor of the formula) are then multiplied into the count.
+
+    If the entry type is "scaled", every tensor is a float64 tensor with a
+    power-of-two scale (see Tensor.normalise), so counts far below the smallest
+    float64 do not underflow to zero.
+
+    The tensors at each internal node are either contracted at once in a planned
+    order (see Tensor.contract), or joined one at a time if contraction is "fold".
+    """
+    values = {abs(lit): 1 if lit > 0 else 0 for lit in evidence}
+
     def at_leaf(node_id):
-        return tensor_network.Tensor.from_clause(
-            tensor_library, formula.clause(node_id - 1)
-        )
+        # Clause tensors are only materialised if they cannot be absorbed into other
+        # tensors (or if contraction is "fold")
+        result = tensor_network.ClauseTensor.from_clause(formula.clause(node_id - 1))
+        result.slice_variables(values)
+        return result
 
     def at_internal_node(children, projected_vars):
         projected_weights = {
             var: (formula.literal_weight(-var), formula.literal_weight(var))
             for var in projected_vars
+            if var not in values
         }
 
         # Handle join tree internal nodes that have no children
@@ -185,6 +269,12 @@ def execute_join_tree(formula, join_tree, tensor_library, output):
         if len(children) == 0:
             return None
 
+        if contraction != "fold":
+            return tensor_network.Tensor.contract(
+                tensor_library, children, projected_weights, contraction
+            )
+
+        children = [child.materialise(tensor_library) for child in children]
         result = children[0]
         if len(children) == 1:
             # Nothing to join with, just do the projection
@@ -193,14 +283,22 @@ def execute_join_tree(formula, join_tree, tensor_library, output):
 
         # Perform all joins, including the projection for the last
         for other in children[1:-1]:
-            result.join_with(tensor_library, other, [])
+            result.join_with(tensor_library, other, {})
         result.join_with(tensor_library, children[-1], projected_weights)
 
         return result
 
     try:
-        count = join_tree.visit(at_internal_node, at_leaf)
-        return count.base[tuple()]
+        result = join_tree.visit(at_internal_node, at_leaf)
+        if formula.constant != 1:
+            result.base = tensor_library.multiply(result.base, formula.constant)
+            result.normalise(tensor_library)
+        for var, value in values.items():
+            result.base = tensor_library.multiply(
+                result.base, formula.literal_weight(var if value == 1 else -var)
+            )
+            result.normalise(tensor_library)
+        return tensor_library.to_number(result.base[tuple()], result.scale)
     except TimeoutError:
         util.log("Execution timed out", flush=True)
         output.output_pair("Error", "execution timeout")
@@ -161,46 +161,66 @@ class JoinTree:
         highest_join_length = max(self._get_costs(formula, score_add_join))
         return max(highest_clause_length, highest_join_length)
 
-    def tensor_width(self, formula):
+    def _get_products(self, formula, contraction="greedy"):
         """
-        Compute the width when tensors are used to execute this join tree.
+        List the variables of every product of tensors computed when this join tree
+        is executed with the given contraction (see execute_join_tree).
+
+        If contraction is "fold", the children of a node are joined one at a time
+        (see Tensor.join_with), and the projected variables of the node are summed
+        out by the last join. Otherwise, all children of a node are contracted at
+        once (see Tensor.contract), so the product is over all of their variables.
+        Since either is a single einsum, every tensor that it builds (its result or
+        an intermediate tensor) has at most the variables of the product, and no
+        variable is duplicated. For a planned contraction, this is only an upper
+        bound: the largest intermediate tensor of a good plan is usually smaller.
         """
+        products = []
 
-        def score_tensor_join(left, right, projected_vars):
-            var_both = [var for var in left if var in right]
-            left_size = len(left)
-            right_size = len(right)
-            for var in reversed(var_both):
-                if var not in projected_vars:
-                    # Non-projected variable that appears in both must be duplicated
-                    if left_size <= right_size:
-                        left_size += 1
-                    else:
-                        right_size += 1
-            result_size = left_size + right_size - 2 * len(var_both)
-            return max(left_size, right_size, result_size)
+        def at_leaf_node(node_id):
+            return {abs(lit) for lit in formula.clause(node_id - 1)}
+
+        def at_internal_node(children, projected_vars):
+            if contraction != "fold":
+                total_variables = set().union(*children)
+                products.append(set(total_variables))
+                return total_variables - set(projected_vars)
 
+            total_variables = set(children[0])
+            if len(children) == 1:
+                products.append(set(total_variables))
+            for variables in children[1:]:
+                total_variables |= variables
+                products.append(set(total_variables))
+            return total_variables - set(projected_vars)
+
+        self.visit(at_internal_node, at_leaf_node)
+        return products
+
+    def tensor_width(self, formula, contraction="greedy"):
+        """
+        Compute the width when tensors are used to execute this join tree with the
+        given contraction, i.e., the largest number of variables of a tensor (see
+        _get_products).
+        """
         highest_clause_length = max(len({abs(v) for v in c}) for c in formula.clauses)
-        highest_join_length = max(self._get_costs(formula, score_tensor_join))
+        highest_join_length = max(
+            (len(product) for product in self._get_products(formula, contraction)),
+            default=0,
+        )
         return max(highest_clause_length, highest_join_length)
 
-    def tensor_flops(self, formula):
-        def flops_tensor_join(left, right, projected_vars):
-            var_both = [var for var in left if var in right]
-            total_axes = (
-                len(left)
-                + len(right)
-                + sum(1 for var in var_both if var not in projected_vars)
-            )
-
-            log_num_sums = total_axes - 2 * len(var_both)
-            log_terms_in_sum = len(var_both)
-            if log_num_sums + log_terms_in_sum > 100:
-                return 2 ** 100  # Cap
-            else:
-                return 2 ** (log_num_sums + log_terms_in_sum)
-
-        return sum(self._get_costs(formula, flops_tensor_join))
+    def tensor_flops(self, formula, contraction="greedy"):
+        """
+        Estimate the number of operations when tensors are used to execute this join
+        tree with the given contraction, i.e., the number of entries of every product
+        (see _get_products).
+        """
+        # Capped so that the estimate remains a reasonable number
+        return sum(
+            2 ** min(len(product), 100)
+            for product in self._get_products(formula, contraction)
+        )
 
     @staticmethod
     def parse_jt(file, log=lambda _: None):
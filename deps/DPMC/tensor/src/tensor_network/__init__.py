@@ -1,5 +1,5 @@
 # from tensor_network.tensor_network import TensorNetwork
-from tensor_network.tensor import Tensor
+from tensor_network.tensor import ClauseTensor, Tensor
 from tensor_network.tensor_apis import ALL_APIS
 
 # from tensor_network.tensor_network_constructions import ALL_CONSTRUCTIONS
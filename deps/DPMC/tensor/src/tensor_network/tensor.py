@@ -1,90 +1,249 @@
+# Planning the optimal contraction order takes time exponential in the number of
+# tensors, so larger contractions are planned greedily
+MAX_OPTIMAL_TENSORS = 6
+
+# If a node has only clause tensors and at most this many of their variables are
+# projected out, the clauses are absorbed into a tensor of ones over all of their
+# variables (which is then at most 2^MAX_SEED_PROJECTED times larger than the result)
+MAX_SEED_PROJECTED = 3
+
+
 class Tensor:
-    def __init__(self, base, variables):
+    def __init__(self, base, variables, scale=0):
         self.base = base
         self.variables = variables
+        # The entries of the tensor are those of base multiplied by 2^scale (see
+        # NumpyAPI.normalise), so that they do not underflow
+        self.scale = scale
+
+    @property
+    def variables(self):
+        return self._variables
 
-    def duplicate_variable(self, tensor_library, var_index):
+    @variables.setter
+    def variables(self, variables):
+        self._variables = variables
+        # The index of each variable, so that finding an index takes constant time
+        self.positions = {var: i for i, var in enumerate(variables)}
+
+    def join_with(self, tensor_library, other, projected_weights):
         """
-        Duplicate the provided variable in the tensor.
+        Take the product of this tensor with the provided tensor,
+        then project out all specified variables.
+
+        The product is a single einsum in which the variables that appear in both
+        tensors (but are not projected out) are kept as output indices, so no
+        duplicated (diagonal) indices are materialised. The projected variables are
+        summed within the same einsum, together with their weights.
+
+        The result is stored in this tensor (and normalised if tensors are scaled).
 
-        Note that the duplicated variable is inserted as the first index,
-        so all variables shift forwards by 1.
-        
         :param tensor_library: The underlying tensor library
-        :param var_index: The index of the variable to duplicate
-        :return: The location of the new variable (0)
+        :param other: The tensor to multiply by
+        :param projected_weights: The variables to project out, mapped to their weights
+        :return: None
         """
-        if len(self.variables) == 30:
+        projected_weights, scale = Tensor.normalise_weights(
+            tensor_library, projected_weights
+        )
+        self.scale += other.scale + scale
+
+        # einsum requires small integer labels for indices
+        variables = list(dict.fromkeys(self.variables + other.variables))
+        labels = {var: i for i, var in enumerate(variables)}
+        summed = [var for var in variables if var in projected_weights]
+        result_variables = [var for var in variables if var not in projected_weights]
+        if len(result_variables) > 30:
             raise RuntimeError("Requires tensor rank above 30")
 
-        self.base = tensor_library.stack([self.base, self.base], axis=0)
-        self.variables.insert(0, self.variables[var_index])
+        operands = [
+            self.base,
+            [labels[var] for var in self.variables],
+            other.base,
+            [labels[var] for var in other.variables],
+        ]
+        for var in summed:
+            operands += [projected_weights[var], [labels[var]]]
+            del projected_weights[var]  # Projection will be done by einsum
+        self.base = tensor_library.einsum(
+            *operands, [labels[var] for var in result_variables]
+        )
+        self.variables = result_variables
+        self.normalise(tensor_library)
 
-        lookup = [slice(0, 2) for _ in self.base.shape]
-        lookup[0] = 0
-        lookup[var_index + 1] = 1
-        self.base[tuple(lookup)] = 0
+        # Project remaining variables (that appear in neither tensor)
+        self.project_out(tensor_library, projected_weights)
 
-        lookup[0] = 1
-        lookup[var_index + 1] = 0
-        self.base[tuple(lookup)] = 0
+    @staticmethod
+    def contract(tensor_library, tensors, projected_weights, optimize="greedy"):
+        """
+        Take the product of all provided tensors, then project out all specified
+        variables.
 
-        return 0
+        This is a single einsum over all tensors and the weights of the projected
+        variables, so the order of pairwise contractions is chosen by the planner
+        of the tensor library (e.g., greedily by the sizes of intermediate
+        tensors) instead of following the order of the tensors. Tensors with too
+        many variables for a single einsum are joined one at a time instead.
+        Clause tensors are multiplied into the other tensors first where possible
+        (see absorb_clauses).
 
-    def join_with(self, tensor_library, other, projected_weights):
+        :param tensor_library: The underlying tensor library
+        :param tensors: The (non-empty) list of tensors and clause tensors to multiply
+            (may be modified)
+        :param projected_weights: The variables to project out, mapped to their weights
+        :param optimize: The strategy used to plan the contraction
+        :return: The resulting tensor (normalised if tensors are scaled)
         """
-        Take the product of this tensor with the provided tensor,
-        then project out all specified variables.
+        tensors = Tensor.absorb_clauses(tensor_library, tensors, projected_weights)
+        variables = list(
+            dict.fromkeys(var for tensor in tensors for var in tensor.variables)
+        )
+        variables += [var for var in projected_weights if var not in variables]
+        if len(variables) > tensor_library.max_einsum_labels:
+            result = tensors[0]
+            if len(tensors) == 1:
+                result.project_out(tensor_library, projected_weights)
+                return result
+            # Every projected variable is summed out by the first join after which
+            # no other tensor contains it (or by the last join)
+            last = {
+                var: i for i, tensor in enumerate(tensors) for var in tensor.variables
+            }
+            for i, other in enumerate(tensors[1:], 1):
+                result.join_with(
+                    tensor_library,
+                    other,
+                    {
+                        var: weights
+                        for var, weights in projected_weights.items()
+                        if max(last.get(var, len(tensors) - 1), 1) == i
+                    },
+                )
+            return result
 
-        The result is stored in this tensor.
+        result_variables = [var for var in variables if var not in projected_weights]
+        if len(result_variables) > 30:
+            raise RuntimeError("Requires tensor rank above 30")
+
+        projected_weights, scale = Tensor.normalise_weights(
+            tensor_library, projected_weights
+        )
+        labels = {var: i for i, var in enumerate(variables)}
+        operands = []
+        for tensor in tensors:
+            operands += [tensor.base, [labels[var] for var in tensor.variables]]
+            scale += tensor.scale
+        for var, weights in projected_weights.items():
+            operands += [weights, [labels[var]]]
+        if optimize == "optimal" and len(operands) > 2 * MAX_OPTIMAL_TENSORS:
+            optimize = "greedy"
+        base = tensor_library.einsum(
+            *operands, [labels[var] for var in result_variables], optimize=optimize
+        )
+        result = Tensor(base, result_variables, scale)
+        result.normalise(tensor_library)
+        return result
+
+    @staticmethod
+    def absorb_clauses(tensor_library, tensors, projected=()):
+        """
+        Multiply clause tensors into the (dense) tensors that contain all of their
+        variables by zeroing the entries of their falsifying assignments in place.
+
+        Satisfied clauses are dropped, since they are all ones (see ClauseTensor).
+        If there are no dense tensors, either a tensor of ones over the variables of
+        all clauses (see MAX_SEED_PROJECTED) or the largest clause is materialised
+        first so that the clauses can be absorbed into it. Clauses that cannot be
+        absorbed are materialised.
 
         :param tensor_library: The underlying tensor library
-        :param other: The tensor to multiply by (may be modified during execution)
-        :param projected_weights: The variables to project out, mapped to their weights
-        :return: None
+        :param tensors: The list of tensors and clause tensors (may be modified)
+        :param projected: The variables that will be projected out of the product
+        :return: A non-empty list of (dense) tensors with the same product
         """
+        clauses = [
+            tensor
+            for tensor in tensors
+            if isinstance(tensor, ClauseTensor) and tensor.falsifying is not None
+        ]
+        tensors = [tensor for tensor in tensors if isinstance(tensor, Tensor)]
+        if len(tensors) == 0:
+            variables = list(
+                dict.fromkeys(var for clause in clauses for var in clause.variables)
+            )
+            if (
+                len(variables) <= 30
+                and len([var for var in variables if var in projected])
+                <= MAX_SEED_PROJECTED
+            ):
+                base = tensor_library.create_tensor([2 for _ in variables], 1)
+                tensors.append(Tensor(base, variables))
+            else:
+                clauses.sort(key=lambda clause: len(clause.variables))
+                tensors.append(clauses.pop().materialise(tensor_library))
 
-        # Duplicate the variables that appear in both (but are not projected out)
-        var_both = [var for var in self.variables if var in other.variables]
-        for var in reversed(var_both):
-            if var in projected_weights:
-                # Include the weights of the projected variables
-                var_index = self.variables.index(var)
-                lookup = [slice(0, 2) for _ in self.base.shape]
-                lookup[var_index] = 0
-                self.base[tuple(lookup)] *= projected_weights[var][0]
-                lookup[var_index] = 1
-                self.base[tuple(lookup)] *= projected_weights[var][1]
-
-                del projected_weights[var]  # Projection will be done by tensordot
-                continue  # no need to duplicate
-            elif len(self.variables) <= len(other.variables):
-                self.duplicate_variable(tensor_library, self.variables.index(var))
+        for clause in clauses:
+            for tensor in tensors:
+                if all(var in tensor.positions for var in clause.variables):
+                    tensor.zero_entry(clause.falsifying)
+                    break
             else:
-                other.duplicate_variable(tensor_library, other.variables.index(var))
+                tensors.append(clause.materialise(tensor_library))
+        return tensors
 
-        # Compute the resulting tensor
-        if len(self.base.shape) + len(other.base.shape) - 2 * len(var_both) > 30:
-            raise RuntimeError("Requires tensor rank above 30")
+    def zero_entry(self, values):
+        """
+        Set all entries with the provided values of variables to zero.
 
-        left_summed = [self.variables.index(var) for var in var_both]
-        right_summed = [other.variables.index(var) for var in var_both]
-        self.base = tensor_library.tensordot(
-            self.base, other.base, (left_summed, right_summed)
-        )
+        :param values: A map from some of the variables of the tensor to their values
+        :return: None
+        """
+        if not self.base.flags.writeable:
+            self.base = self.base.copy()
+        lookup = [slice(0, 2)] * len(self.variables)
+        for var, value in values.items():
+            lookup[self.positions[var]] = value
+        self.base[tuple(lookup)] = 0
 
-        # Determine the variables of the new tensor
-        self.variables = [
-            var for j, var in enumerate(self.variables) if j not in left_summed
-        ] + [var for j, var in enumerate(other.variables) if j not in right_summed]
+    def materialise(self, tensor_library):
+        return self
 
-        # Project remaining variables
-        self.project_out(tensor_library, projected_weights)
+    def normalise(self, tensor_library):
+        """
+        Move a power of two from the entries of the tensor into its scale (if
+        tensors are scaled, see NumpyAPI.normalise).
+
+        :param tensor_library: The underlying tensor library
+        :return: None
+        """
+        self.base, exponent = tensor_library.normalise(self.base)
+        self.scale += exponent
+
+    @staticmethod
+    def normalise_weights(tensor_library, projected_weights):
+        """
+        Normalise the weights of all variables (if tensors are scaled).
+
+        :param tensor_library: The underlying tensor library
+        :param projected_weights: A map from variables to their weights
+        :return: A new map from variables to their normalised weights and the sum of
+            the exponents taken out of them
+        """
+        normalised = {}
+        scale = 0
+        for var, weights in projected_weights.items():
+            normalised[var], exponent = tensor_library.normalise(weights)
+            scale += exponent
+        return normalised, scale
 
     def project_out(self, tensor_library, projected_weights):
         """
         Project out the provided variables.
-        
+
+        All variables are weighted and summed out together by a single operation of
+        the tensor library. The result is normalised if tensors are scaled.
+
         :param tensor_library: The underlying tensor library
         :param projected_weights: The variables to project out, mapped to their weights
         :return: None
@@ -92,11 +251,46 @@ class Tensor:
         if len(projected_weights) == 0:
             return
 
-        for var in projected_weights:
-            self.base = tensor_library.tensordot(
-                self.base, projected_weights[var], ([self.variables.index(var), 0])
-            )
-            self.variables.remove(var)
+        projected_weights, scale = Tensor.normalise_weights(
+            tensor_library, projected_weights
+        )
+        self.scale += scale
+        # The tensor is constant in the variables that it does not contain (e.g.,
+        # after absorbing a satisfied clause), so projecting them out multiplies
+        # it by the sum of their weights
+        for var, weights in projected_weights.items():
+            if var not in self.positions:
+                self.base = tensor_library.multiply(
+                    self.base, weights[0] + weights[1]
+                )
+        axis_weights = {
+            self.positions[var]: weights
+            for var, weights in projected_weights.items()
+            if var in self.positions
+        }
+        if len(axis_weights) > 0:
+            self.base = tensor_library.weighted_sum(self.base, axis_weights)
+        self.variables = [
+            var for var in self.variables if var not in projected_weights
+        ]
+        self.normalise(tensor_library)
+
+    def slice_variables(self, values):
+        """
+        Restrict the tensor to the provided values of variables, removing their indices.
+
+        The new base is a view of the old one, so no entries are copied.
+
+        :param values: A map from variables to their values (0 or 1)
+        :return: None
+        """
+        if not any(var in values for var in self.variables):
+            return
+
+        lookup = tuple(values.get(var, slice(0, 2)) for var in self.variables)
+        # The ellipsis keeps the result a tensor even if all indices are removed
+        self.base = self.base[lookup + (Ellipsis,)]
+        self.variables = [var for var in self.variables if var not in values]
 
     @staticmethod
     def from_clause(tensor_library, clause):
@@ -116,6 +310,73 @@ class Tensor:
                 if var in clause and -var in clause:
                     return Tensor(base, variables)
 
-        base[tuple(1 if var in clause else 0 for var in variables)] = 0
+        # Index 1 is the positive value of a variable, so the only falsifying
+        # assignment has index 0 for positive literals and 1 for negative ones
+        base[tuple(0 if var in clause else 1 for var in variables)] = 0
 
         return Tensor(base, variables)
+
+
+class ClauseTensor:
+    """
+    The tensor of a clause, i.e., all ones except for a zero at the only falsifying
+    assignment, represented by its variables and that assignment instead of 2^k
+    entries. A satisfied (or trivial) clause has no falsifying assignment, so its
+    tensor is all ones. Clause tensors are multiplied into other tensors without
+    being materialised whenever possible (see Tensor.absorb_clauses).
+    """
+
+    def __init__(self, variables, falsifying):
+        self.variables = variables
+        self.falsifying = falsifying
+
+    def slice_variables(self, values):
+        """
+        Restrict the tensor to the provided values of variables, removing their indices.
+
+        :param values: A map from variables to their values (0 or 1)
+        :return: None
+        """
+        if not any(var in values for var in self.variables):
+            return
+
+        if self.falsifying is not None and any(
+            var in values and values[var] != value
+            for var, value in self.falsifying.items()
+        ):
+            self.falsifying = None  # The clause is satisfied
+        self.variables = [var for var in self.variables if var not in values]
+        if self.falsifying is not None:
+            self.falsifying = {var: self.falsifying[var] for var in self.variables}
+
+    def materialise(self, tensor_library):
+        """
+        Build the (dense) tensor of the clause.
+
+        :param tensor_library: The underlying tensor library
+        :return: The tensor
+        """
+        if len(self.variables) > 30:
+            raise RuntimeError("Requires tensor rank above 30")
+
+        base = tensor_library.create_tensor([2 for _ in self.variables], 1)
+        if self.falsifying is not None:
+            base[tuple(self.falsifying[var] for var in self.variables)] = 0
+        return Tensor(base, list(self.variables))
+
+    @staticmethod
+    def from_clause(clause):
+        # The variable of each tensor index (without repetitions)
+        variables = list({abs(lit) for lit in clause})
+
+        # If a variable and its negation appear in a clause, the clause is trivial
+        if len(variables) != len(clause):
+            for var in variables:
+                if var in clause and -var in clause:
+                    return ClauseTensor(variables, None)
+
+        # Index 1 is the positive value of a variable, so the only falsifying
+        # assignment has index 0 for positive literals and 1 for negative ones
+        return ClauseTensor(
+            variables, {var: 0 if var in clause else 1 for var in variables}
+        )
@@ -1,4 +1,17 @@
+import decimal
+import itertools
+import math
+import sys
+
+# The largest number of axes weighted at once by NumpyAPI.weighted_sum (the
+# weights of a group are a tensor with 2^MAX_WEIGHT_GROUP entries)
+MAX_WEIGHT_GROUP = 16
+
+
 class NumpyAPI:
+    # The number of distinct indices supported by einsum
+    max_einsum_labels = 52
+
     def __init__(self, entry_type, thread_limit=None):
         self._thread_limit = thread_limit
         if thread_limit is not None:
@@ -10,6 +23,8 @@ class NumpyAPI:
 
         self._numpy = numpy
         self._entry_type = self._get_numpy_type(entry_type)
+        # Whether every tensor keeps a power-of-two scale (see normalise)
+        self.scaled = entry_type == "scaled"
 
     def create_tensor(self, shape, default_value=None):
         if default_value is None:
@@ -17,8 +32,140 @@ class NumpyAPI:
         else:
             return self._numpy.full(shape, default_value, dtype=self._entry_type)
 
-    def stack(self, array, **kwargs):
-        return self._numpy.stack(array, **kwargs)
+    def einsum(self, *operands, optimize=True):
+        if any(
+            getattr(operand, "dtype", None) == object for operand in operands[0:-1:2]
+        ):
+            return self._einsum_objects(operands, optimize)
+        result = self._numpy.einsum(*operands, optimize=optimize)
+        return self._numpy.asarray(result)
+
+    def _einsum_objects(self, operands, optimize):
+        # numpy cannot execute a planned contraction of object arrays (whose
+        # intermediate scalars are Python objects), so the planned pairwise
+        # contractions are done one at a time
+        arrays = [self._numpy.asarray(array) for array in operands[0:-1:2]]
+        subscripts = [list(subscript) for subscript in operands[1:-1:2]]
+        output = list(operands[-1])
+        path = self._numpy.einsum_path(
+            *itertools.chain(*zip(arrays, subscripts)), output, optimize=optimize
+        )[0]
+        for contraction in path[1:]:
+            picked = [
+                (arrays.pop(i), subscripts.pop(i))
+                for i in sorted(contraction, reverse=True)
+            ]
+            remaining = set(output).union(*subscripts)
+            labels = list(
+                dict.fromkeys(
+                    label
+                    for _, subscript in picked
+                    for label in subscript
+                    if label in remaining
+                )
+            )
+            result = self._numpy.einsum(*itertools.chain(*picked), labels)
+            # A full contraction of object arrays returns a Python object
+            arrays.append(self._numpy.asarray(result, dtype=object))
+            subscripts.append(labels)
+        result = self._numpy.einsum(arrays[0], subscripts[0], output)
+        return self._numpy.asarray(result, dtype=object)
+
+    def multiply(self, a, factor):
+        result = a * factor
+        # Arithmetic on a 0-dimensional object array returns a Python object
+        return self._numpy.asarray(result, dtype=object if a.dtype == object else None)
+
+    def weighted_sum(self, a, weights):
+        """
+        Sum out the provided axes of a tensor, weighting their entries.
+
+        The weights are multiplied into the tensor in place (in groups of at most
+        MAX_WEIGHT_GROUP axes, broadcast over the other axes) unless this would
+        change its type. Consecutive summed axes are then merged into one (which
+        does not copy the tensor), and the merged axes are summed starting from the
+        outermost one, which numpy does much faster than a single reduction over
+        many scattered axes.
+
+        :param a: The tensor (may be modified)
+        :param weights: A map from axes to the weights of their two entries
+        :return: The resulting tensor
+        """
+        axes = sorted(weights)
+        shape = [2] * (a.ndim - len(axes))
+        for start in range(0, len(axes), MAX_WEIGHT_GROUP):
+            group = axes[start : start + MAX_WEIGHT_GROUP]
+            factor = self._numpy.ones([1] * a.ndim, dtype=a.dtype)
+            for axis in group:
+                weight_shape = [1] * a.ndim
+                weight_shape[axis] = 2
+                factor = factor * self._numpy.asarray(weights[axis]).reshape(
+                    weight_shape
+                )
+            if factor.dtype == a.dtype and a.flags.writeable:
+                a *= factor
+            else:
+                a = a * factor
+
+        runs = [
+            (summed, len(list(group)))
+            for summed, group in itertools.groupby(
+                axis in weights for axis in range(a.ndim)
+            )
+        ]
+        a = a.reshape([2 ** length for _, length in runs])
+        summed_axes = [i for i, (summed, _) in enumerate(runs) if summed]
+        dtype = a.dtype
+        for i, axis in enumerate(summed_axes):
+            # Summing all axes of an object array returns a Python object
+            a = self._numpy.asarray(a.sum(axis=axis - i), dtype=dtype)
+        return a.reshape(shape)
+
+    def normalise(self, a):
+        """
+        Divide a tensor (or a vector of weights) by a power of two so that its
+        largest absolute entry is in [0.5, 1) if tensors are scaled. Since the
+        scale is a power of two, this does not change the significands of the
+        entries, and the result of a computation can be far smaller (or larger)
+        than the smallest (or largest) float64.
+
+        :param a: The tensor (may be modified)
+        :return: The normalised tensor and the exponent of the power of two
+        """
+        if not self.scaled:
+            return a, 0
+        a = self._numpy.asarray(a, dtype=self._entry_type)
+        largest = float(self._numpy.max(self._numpy.abs(a))) if a.size > 0 else 0
+        if largest == 0 or not math.isfinite(largest):
+            return a, 0
+        _, exponent = math.frexp(largest)
+        if a.flags.writeable and a.flags.owndata:
+            self._numpy.ldexp(a, -exponent, out=a)
+        else:
+            a = self._numpy.asarray(self._numpy.ldexp(a, -exponent))
+        return a, exponent
+
+    def to_number(self, value, exponent):
+        """
+        Compute value * 2^exponent (for scaled tensors), as a float if it can be
+        represented as a normal float and as a decimal otherwise.
+
+        :param value: An entry of a normalised tensor
+        :param exponent: The scale of the tensor
+        :return: The number
+        """
+        if not self.scaled:
+            return value
+        try:
+            number = math.ldexp(float(value), exponent)
+            # Subnormal floats are not precise enough
+            if value == 0 or abs(number) >= sys.float_info.min:
+                return number
+        except OverflowError:
+            pass
+        with decimal.localcontext() as context:
+            context.prec = 17
+            return decimal.Decimal(float(value)) * decimal.Decimal(2) ** exponent
 
     def tensordot(self, a, b, axes):
         return self._numpy.tensordot(a, b, axes)
@@ -42,7 +189,8 @@ class NumpyAPI:
             "float16": self._numpy.float16,
             "uint": self._numpy.uint64,
             "int": self._numpy.int64,
-            "bigint": self._numpy.object,
+            "bigint": object,
+            "scaled": self._numpy.float64,
         }
 
         if entry_type in types:
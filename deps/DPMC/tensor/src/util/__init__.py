@@ -1,2 +1,3 @@
 from util.util import *
 from util.boolean_formula import Formula
+from util.binary_formula import BinaryFormula, is_binary_formula
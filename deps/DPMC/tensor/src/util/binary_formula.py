@@ -0,0 +1,91 @@
+import os
+import struct
+
+import numpy
+
+# Must match BINARY_HEADER and BINARY_MAGIC in tools/encode.py
+HEADER = struct.Struct("<4s4xqqqqq")
+MAGIC = b"WMC1"
+
+
+def is_binary_formula(filename):
+    """
+    Check whether the file is a binary WMC file (as written by encode.py --binary).
+    """
+    if not os.path.isfile(filename):
+        return False
+    with open(filename, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+class BinaryFormula:
+    """
+    A formula read from a binary WMC file, with the same interface as Formula.
+
+    The file is memory-mapped and its arrays are used in place, so loading takes the
+    same time regardless of the size of the formula. Only literal weights (i.e.,
+    weights without conditions) and constant factors (i.e., weights without literals,
+    whose product is the constant of the formula) are supported.
+    """
+
+    def __init__(self, filename):
+        data = numpy.memmap(filename, dtype=numpy.uint8, mode="r")
+        (
+            magic,
+            num_vars,
+            num_clauses,
+            num_clause_literals,
+            num_weights,
+            num_weight_literals,
+        ) = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a binary WMC file: %s" % filename)
+
+        position = HEADER.size
+
+        def section(dtype, count):
+            nonlocal position
+            array = numpy.frombuffer(data, dtype=dtype, count=count, offset=position)
+            position += array.nbytes
+            return array
+
+        self._clause_offsets = section("<i8", num_clauses + 1)
+        weight_offsets = section("<i8", num_weights + 1)
+        weight_values = section("<f8", 2 * num_weights).reshape(num_weights, 2)
+        self._clause_literals = section("<i4", num_clause_literals)
+        weight_literals = section("<i4", num_weight_literals)
+
+        lengths = numpy.diff(weight_offsets)
+        if numpy.any(lengths > 1):
+            raise ValueError("Only literal weights are supported")
+        self.constant = float(numpy.prod(weight_values[lengths == 0, 0]))
+        weight_values = weight_values[lengths == 1]
+        weight_offsets = weight_offsets[:-1][lengths == 1]
+
+        # Row v holds the weights of variable v when false and when true, where
+        # variables without weights have the same default as in Formula
+        self._weights = numpy.full((num_vars + 1, 2), 0.5)
+        literals = weight_literals[weight_offsets]
+        positive = literals > 0
+        self._weights[literals[positive]] = weight_values[positive][:, ::-1]
+        self._weights[-literals[~positive]] = weight_values[~positive]
+        self._weighted = numpy.zeros(num_vars + 1, dtype=bool)
+        self._weighted[numpy.abs(literals)] = True
+
+    def clause(self, clause_id):
+        start, end = self._clause_offsets[clause_id : clause_id + 2]
+        return self._clause_literals[start:end].tolist()
+
+    @property
+    def clauses(self):
+        return [self.clause(i) for i in range(len(self._clause_offsets) - 1)]
+
+    @property
+    def variables(self):
+        return numpy.flatnonzero(self._weighted).tolist()
+
+    def literal_weight(self, lit):
+        """
+        Returns the multiplicative weight of the provided DIMACS literal.
+        """
+        return self._weights[abs(lit)][1 if lit > 0 else 0]
@@ -5,6 +5,8 @@ class Formula:
     def __init__(self):
         self._variables = defaultdict(lambda: (0.5, 0.5))
         self._clauses = []
+        # A constant factor of the weighted model count
+        self.constant = 1
 
     def add_clause(self, literals):
         """
@@ -56,7 +58,9 @@ class Formula:
         that each indicate that the variable [var id] should have positive literal weight [prob]
         and negative literal weight 1-[prob].
 
-        If [prob] is -1, the variable is unweighted
+        If [prob] is -1, the variable is unweighted. Constant factors of the weighted
+        model count (a line w 0 [factor] or an odd number of MiniC2D weights) are
+        multiplied into the constant of the formula.
 
         :param file: A handler to the file to read
         :param include_missing_vars: If true, variables indicated by the DIMACS header are assigned a weight 1 1
@@ -66,18 +70,23 @@ class Formula:
 
         for line in file:
             if line.startswith("c weights"):  # MiniC2D weights
-                weights = line.split(" ")[2:]
+                weights = line.split()[2:]
                 for i in range(len(weights) // 2):
                     result.set_weight(
                         i + 1, float(weights[2 * i + 1]), float(weights[2 * i])
                     )
+                # An odd number of weights ends with a constant factor
+                if len(weights) % 2 == 1:
+                    result.constant *= float(weights[-1])
             elif len(line) == 0 or line[0] == "c":
                 continue
             elif line[0] == "p":
                 num_vars = int(line.split()[2])
             elif line[0] == "w":  # Cachet weights
                 args = line.split()
-                if float(args[2]) == -1:
+                if int(args[1]) == 0:  # A constant factor
+                    result.constant *= float(args[2])
+                elif float(args[2]) == -1:
                     result.set_weight(int(args[1]), 1, 1)
                 else:
                     prob = float(args[2])
@@ -12,4 +12,7 @@ module load phys/compilers/gcc/10.2.0
 module load cmake/3.5.2
 
 lscpu > cpuinfo.txt
-make -j 16
+# Runs the same make targets as 'make -j 16' would (for all directories of
+# tools/schedule.py rather than the 'all' target of the Makefile), but with a
+# memory limit for each instance instead of 32 GiB for all of them
+python tools/schedule.py -j 16 -M 512
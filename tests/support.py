@@ -0,0 +1,166 @@
+"""Paths and helpers shared by the tests. Run the tests from the root of the
+repository with 'make unit_test' (or 'python -m unittest discover tests')."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_DATA = os.path.join(ROOT, 'test_data')
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+
+import encode  # noqa: E402
+
+
+def test_networks():
+    """Returns the list of (name, network filename) pairs of the networks in
+    test_data (in the NET format if available, otherwise in the DNE format).
+    Every network comes with the files name.answer, name.inst, and
+    name.inst.answer (as in the test target of the Makefile)."""
+    networks = []
+    for filename in sorted(os.listdir(TEST_DATA)):
+        name, extension = os.path.splitext(filename)
+        if extension != '.inst':
+            continue
+        for extension in ['.net', '.dne']:
+            network = os.path.join(TEST_DATA, name + extension)
+            if os.path.exists(network):
+                networks.append((name, network))
+                break
+    return networks
+
+
+def read_answer(filename):
+    with open(filename) as answer_file:
+        return float(answer_file.read())
+
+
+def read_cnf(filename):
+    """Returns the number of variables, the clauses, and the weight lines (in
+    any format supported by encode.parse_weight_line) of a CNF file."""
+    num_variables = 0
+    clauses = []
+    weight_lines = []
+    with open(filename) as cnf_file:
+        for line in cnf_file:
+            if line.startswith('p'):
+                num_variables = int(line.split()[2])
+            elif line.startswith('c weights') or line.startswith('w'):
+                weight_lines.append(line)
+            elif line[0].isdigit() or line[0] == '-':
+                clauses.append(line)
+    return num_variables, clauses, weight_lines
+
+
+def factor(literals, value):
+    """A factor on the variables of the literals (in the order of their
+    first occurrence) that is equal to value(assignment) for every assignment
+    (a map from variables to booleans) of the variables."""
+    variables = list(dict.fromkeys(abs(l) for l in literals))
+    table = np.zeros([2] * len(variables))
+    for index in np.ndindex(*table.shape):
+        table[index] = value(dict(zip(variables, map(bool, index))))
+    return variables, table
+
+
+def weighted_model_count(num_variables, clauses, weight_lines):
+    """Computes the weighted model count of a small formula by variable
+    elimination. Variables without weights have both weights equal to
+    one."""
+    def satisfies(literals):
+        return lambda assignment: any(assignment[abs(l)] == (l > 0)
+                                      for l in literals)
+
+    def weight(literals, if_true, if_false):
+        def value(assignment):
+            if not all(assignment[abs(l)] == (l > 0) for l in literals[1:]):
+                return 1
+            if assignment[abs(literals[0])] == (literals[0] > 0):
+                return if_true
+            return if_false
+
+        return value
+
+    result = 1.0
+    factors = [
+        factor(literals, satisfies(literals))
+        for literals in ([int(l) for l in clause.split()[:-1]]
+                         for clause in clauses)
+    ]
+    for line in weight_lines:
+        for literals, if_true, if_false in encode.parse_weight_line(line):
+            if literals:
+                factors.append(
+                    factor(literals, weight(literals, if_true, if_false)))
+            else:
+                result *= if_true
+    used = set(v for variables, _ in factors for v in variables)
+    result *= 2**len(set(range(1, num_variables + 1)) - used)
+
+    while factors:
+        # Eliminate the variable with the smallest resulting factor
+        scopes = {}
+        for variables, _ in factors:
+            for variable in variables:
+                scopes.setdefault(variable, set()).update(variables)
+        variable = min(scopes, key=lambda v: len(scopes[v]))
+        joined = [f for f in factors if variable in f[0]]
+        factors = [f for f in factors if variable not in f[0]]
+        remaining = sorted(scopes[variable] - {variable})
+        labels = {v: i for i, v in enumerate(remaining + [variable])}
+        operands = []
+        for variables, table in joined:
+            operands += [table, [labels[v] for v in variables]]
+        table = np.einsum(*operands, list(range(len(remaining))))
+        if remaining:
+            factors.append((remaining, table))
+        else:
+            result *= float(table)
+    return result
+
+
+def count(filename, literals=()):
+    """The weighted model count of a CNF file (with the given literals added
+    as unit clauses)."""
+    num_variables, clauses, weight_lines = read_cnf(filename)
+    return weighted_model_count(
+        num_variables, clauses + ['{} 0'.format(l) for l in literals],
+        weight_lines)
+
+
+class EncodingTestCase(unittest.TestCase):
+    """Encodes copies of networks in a temporary directory."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def encode(self, network, *options, encoding='cw'):
+        """Encodes a copy of the network (unless it is already in the
+        temporary directory) with the given encoding (and options). Returns
+        the filename of the copy."""
+        copy = os.path.join(self.directory, os.path.basename(network))
+        if copy != network:
+            shutil.copyfile(network, copy)
+        encode.encode(
+            encode.parse_arguments([encoding, 'basic', copy] +
+                                   list(options)))
+        return copy
+
+    def assertAnswers(self, *options):
+        """Checks that cw with the given options computes the probabilities
+        in the answer files of all networks in test_data (with and without
+        evidence)."""
+        for name, network in test_networks():
+            answer = os.path.join(TEST_DATA, name + '.answer')
+            inst = os.path.join(TEST_DATA, name + '.inst')
+            for evidence, answer in [([], answer),
+                                     (['-e', inst], inst + '.answer')]:
+                with self.subTest(network=network, evidence=evidence):
+                    copy = self.encode(network, *(list(options) + evidence))
+                    self.assertAlmostEqual(count(copy + '.cnf'),
+                                           read_answer(answer),
+                                           delta=1e-5)
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import support
+
+import benchmark_parser
+import common
+
+
+class TestBayesianNetwork(unittest.TestCase):
+    def test_same_as_legacy_parser(self):
+        for name, _ in support.test_networks():
+            for extension in ['.net', '.dne']:
+                filename = os.path.join(support.TEST_DATA, name + extension)
+                if not os.path.exists(filename):
+                    continue
+                with self.subTest(filename=filename):
+                    self.assertEqual(
+                        benchmark_parser.current_parse(filename),
+                        benchmark_parser.legacy_parse(filename))
+
+    def test_slashes_and_percent_signs(self):
+        # A '/' starts a comment only in DNE (and only if followed by '/' or
+        # '*'), and a '%' only in NET
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name, text in [
+            ('binary.dne', ['node a {', 'node a {\n title = x/y; // a/b\n'
+                            ' comment = "50%"; /* c */ z = 1/2 % 3;']),
+            ('binary.net', ['node a\n{', 'node a\n{\n label = x/y; % a/b\n'])
+        ]:
+            filename = os.path.join(directory, name)
+            with open(os.path.join(support.TEST_DATA, name)) as original:
+                with open(filename, 'w') as copy:
+                    copy.write(original.read().replace(*text))
+            with self.subTest(filename=filename):
+                self.assertEqual(benchmark_parser.current_parse(filename),
+                                 benchmark_parser.legacy_parse(filename))
+        self.assertEqual(
+            list(common.parse_assignments('title = x/y; z = 1/2 % 3;',
+                                          'dne')),
+            [([], 'title', ['x/y']), ([], 'z', ['1/2', '%', '3'])])
+
+    def test_cpts(self):
+        for _, network in support.test_networks():
+            bn = common.BayesianNetwork(network)
+            for variable, cpt in bn.probabilities.items():
+                with self.subTest(network=network, variable=variable):
+                    self.assertEqual(cpt.dtype, np.float64)
+                    self.assertTrue(cpt.flags['C_CONTIGUOUS'])
+                    self.assertEqual(cpt.shape, bn.cpt_shape(variable))
+                    np.testing.assert_allclose(cpt.sum(axis=-1), 1,
+                                               atol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,428 @@
+import argparse
+import io
+import json
+import os
+import unittest
+
+import numpy as np
+
+import support
+
+import common
+import encode
+import encode_batch
+
+
+class TestCw(support.EncodingTestCase):
+    def test_answers(self):
+        self.assertAnswers()
+
+
+class TestBatch(support.EncodingTestCase):
+    def read(self, filename):
+        with open(filename) as f:
+            return f.read()
+
+    def test_independent_networks(self):
+        # Encoding a network must not depend on what was encoded before it by
+        # the same process
+        alarm = os.path.join(support.TEST_DATA, 'alarm.net')
+        first = self.read(self.encode(alarm) + '.cnf')
+        self.encode(os.path.join(support.TEST_DATA, 'general.net'), '-l', '3')
+        self.assertEqual(self.read(self.encode(alarm) + '.cnf'), first)
+
+    def test_literal_dicts(self):
+        general = common.BayesianNetwork(
+            os.path.join(support.TEST_DATA, 'general.net'))
+        binary = common.BayesianNetwork(
+            os.path.join(support.TEST_DATA, 'binary.net'))
+        general_dict = encode.LiteralDict(general)
+        binary_dict = encode.LiteralDict(binary)
+        self.assertEqual(len(general_dict), 3)
+        self.assertEqual(general_dict.get_literal('a', 'a3'), '3')
+        # A binary variable has one literal, which is true for 'true'
+        self.assertEqual(len(binary_dict), 2)
+        self.assertEqual(binary_dict.get_literal('b', 'true'), '2')
+        self.assertEqual(binary_dict.get_literal('b', 'false'), '-2')
+        self.assertNotIn(('b', 'true'), general_dict)
+        self.assertEqual(len(encode.LiteralDict()), 0)
+
+    def test_read_jobs(self):
+        jobs = io.StringIO('# A comment\n\ncw basic "a b.net" -e a.inst\n')
+        self.assertEqual(list(encode_batch.read_jobs(jobs)),
+                         [['cw', 'basic', 'a b.net', '-e', 'a.inst']])
+
+
+class TestAtMostOne(support.EncodingTestCase):
+    def test_answers(self):
+        for choices in ['ladder', 'commander', 'binary', 'pairwise,3:ladder']:
+            with self.subTest(choices=choices):
+                self.assertAnswers('-a', choices)
+
+    def test_exactly_one(self):
+        for encoding in encode.AT_MOST_ONE:
+            for n in range(1, 10):
+                with self.subTest(encoding=encoding, n=n):
+                    literal_dict = encode.LiteralDict()
+                    literals = [literal_dict.new_literal() for _ in range(n)]
+                    clauses = encode.exactly_one_constraint(
+                        literals, encoding, literal_dict)
+                    # Auxiliary variables must not change the model count
+                    self.assertEqual(
+                        support.weighted_model_count(len(literal_dict),
+                                                     clauses, []), n)
+                    if n > 1:
+                        self.assertEqual(
+                            support.weighted_model_count(
+                                len(literal_dict), clauses +
+                                ['{} 0'.format(l) for l in literals[-2:]],
+                                []), 0)
+
+    def test_parse(self):
+        self.assertEqual(encode.parse_at_most_one('8:ladder,pairwise'),
+                         [(0, 'pairwise'), (8, 'ladder')])
+        choices = encode.parse_at_most_one('pairwise,8:ladder,32:commander')
+        self.assertEqual(encode.select_at_most_one(choices, 3), 'pairwise')
+        self.assertEqual(encode.select_at_most_one(choices, 8), 'ladder')
+        self.assertEqual(encode.select_at_most_one(choices, 40), 'commander')
+
+
+class TestLogValues(support.EncodingTestCase):
+    def test_answers(self):
+        for min_values in ['3', '4']:
+            with self.subTest(min_values=min_values):
+                self.assertAnswers('-l', min_values)
+
+    def test_unused_codes(self):
+        for num_bits in range(1, 5):
+            for num_values in range(1, 2**num_bits + 1):
+                with self.subTest(num_bits=num_bits, num_values=num_values):
+                    bits = [str(i + 1) for i in range(num_bits)]
+                    clauses = encode.unused_codes_constraint(bits, num_values)
+                    for code in range(2**num_bits):
+                        pattern = encode.bit_pattern(bits, code)
+                        self.assertEqual(
+                            support.weighted_model_count(
+                                num_bits,
+                                clauses + [l + ' 0' for l in pattern], []),
+                            int(code < num_values))
+
+
+# P(c = c1) = 0.4 * 0.9 + 0.6 * (0.2 * 0.2 + 0.3 * 0.5 + 0.5 * 0.7) = 0.684,
+# and all rows of the CPT of c with a = a1 are equal
+COMPRESSIBLE_NET = """net
+{
+}
+node a
+{
+  states = ("a1" "a2" );
+}
+node b
+{
+  states = ("b1" "b2" "b3" );
+}
+node c
+{
+  states = ("c1" "c2" );
+}
+potential ( a )
+{
+  data = ( 0.4 0.6 );
+}
+potential ( b )
+{
+  data = ( 0.2 0.3 0.5 );
+}
+potential ( c | a b )
+{
+  data = ((( 0.9 0.1 ) ( 0.9 0.1 ) ( 0.9 0.1 ))
+          (( 0.2 0.8 ) ( 0.5 0.5 ) ( 0.7 0.3 )));
+}
+"""
+
+
+class TestCompress(support.EncodingTestCase):
+    def test_answers(self):
+        self.assertAnswers('-c')
+        self.assertAnswers('-c', '-l', '3')
+
+    def test_equal_rows(self):
+        network = os.path.join(self.directory, 'compressible.net')
+        with open(network, 'w') as network_file:
+            network_file.write(COMPRESSIBLE_NET)
+        sizes = []
+        for options in [[], ['-c']]:
+            self.encode(network, *options)
+            _, _, weight_lines = support.read_cnf(network + '.cnf')
+            sizes.append(sum(len(line.split()) for line in weight_lines))
+            self.assertAlmostEqual(support.count(network + '.cnf'), 0.684)
+        self.assertLess(sizes[1], sizes[0])
+
+
+# The parents of c are listed in the opposite order of the variables
+REVERSED_PARENTS_NET = COMPRESSIBLE_NET.replace('potential ( c | a b )',
+                                                'potential ( c | b a )')
+
+
+class TestUai(support.EncodingTestCase):
+    def test_bn2uai(self):
+        network = os.path.join(self.directory, 'reversed.net')
+        with open(network, 'w') as network_file:
+            network_file.write(REVERSED_PARENTS_NET)
+        bn = common.BayesianNetwork(network)
+        lines, variables = encode.bn2uai(bn)
+        index = {v: i for i, v in enumerate(variables)}
+        self.assertEqual(lines[:4], [
+            'BAYES', '3', ' '.join(str(len(bn.values[v])) for v in variables),
+            '3'
+        ])
+        self.assertEqual(
+            lines[4 + index['c']], '3 {} {} {}'.format(
+                *sorted([index['a'], index['b']]), index['c']))
+        # The CPT of c comes after the header, the structure, and the CPTs of
+        # the variables before it
+        position = 4 + len(variables)
+        for variable in variables[:index['c']]:
+            position += 1 + bn.probabilities[variable].size // len(
+                bn.values[variable])
+        self.assertEqual(lines[position], '12')
+        rows = [[float(p) for p in line.split()]
+                for line in lines[position + 1:position + 7]]
+        # The parents of c in the UAI format are ordered by their indices
+        order = sorted(['a', 'b'], key=index.get)
+        for a in range(2):
+            for b in range(3):
+                assignment = {'a': a, 'b': b}
+                row = (assignment[order[0]] * len(bn.values[order[1]]) +
+                       assignment[order[1]])
+                self.assertEqual(rows[row], list(bn.probabilities['c'][b, a]))
+
+    def test_moralisation(self):
+        network = os.path.join(self.directory, 'reversed.net')
+        with open(network, 'w') as network_file:
+            network_file.write(REVERSED_PARENTS_NET)
+        self.encode(network, encoding='moralisation')
+        with open(network + '.gr') as graph_file:
+            lines = graph_file.read().splitlines()
+        self.assertEqual(lines[0], 'p tw 3 3')
+        edges = [sorted(map(int, line.split())) for line in lines[1:]]
+        self.assertEqual(sorted(edges), [[1, 2], [1, 3], [2, 3]])
+
+
+class TestDeterministic(support.EncodingTestCase):
+    def test_answers(self):
+        self.assertAnswers('-d')
+        self.assertAnswers('-d', '-c', '-l', '3')
+
+    def test_deterministic_weights(self):
+        weights = ['w 1 2 0 1', 'w 1 -2 0.3 0.7', 'w 3 1 0']
+        clauses, remaining = encode.deterministic_weights(weights)
+        self.assertEqual(clauses, ['-2 -1 0', '3 0'])
+        self.assertEqual(remaining, ['w 1 -2 0.3 0.7'])
+        self.assertAlmostEqual(
+            support.weighted_model_count(3, clauses, remaining),
+            support.weighted_model_count(3, [], weights))
+
+    def test_propagate_units(self):
+        clauses = ['1 0', '-1 2 0', '2 3 0', '-2 -3 4 0']
+        weights = ['w 3 1 0.2 0.8', 'w 5 -2 0.5 0.5', 'w 5 2 0.3 0.7']
+        simplified, simplified_weights = encode.propagate_units(
+            clauses, weights)
+        self.assertEqual(simplified, ['-3 4 0', '1 0', '2 0'])
+        self.assertEqual(simplified_weights, ['w 3 0.2 0.8', 'w 5 0.3 0.7'])
+        self.assertAlmostEqual(
+            support.weighted_model_count(5, simplified, simplified_weights),
+            support.weighted_model_count(5, clauses, weights))
+
+    def test_propagate_conflict(self):
+        clauses = ['1 0', '-1 2 0', '-2 0']
+        self.assertEqual(encode.propagate_units(clauses, ['w 3 1 0.2 0.8']),
+                         (clauses, ['w 3 1 0.2 0.8']))
+
+
+class TestPrune(support.EncodingTestCase):
+    def test_answers(self):
+        self.assertAnswers('-p')
+
+    def test_prune(self):
+        network = os.path.join(self.directory, 'compressible.net')
+        with open(network, 'w') as network_file:
+            network_file.write(COMPRESSIBLE_NET)
+        bn = common.BayesianNetwork(network)
+        self.assertEqual(bn.prune({'a': 'a2'}), ['b', 'c'])
+        self.assertEqual(list(bn.values), ['a'])
+
+        bn = common.BayesianNetwork(network)
+        cpt = bn.probabilities['c']
+        self.assertEqual(bn.prune({'a': 'a2'}, ['c']), [])
+        self.assertEqual(bn.parents['c'], ['b'])
+        np.testing.assert_array_equal(bn.probabilities['c'], cpt[1])
+
+
+class TestQueries(support.EncodingTestCase):
+    def test_marginals(self):
+        for name, network in support.test_networks():
+            with self.subTest(network=network):
+                copy = self.encode(network, '-q', 'all')
+                bn = common.BayesianNetwork(network)
+                totals = {}
+                with open(copy + '.queries') as queries_file:
+                    for line in queries_file:
+                        variable, value, *literals = line.split()
+                        probability = support.count(copy + '.cnf', literals)
+                        totals[variable] = (totals.get(variable, 0) +
+                                            probability)
+                        if (variable, value) == bn.goal():
+                            self.assertAlmostEqual(
+                                probability,
+                                support.read_answer(
+                                    os.path.join(support.TEST_DATA,
+                                                 name + '.answer')),
+                                delta=1e-5)
+                self.assertEqual(set(totals), set(bn.values))
+                for total in totals.values():
+                    self.assertAlmostEqual(total, 1)
+
+
+class TestEvidenceBatch(support.EncodingTestCase):
+    def test_answers(self):
+        for name, network in support.test_networks():
+            inst = os.path.join(support.TEST_DATA, name + '.inst')
+            batch = os.path.join(self.directory, 'batch.jsonl')
+            with open(batch, 'w') as batch_file:
+                for record in [{
+                        'name': 'inst',
+                        'evidence': dict(common.parse_evidence(inst))
+                }, {
+                        'name': 'empty',
+                        'evidence': {}
+                }]:
+                    batch_file.write(json.dumps(record) + '\n')
+            answers = {'inst': support.read_answer(inst + '.answer'),
+                       'empty': 1}
+            for options in [[], ['-p']]:
+                with self.subTest(network=network, options=options):
+                    copy = self.encode(network, '-b', batch, *options)
+                    with open(copy + '.evidence') as evidence_file:
+                        lines = [line.split() for line in evidence_file]
+                    self.assertEqual([words[0] for words in lines],
+                                     ['inst', 'empty'])
+                    for evidence_name, *literals in lines:
+                        self.assertAlmostEqual(
+                            support.count(copy + '.cnf', literals),
+                            answers[evidence_name],
+                            delta=1e-5)
+
+
+class TestWriteCnfFile(support.EncodingTestCase):
+    def test_streaming(self):
+        args = argparse.Namespace(
+            network=os.path.join(self.directory, 'formula'), binary=False)
+        encode.write_cnf_file(args, 3, ['1 2 0', '-3 0'], ['w 1 0.5 0.5'])
+        # The clauses are read from the file that is being replaced
+        encode.write_cnf_file(args, 4,
+                              encode.read_clauses(args.network + '.cnf'),
+                              ['w 4 0.3 0.7'],
+                              encode.count_clauses(args.network + '.cnf'))
+        self.assertEqual(support.read_cnf(args.network + '.cnf'),
+                         (4, ['1 2 0\n', '-3 0\n'], ['w 4 0.3 0.7\n']))
+
+        with self.assertRaises(ValueError):
+            encode.write_cnf_file(args, 3, iter(['1 0']), [], 2)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['formula.cnf'])
+
+
+# A d02-like encoding (with weights in the MiniC2D format) of a network with
+# P(a1) = 0.3, P(b1 | a1) = 0.9, and P(b1 | a2) = 0.4, where 1-4 are the
+# indicators of a1, a2, b1, and b2, 5-10 are parameters, and 11 is a
+# parameter of a constant factor (as is the last weight)
+D02_CLAUSES = [
+    '1 2 0', '-1 -2 0', '3 4 0', '-3 -4 0', '-1 5 0', '-5 1 0', '-2 6 0',
+    '-6 2 0', '-1 -3 7 0', '-7 1 0', '-7 3 0', '-1 -4 8 0', '-8 1 0',
+    '-8 4 0', '-2 -3 9 0', '-9 2 0', '-9 3 0', '-2 -4 10 0', '-10 2 0',
+    '-10 4 0', '11 0'
+]
+D02_WEIGHTS = [
+    'c weights 1 1 1 1 1 1 1 1 0.3 1 0.7 1 0.9 1 0.1 1 0.4 1 0.6 1 0.5 1 2'
+]
+# The same network with one variable for a (true for a1) and indicators 2
+# and 3 of b1 and b2, where the parameters 4 and 5 of a make two consecutive
+# clauses that are merged
+BKLM16_CLAUSES = [
+    '-1 4 0', '1 5 0', '-4 1 0', '-5 -1 0', '2 3 0', '-2 -3 0', '-1 -2 6 0',
+    '-6 1 0', '-6 2 0', '-1 -3 7 0', '-7 1 0', '-7 3 0', '1 -2 8 0',
+    '-8 -1 0', '-8 2 0', '1 -3 9 0', '-9 -1 0', '-9 3 0'
+]
+BKLM16_WEIGHTS = ['c weights 1 1 1 1 1 1 0.3 1 0.7 1 0.9 1 0.1 1 0.4 1 0.6 1']
+
+
+class TestOptimiseForDpmc(support.EncodingTestCase):
+    def assertSameCount(self, num_variables, clauses, weights, literals,
+                        indicators=None):
+        """Checks that optimise_for_dpmc does not change the weighted model
+        count (with the given literals of indicators as unit clauses) and
+        that it removes all parameters. The indicators must come before all
+        parameters, so that they are not renumbered."""
+        expected = support.weighted_model_count(
+            num_variables, clauses + ['{} 0'.format(l) for l in literals],
+            weights)
+        num_indicators, lines, other_lines = encode.optimise_for_dpmc(
+            num_variables, iter(clauses), weights, indicators)
+        self.assertLess(num_indicators, num_variables)
+        # The constant factor is only known once all lines are read
+        lines = list(lines)
+        new_clauses = [l for l in lines if not l.startswith('w')]
+        new_weights = [l for l in lines if l.startswith('w')] + other_lines
+        self.assertAlmostEqual(
+            support.weighted_model_count(
+                num_indicators,
+                new_clauses + ['{} 0'.format(l) for l in literals],
+                new_weights), expected)
+        return expected
+
+    def test_d02(self):
+        self.assertAlmostEqual(
+            self.assertSameCount(11, D02_CLAUSES, D02_WEIGHTS, []), 1)
+        self.assertAlmostEqual(
+            self.assertSameCount(11, D02_CLAUSES, D02_WEIGHTS, [3]), 0.55)
+        self.assertAlmostEqual(
+            self.assertSameCount(11, D02_CLAUSES, D02_WEIGHTS, [2, 3],
+                                 {1, 2, 3, 4}), 0.28)
+
+    def test_merged_weights(self):
+        self.assertAlmostEqual(
+            self.assertSameCount(9, BKLM16_CLAUSES, BKLM16_WEIGHTS, [2]),
+            0.55)
+        _, lines, _ = encode.optimise_for_dpmc(9, BKLM16_CLAUSES,
+                                               BKLM16_WEIGHTS)
+        self.assertIn('w 1 0.3 0.7', lines)
+
+    def test_constant_factor(self):
+        weights = [D02_WEIGHTS[0].replace('0.5 1 2', '0.123456789 1 2')]
+        _, lines, other_lines = encode.optimise_for_dpmc(
+            11, D02_CLAUSES, weights)
+        list(lines)
+        self.assertEqual(other_lines, ['w 0 0.246913578'])
+
+    def test_write(self):
+        """Checks that the lines are counted for the header when they are
+        written to a CNF file."""
+        args = argparse.Namespace(network=os.path.join(self.directory, 'd02'),
+                                  binary=False)
+        num_variables, lines, other_lines = encode.optimise_for_dpmc(
+            11, iter(D02_CLAUSES), D02_WEIGHTS)
+        encode.write_cnf_file(args, num_variables, lines, other_lines)
+        num_variables, clauses, weights = support.read_cnf(args.network +
+                                                           '.cnf')
+        with open(args.network + '.cnf') as cnf_file:
+            header = cnf_file.readline().split()
+        self.assertEqual(int(header[3]),
+                         len(clauses) + len(weights) - len(other_lines))
+        self.assertAlmostEqual(
+            support.weighted_model_count(num_variables, clauses, weights), 1)
+        self.assertEqual(os.listdir(self.directory), ['d02.cnf'])
+
+
+if __name__ == '__main__':
+    unittest.main()
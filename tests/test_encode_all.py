@@ -0,0 +1,75 @@
+import os
+import signal
+import types
+import unittest
+
+import support
+
+import encode_all
+
+USAGE = types.SimpleNamespace(ru_utime=1.5,
+                              ru_stime=0.5,
+                              ru_maxrss=1024,
+                              ru_majflt=0,
+                              ru_minflt=10,
+                              ru_nvcsw=2,
+                              ru_nivcsw=3,
+                              ru_inblock=0,
+                              ru_oublock=8)
+
+
+class TestEncodeAll(support.EncodingTestCase):
+    def elapsed_line(self, elapsed):
+        for line in encode_all.format_usage('true', 0, elapsed,
+                                            USAGE).splitlines():
+            if line.startswith('\tElapsed'):
+                return line.split(': ')[1]
+
+    def test_elapsed(self):
+        self.assertEqual(self.elapsed_line(4), '0:04.00')
+        self.assertEqual(self.elapsed_line(59.996), '1:00.00')
+        self.assertEqual(self.elapsed_line(61.234), '1:01.23')
+        self.assertEqual(self.elapsed_line(3599.999), '1:00:00')
+        self.assertEqual(self.elapsed_line(3725.4), '1:02:05')
+
+    def test_status(self):
+        usage = encode_all.format_usage('true', signal.SIGKILL, 4, USAGE)
+        self.assertTrue(usage.startswith(
+            'Command terminated by signal {}'.format(signal.SIGKILL)))
+        self.assertIn('Exit status: 0', usage)
+        self.assertIn('Exit status: 1',
+                      encode_all.format_usage('false', 1 << 8, 4, USAGE))
+        self.assertIn('Percent of CPU this job got: 50%',
+                      encode_all.format_usage('true', 0, 4, USAGE))
+
+    def test_limits(self):
+        # As in the Makefile, the CPU time and memory are limited by default
+        args = encode_all.parse_arguments(['alarm.net'])
+        self.assertEqual(args.timeout, 1000)
+        self.assertEqual(args.memory, '32')
+        args = encode_all.parse_arguments(['alarm.net', '-t', '5', '-m', '2'])
+        self.assertEqual((args.timeout, args.memory), (5, '2'))
+
+    def test_working_copy(self):
+        network = os.path.join(self.directory, 'alarm.net')
+        with open(network, 'w') as network_file:
+            network_file.write('net\n{\n}\n')
+        for _ in range(2):  # An existing copy is replaced
+            copy = encode_all.working_copy(network, 'd02', 'basic')
+        self.assertEqual(copy, os.path.join(network + '.d02.basic',
+                                            'alarm.net'))
+        with open(copy) as copy_file:
+            self.assertEqual(copy_file.read(), 'net\n{\n}\n')
+
+    def test_log_filename(self):
+        self.assertEqual(encode_all.log_filename('r/alarm', 'd02', 'basic'),
+                         'r/alarm.d02.new_enc')
+        self.assertEqual(
+            encode_all.log_filename('r/alarm', 'cd05', 'optimised'),
+            'r/alarm.cd05pp.new_enc')
+        self.assertEqual(encode_all.log_filename('r/alarm', 'sbk05', 'legacy'),
+                         'r/alarm.sbk05.old_enc')
+
+
+if __name__ == '__main__':
+    unittest.main()
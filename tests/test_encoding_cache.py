@@ -0,0 +1,113 @@
+import contextlib
+import io
+import os
+import unittest
+
+import support
+
+import encode
+import encoding_cache
+
+
+class TestEncodingCache(support.EncodingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = os.path.join(self.directory, 'cache')
+        self.network = os.path.join(support.TEST_DATA, 'alarm.net')
+
+    def encode_with_cache(self, *options):
+        """Encodes the network with the cache and returns the contents of the
+        CNF file and whether it was restored from the cache."""
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            copy = self.encode(self.network, '--cache', self.cache, *options)
+        with open(copy + '.cnf') as cnf_file:
+            return cnf_file.read(), 'Restored' in output.getvalue()
+
+    def entries(self):
+        return [e for e in os.listdir(self.cache) if not e.startswith('.')]
+
+    def test_restore(self):
+        cnf, restored = self.encode_with_cache()
+        self.assertFalse(restored)
+        self.assertEqual(self.encode_with_cache(), (cnf, True))
+        self.assertEqual(len(self.entries()), 1)
+        _, restored = self.encode_with_cache('-c')
+        self.assertFalse(restored)
+        self.assertEqual(len(self.entries()), 2)
+
+    def test_link(self):
+        self.encode_with_cache()
+        cnf, restored = self.encode_with_cache('--link')
+        self.assertTrue(restored)
+        copy = os.path.join(self.directory, 'alarm.net.cnf')
+        self.assertGreater(os.stat(copy).st_nlink, 1)
+        # Encoding without the cache must not change the cached files
+        self.encode(self.network, '-c')
+        self.assertEqual(os.stat(copy).st_nlink, 1)
+        self.assertEqual(self.encode_with_cache('--link'), (cnf, True))
+
+    def test_evicted_during_restore(self):
+        self.encode_with_cache('-q', 'all')
+        key = self.entries()[0]
+        network = os.path.join(self.directory, 'other.net')
+        cache = encoding_cache.EncodingCache(self.cache)
+        place = cache._place
+
+        def place_and_evict(source, destination):
+            # Another process evicts the entry after the first file
+            place(source, destination)
+            cache.max_bytes = 0
+            cache.evict()
+
+        cache._place = place_and_evict
+        self.assertFalse(cache.restore(key, network))
+        self.assertEqual(encoding_cache.output_files(network), {})
+        self.assertFalse(cache.restore(key, network))
+
+    def test_evict(self):
+        cache = encoding_cache.EncodingCache(self.cache)
+        for key in ['old', 'new']:
+            network = os.path.join(self.directory, key + '.net')
+            with open(network + '.cnf', 'w') as cnf_file:
+                cnf_file.write('p cnf 0 0\n')
+            cache.store(key, network, [network + '.cnf'])
+            os.utime(os.path.join(self.cache, key),
+                     (1, 1) if key == 'old' else None)
+        cache.max_bytes = 10
+        cache.evict()
+        self.assertEqual(self.entries(), ['new'])
+
+    def test_key(self):
+        args = encode.parse_arguments(['cw', 'basic', self.network])
+        version = encoding_cache.source_version(encode.encoder_files('cw'))
+        key = encoding_cache.encoding_key(args, version)
+        for arguments in [['--cache', self.cache, '--link'],
+                          ['--cache-size', '1']]:
+            self.assertEqual(
+                encoding_cache.encoding_key(
+                    encode.parse_arguments(['cw', 'basic', self.network] +
+                                           arguments), version), key)
+        self.assertNotEqual(
+            encoding_cache.encoding_key(
+                encode.parse_arguments(['cw', 'basic', self.network, '-c']),
+                version), key)
+        self.assertNotEqual(encoding_cache.encoding_key(args, version + '1'),
+                            key)
+
+    def test_source_version(self):
+        source = os.path.join(self.directory, 'encoder.py')
+        missing = os.path.join(self.directory, 'missing')
+        with open(source, 'w') as source_file:
+            source_file.write('version = 1\n')
+        version = encoding_cache.source_version([source, missing])
+        self.assertEqual(encoding_cache.source_version([source, missing]),
+                         version)
+        with open(source, 'w') as source_file:
+            source_file.write('version = 2\n')
+        self.assertNotEqual(encoding_cache.source_version([source, missing]),
+                            version)
+
+
+if __name__ == '__main__':
+    unittest.main()
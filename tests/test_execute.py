@@ -0,0 +1,413 @@
+"""Tests of the tensor executor of DPMC (in deps/DPMC/tensor/src) on small
+random formulas, compared with brute-force weighted model counting."""
+
+import contextlib
+import decimal
+import fractions
+import io
+import itertools
+import os
+import random
+import sys
+import unittest
+
+import numpy as np
+
+import support
+
+import cnf2wmc
+import encode
+
+sys.path.insert(
+    0, os.path.join(support.ROOT, 'deps', 'DPMC', 'tensor', 'src'))
+
+import execute  # noqa: E402
+import join_tree  # noqa: E402
+import tensor_network  # noqa: E402
+import util  # noqa: E402
+
+NUM_FORMULAS = 50
+
+
+def random_formula(seed, num_variables=8, num_clauses=10):
+    """A random formula with clauses of two or three literals and random
+    weights."""
+    rng = random.Random(seed)
+    formula = util.Formula()
+    for _ in range(num_clauses):
+        variables = rng.sample(range(1, num_variables + 1), rng.randint(2, 3))
+        formula.add_clause([rng.choice([-1, 1]) * v for v in variables])
+    for variable in range(1, num_variables + 1):
+        formula.set_weight(variable, rng.random(), rng.random())
+    return formula
+
+
+def used_variables(formula):
+    return sorted(set(abs(l) for clause in formula.clauses for l in clause))
+
+
+def elimination_join_tree(formula):
+    """A join tree that eliminates the variables of the formula one at a time
+    (in decreasing order)."""
+    clauses = formula.clauses
+    variables = used_variables(formula)
+    root = len(clauses) + len(variables) + 1
+    tree = join_tree.JoinTree(len(clauses), root)
+    scopes = {i + 1: set(abs(l) for l in c) for i, c in enumerate(clauses)}
+    node_id = len(clauses)
+    for variable in reversed(variables):
+        children = [n for n, scope in scopes.items() if variable in scope]
+        node_id += 1
+        tree.add_node(node_id, children, [variable])
+        scopes[node_id] = set().union(*(scopes.pop(c)
+                                        for c in children)) - {variable}
+    tree.add_node(root, list(scopes), [])
+    return tree
+
+
+def brute_force(formula, evidence=()):
+    """The weighted model count of the formula (with the evidence literals as
+    unit clauses) over its used variables."""
+    variables = used_variables(formula)
+    clauses = formula.clauses + [[l] for l in evidence]
+    total = 0
+    for values in itertools.product([False, True], repeat=len(variables)):
+        assignment = dict(zip(variables, values))
+        if all(any(assignment[abs(l)] == (l > 0) for l in clause)
+               for clause in clauses):
+            weight = 1
+            for variable, value in assignment.items():
+                weight *= formula.literal_weight(
+                    variable if value else -variable)
+            total += weight
+    return total
+
+
+def formula_from_clauses(clauses):
+    formula = util.Formula()
+    for clause in clauses:
+        formula.add_clause(clause)
+    for variable in used_variables(formula):
+        formula.set_weight(variable, 0.25 + variable / 10, 0.5)
+    return formula
+
+
+def execute_formula(formula, evidence=(), entry_type='float64', **options):
+    tensor_library = tensor_network.ALL_APIS['numpy'](entry_type)
+    return execute.execute_join_tree(formula, elimination_join_tree(formula),
+                                     tensor_library, None, evidence, **options)
+
+
+class TestEvidence(unittest.TestCase):
+    def test_parse_evidence(self):
+        evidence = io.StringIO('first 1 -2\n\nsecond\n')
+        self.assertEqual(list(execute.parse_evidence(evidence)),
+                         [('first', [1, -2]), ('second', [])])
+
+    def test_random(self):
+        for seed in range(NUM_FORMULAS):
+            formula = random_formula(seed)
+            rng = random.Random(seed)
+            evidence = [
+                rng.choice([-1, 1]) * v
+                for v in rng.sample(used_variables(formula), 2)
+            ]
+            with self.subTest(seed=seed):
+                self.assertAlmostEqual(execute_formula(formula, evidence),
+                                       brute_force(formula, evidence))
+
+
+class TestBinaryFormula(support.EncodingTestCase):
+    def convert(self, lines):
+        """Writes the lines to a CNF file and converts it to the binary format.
+        Returns the formulas read from both files."""
+        cnf = os.path.join(self.directory, 'formula.cnf')
+        wmc = os.path.join(self.directory, 'formula.wmc')
+        with open(cnf, 'w') as cnf_file:
+            cnf_file.write('\n'.join(lines) + '\n')
+        cnf2wmc.convert(cnf, wmc)
+        self.assertTrue(util.is_binary_formula(wmc))
+        self.assertFalse(util.is_binary_formula(cnf))
+        with open(cnf) as cnf_file:
+            return util.Formula.parse_DIMACS(cnf_file), util.BinaryFormula(wmc)
+
+    def assertSameFormula(self, formula, binary_formula):
+        self.assertEqual(binary_formula.clauses, formula.clauses)
+        self.assertEqual(binary_formula.variables, sorted(formula.variables))
+        for variable in range(1, 6):
+            for literal in [variable, -variable]:
+                self.assertEqual(binary_formula.literal_weight(literal),
+                                 formula.literal_weight(literal))
+        self.assertAlmostEqual(binary_formula.constant, formula.constant)
+
+    def test_cachet_weights(self):
+        formula, binary_formula = self.convert([
+            'p cnf 5 3', '1 -2 0', '2 3 -4 0', '-1 5 0', 'w 1 0.3', 'w 2 -1',
+            'w 4 0.8', 'w 0 0.5', 'w 0 0.25'
+        ])
+        self.assertSameFormula(formula, binary_formula)
+        self.assertAlmostEqual(binary_formula.constant, 0.125)
+        self.assertAlmostEqual(execute_formula(binary_formula),
+                               execute_formula(formula))
+
+    def test_minic2d_weights(self):
+        formula, binary_formula = self.convert([
+            'p cnf 5 2', '1 2 0', '-3 4 5 0',
+            'c weights 0.1 0.9 1 1 0.6 0.4 0.2 0.8 1 1 0.5'
+        ])
+        self.assertSameFormula(formula, binary_formula)
+        self.assertAlmostEqual(binary_formula.constant, 0.5)
+
+    def test_conditional_weights(self):
+        # Neither cw (that has conditional weights) can write binary files,
+        # nor can they be read
+        with self.assertRaises(SystemExit), \
+                contextlib.redirect_stderr(io.StringIO()):
+            encode.parse_arguments(['cw', 'basic', 'alarm.net', '--binary'])
+        wmc = os.path.join(self.directory, 'formula.wmc')
+        encode.write_binary_file(wmc, 3, ['1 2 0'], ['w 3 -1 2 0.4 0.6'])
+        with self.assertRaises(ValueError):
+            util.BinaryFormula(wmc)
+
+    def test_large_clauses(self):
+        # More clauses than are parsed at once
+        clauses = [
+            '{} -{} 0'.format(i % 5 + 1, (i + 1) % 5 + 1)
+            for i in range(encode.BINARY_CHUNK_SIZE + 3)
+        ]
+        formula, binary_formula = self.convert(['p cnf 5 {}'.format(
+            len(clauses))] + clauses)
+        self.assertSameFormula(formula, binary_formula)
+
+
+class TestJoin(unittest.TestCase):
+    def test_join_with(self):
+        tensor_library = tensor_network.ALL_APIS['numpy']('float64')
+        rng = np.random.RandomState(0)
+        a = rng.rand(2, 2, 2)
+        b = rng.rand(2, 2, 2)
+        # Variable 5 is in neither tensor
+        weights = {1: [0.3, 0.7], 4: [0.5, 2.0], 5: [0.1, 0.2]}
+        tensor = tensor_network.Tensor(a.copy(), [1, 2, 3])
+        tensor.join_with(tensor_library,
+                         tensor_network.Tensor(b, [3, 4, 1]), dict(weights))
+        self.assertEqual(tensor.variables, [2, 3])
+        for x2, x3 in itertools.product(range(2), repeat=2):
+            expected = sum(a[x1, x2, x3] * b[x3, x4, x1] * weights[1][x1] *
+                           weights[4][x4] * weights[5][x5]
+                           for x1, x4, x5 in itertools.product(range(2),
+                                                               repeat=3))
+            self.assertAlmostEqual(tensor.base[x2, x3], expected)
+
+    def test_fold(self):
+        for seed in range(NUM_FORMULAS):
+            formula = random_formula(seed)
+            with self.subTest(seed=seed):
+                self.assertAlmostEqual(
+                    execute_formula(formula, contraction='fold'),
+                    brute_force(formula))
+
+    def test_repeated_variables(self):
+        # A repeated literal and a clause with a variable and its negation
+        formula = formula_from_clauses([[1, 1, 2], [2, -2, 3], [-1, -3], [3]])
+        for contraction in ['fold', 'greedy']:
+            with self.subTest(contraction=contraction):
+                self.assertAlmostEqual(
+                    execute_formula(formula, contraction=contraction),
+                    brute_force(formula))
+
+    def test_tensor_width(self):
+        formula = formula_from_clauses([[1, 2], [-2, 3], [3, -4], [4, 4, 1]])
+        tree = elimination_join_tree(formula)
+        for contraction in ['fold', 'greedy']:
+            with self.subTest(contraction=contraction):
+                # Eliminating 4 multiplies the clauses with 1, 3, and 4
+                self.assertEqual(tree.tensor_width(formula, contraction), 3)
+
+
+class TestContract(unittest.TestCase):
+    def test_random(self):
+        for contraction in ['greedy', 'optimal']:
+            for seed in range(NUM_FORMULAS):
+                formula = random_formula(seed)
+                with self.subTest(contraction=contraction, seed=seed):
+                    self.assertAlmostEqual(
+                        execute_formula(formula, contraction=contraction),
+                        brute_force(formula))
+
+    def test_many_tensors(self):
+        # More tensors than are planned optimally, and more variables than
+        # einsum supports (so that the tensors are joined one at a time)
+        tensor_library = tensor_network.ALL_APIS['numpy']('float64')
+        for num_tensors in [8, 60]:
+            for optimize in ['greedy', 'optimal']:
+                with self.subTest(num_tensors=num_tensors, optimize=optimize):
+                    # A chain of tensors, where variable 0 is never projected
+                    # out, and variable v + 1 is only in the v-th tensor
+                    tensors = [
+                        tensor_network.Tensor(np.array([[1.0, 2.0],
+                                                        [3.0, 4.0]]),
+                                              [v, v + 1])
+                        for v in range(num_tensors)
+                    ]
+                    weights = {
+                        v: [0.5, 0.25]
+                        for v in range(1, num_tensors + 2)
+                    }
+                    result = tensor_network.Tensor.contract(
+                        tensor_library, tensors, weights, optimize)
+                    self.assertEqual(result.variables, [0])
+                    expected = np.array([1.0, 1.0])
+                    for _ in range(num_tensors):
+                        expected = (np.array([[1.0, 2.0], [3.0, 4.0]]) @
+                                    np.diag([0.5, 0.25]) @ expected)
+                    # Variable num_tensors + 1 is in no tensor
+                    np.testing.assert_allclose(result.base, 0.75 * expected)
+
+
+class TestProjectOut(unittest.TestCase):
+    def test_many_variables(self):
+        # More projected variables than are weighted at once
+        tensor_library = tensor_network.ALL_APIS['numpy']('float64')
+        rng = np.random.RandomState(0)
+        base = rng.rand(*[2] * 18)
+        variables = list(range(1, 19))
+        weights = {v: rng.rand(2) for v in range(1, 21) if v != 4}
+        tensor = tensor_network.Tensor(base.copy(), variables)
+        tensor.project_out(tensor_library, dict(weights))
+        self.assertEqual(tensor.variables, [4])
+        operands = [base, variables]
+        for v in range(1, 19):
+            if v != 4:
+                operands += [weights[v], [v]]
+        expected = (np.einsum(*operands, [4]) * sum(weights[19]) *
+                    sum(weights[20]))
+        np.testing.assert_allclose(tensor.base, expected)
+
+    def test_bigint(self):
+        tensor_library = tensor_network.ALL_APIS['numpy']('bigint')
+        base = tensor_library.create_tensor([2, 2, 2], 1)
+        base[1, 0, 1] = 2**70
+        tensor = tensor_network.Tensor(base, [1, 2, 3])
+        tensor.project_out(tensor_library, {1: [1, 3], 3: [2, 5]})
+        self.assertEqual(tensor.variables, [2])
+        self.assertEqual(tensor.base.tolist(),
+                         [2 + 5 + 3 * 2 + 3 * 5 * 2**70, 2 + 5 + 6 + 15])
+
+
+def random_clause(rng, num_variables=5):
+    """A random clause that may repeat a literal or contain a variable and its
+    negation."""
+    return [
+        rng.choice([-1, 1]) * rng.randint(1, num_variables)
+        for _ in range(rng.randint(1, 4))
+    ]
+
+
+def entry(tensor, assignment):
+    """The entry of a (dense) tensor at an assignment (a map from variables to
+    0 or 1)."""
+    return tensor.base[tuple(assignment[var] for var in tensor.variables)]
+
+
+class TestClauseTensor(unittest.TestCase):
+    def setUp(self):
+        self.tensor_library = tensor_network.ALL_APIS['numpy']('float64')
+
+    def test_materialise(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            clause = random_clause(rng)
+            values = {rng.randint(1, 5): rng.randint(0, 1)}
+            with self.subTest(clause=clause, values=values):
+                dense = tensor_network.Tensor.from_clause(
+                    self.tensor_library, clause)
+                tensor = tensor_network.ClauseTensor.from_clause(clause)
+                self.assertEqual(tensor.variables, dense.variables)
+                np.testing.assert_array_equal(
+                    tensor.materialise(self.tensor_library).base, dense.base)
+                dense.slice_variables(values)
+                tensor.slice_variables(values)
+                materialised = tensor.materialise(self.tensor_library)
+                self.assertEqual(materialised.variables, dense.variables)
+                np.testing.assert_array_equal(materialised.base, dense.base)
+
+    def test_absorb_clauses(self):
+        rng = random.Random(0)
+        for seed in range(100):
+            num_dense = seed % 3
+            tensors = [
+                tensor_network.ClauseTensor.from_clause(random_clause(rng))
+                for _ in range(rng.randint(1, 5))
+            ] + [
+                tensor_network.Tensor(np.random.RandomState(seed + i).rand(
+                    2, 2, 2), rng.sample(range(1, 6), 3))
+                for i in range(num_dense)
+            ]
+            # Copies, since clauses are absorbed by zeroing entries in place
+            dense = [
+                tensor_network.Tensor(
+                    t.materialise(self.tensor_library).base.copy(),
+                    list(t.variables)) for t in tensors
+            ]
+            # Projecting out many variables prevents the tensor of ones
+            projected = [1, 2, 3, 4] if seed % 2 else [1]
+            with self.subTest(seed=seed):
+                absorbed = tensor_network.Tensor.absorb_clauses(
+                    self.tensor_library, list(tensors), projected)
+                self.assertGreater(len(absorbed), 0)
+                for values in itertools.product(range(2), repeat=5):
+                    assignment = dict(zip(range(1, 6), values))
+                    self.assertAlmostEqual(
+                        np.prod([entry(t, assignment) for t in absorbed]),
+                        np.prod([entry(t, assignment) for t in dense]))
+
+
+class TestScaled(unittest.TestCase):
+    def test_random(self):
+        for contraction in ['fold', 'greedy', 'optimal']:
+            for seed in range(NUM_FORMULAS):
+                formula = random_formula(seed)
+                with self.subTest(contraction=contraction, seed=seed):
+                    self.assertAlmostEqual(
+                        execute_formula(formula,
+                                        entry_type='scaled',
+                                        contraction=contraction),
+                        brute_force(formula))
+
+    def test_underflow(self):
+        # A chain of clauses whose count is far below the smallest float64
+        num_variables = 400
+        formula = util.Formula()
+        for variable in range(1, num_variables):
+            formula.add_clause([variable, variable + 1])
+        for variable in range(1, num_variables + 1):
+            formula.set_weight(variable, 0.002, 0.001)
+        # The counts of the models where the last variable is false or true
+        negative = fractions.Fraction(formula.literal_weight(-1))
+        positive = fractions.Fraction(formula.literal_weight(1))
+        last = (negative, positive)
+        for _ in range(1, num_variables):
+            last = (last[1] * negative, sum(last) * positive)
+        exact = decimal.Decimal(sum(last).numerator) / sum(last).denominator
+
+        self.assertEqual(execute_formula(formula), 0)
+        for contraction in ['fold', 'greedy']:
+            with self.subTest(contraction=contraction):
+                count = execute_formula(formula,
+                                        entry_type='scaled',
+                                        contraction=contraction)
+                self.assertIsInstance(count, decimal.Decimal)
+                self.assertLess(abs(count - exact) / exact, 1e-9)
+
+    def test_to_number(self):
+        tensor_library = tensor_network.ALL_APIS['numpy']('scaled')
+        self.assertEqual(tensor_library.to_number(0.5, 3), 4.0)
+        self.assertEqual(tensor_library.to_number(0.0, -5000), 0)
+        # Numbers below the smallest float64 are decimals
+        number = tensor_library.to_number(0.5, -5000)
+        self.assertLess(abs(number / decimal.Decimal(2)**-5001 - 1), 1e-15)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+import support  # noqa: F401 (adds tools/ to the path)
+
+import parse_experimental_data
+
+ELAPSED = '\tElapsed (wall clock) time (h:mm:ss or m:ss): 1:01.50\n'
+
+
+class TestParseExperimentalData(unittest.TestCase):
+    def setUp(self):
+        # Results are read from the results/ directory of the current
+        # directory
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory)
+        os.makedirs('results/2004-pgm')
+        os.makedirs('data/2004-pgm')
+        self.write('results/2004-pgm/alarm-1.inst.d02.new_inf',
+                   'c Parsed join tree with ADD width 7\ns wmc 0.25\n' +
+                   ELAPSED + 's wmc 0.5\n')
+        self.write('results/2004-pgm/alarm-1.inst.d02.new_enc',
+                   's wmc 0.5\n' + ELAPSED)
+        self.write('results/tw_results.csv',
+                   'instance,treewidth\nresults/2004-pgm/alarm.net,4\n')
+
+    def write(self, filename, text):
+        with open(filename, 'w') as f:
+            f.write(text)
+
+    def test_parse(self):
+        self.assertEqual(
+            parse_experimental_data.parse(
+                'results/2004-pgm/alarm-1.inst.d02.new_inf'),
+            (61.5, '0.25', '7'))
+        # Encoding logs only have a running time
+        self.assertEqual(
+            parse_experimental_data.parse(
+                'results/2004-pgm/alarm-1.inst.d02.new_enc'),
+            (61.5, None, None))
+        self.assertEqual(
+            parse_experimental_data.parse(
+                'results/2004-pgm/alarm-1.inst.d02.old_inf'),
+            (None, None, None))
+
+    def test_main(self):
+        for _ in range(2):  # The second run uses the parsed results
+            parse_experimental_data.main()
+            with open('results/results.csv') as results_file:
+                [row] = list(csv.DictReader(results_file))
+            self.assertEqual(row['answer'], '0.25')
+            self.assertEqual(row['inference_time'], '61.5')
+            self.assertEqual(row['encoding_time'], '61.5')
+            self.assertEqual(row['treewidth'], '4')
+            self.assertEqual(row['encoding'], 'd02')
+            self.assertEqual(row['novelty'], 'new')
+        self.assertIn('results/2004-pgm/alarm-1.inst.d02.new_inf',
+                      parse_experimental_data.load_store())
+
+        # Modified results are parsed again
+        self.write('results/2004-pgm/alarm-1.inst.d02.new_inf',
+                   's wmc 0.75\n' + ELAPSED)
+        os.utime('results/2004-pgm/alarm-1.inst.d02.new_inf', ns=(0, 1))
+        parse_experimental_data.main()
+        with open('results/results.csv') as results_file:
+            [row] = list(csv.DictReader(results_file))
+        self.assertEqual(row['answer'], '0.75')
+
+
+if __name__ == '__main__':
+    unittest.main()
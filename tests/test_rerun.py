@@ -0,0 +1,82 @@
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+
+import support  # noqa: F401 (adds tools/ to the path)
+
+import encode_all
+import rerun
+import schedule
+
+
+class TestRerun(unittest.TestCase):
+    def setUp(self):
+        # As the scheduler, rerun works with the data/ and results/
+        # directories of the current directory
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory)
+        os.makedirs('data/2004-pgm')
+        os.makedirs('results/2004-pgm')
+        for filename in ['data/2004-pgm/alarm.net',
+                         'data/2004-pgm/alarm-1.inst']:
+            with open(filename, 'w') as f:
+                f.write('\n')
+        self.job = schedule.Job('data/2004-pgm/alarm-1.inst',
+                                'NET_WITH_EVIDENCE', 'data/2004-pgm/alarm.net')
+        self.args = argparse.Namespace(make='make',
+                                       timeout=rerun.TIMEOUT,
+                                       memory=rerun.MAX_MEMORY,
+                                       manifest='results/fingerprints.json')
+
+    def finish(self, triples):
+        """Records the triples as if they ran."""
+        runner = rerun.Runner(self.args)
+        for _, _, _, outputs, fingerprints in triples:
+            for output in outputs:
+                with open(output, 'w') as f:
+                    f.write('\n')
+            runner.manifest.update(outputs, fingerprints)
+
+    def test_command(self):
+        arguments, outputs = rerun.command('data/a.net', None, 'cd05',
+                                           'basic', 'results/a.net',
+                                           self.args)
+        self.assertEqual(arguments[:3],
+                         ['make', '-s', 'data/a.net/EXPERIMENT'])
+        self.assertNotIn('EVIDENCE=', ' '.join(arguments))
+        self.assertEqual(outputs, ['results/a.net.cd05.new_enc'])
+        arguments, outputs = rerun.command('data/a-1.inst.net',
+                                           'data/a-1.inst', 'sbk05', 'legacy',
+                                           'results/a-1.inst', self.args)
+        self.assertIn('EVIDENCE=data/a-1.inst', arguments)
+        self.assertEqual(outputs, [
+            'results/a-1.inst.sbk05.old_enc', 'results/a-1.inst.sbk05.old_inf'
+        ])
+
+    def test_stale_triples(self):
+        _, network, triples = rerun.Runner(self.args).stale_triples(self.job)
+        self.assertEqual(network, 'data/2004-pgm/alarm-1.inst.net')
+        self.assertEqual([(e, m) for e, m, _, _, _ in triples],
+                         encode_all.JOBS)
+        self.finish(triples)
+        _, _, triples = rerun.Runner(self.args).stale_triples(self.job)
+        self.assertEqual(triples, [])
+
+        # A changed input makes all triples stale, a missing output only its
+        # own triple
+        os.remove('results/2004-pgm/alarm-1.inst.d02.new_inf')
+        _, _, triples = rerun.Runner(self.args).stale_triples(self.job)
+        self.assertEqual([(e, m) for e, m, _, _, _ in triples],
+                         [('d02', 'basic')])
+        with open(self.job.instance, 'w') as f:
+            f.write('<instantiation/>\n')
+        _, _, triples = rerun.Runner(self.args).stale_triples(self.job)
+        self.assertEqual(len(triples), len(encode_all.JOBS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import support  # noqa: F401 (adds tools/ to the path)
+
+import schedule
+
+
+class TestSchedule(unittest.TestCase):
+    def setUp(self):
+        # The scheduler works with the data/ and results/ directories of the
+        # current directory
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory)
+        os.makedirs('data/2004-pgm')
+        os.makedirs('results/2004-pgm')
+        for filename in ['data/2004-pgm/alarm.net',
+                         'data/2004-pgm/alarm-1.inst']:
+            with open(filename, 'w') as f:
+                f.write('\n')
+        self.job = schedule.Job('data/2004-pgm/alarm-1.inst',
+                                'NET_WITH_EVIDENCE', 'data/2004-pgm/alarm.net')
+
+    def write_log(self, name, text):
+        with open('results/2004-pgm/alarm-1.inst.' + name, 'w') as log:
+            log.write(text)
+
+    def test_find_jobs(self):
+        [job] = schedule.find_jobs(['2004-pgm'])
+        self.assertEqual(job.name, self.job.name)
+        self.assertEqual(job.network, self.job.network)
+
+    def test_estimate_memory(self):
+        self.assertEqual(schedule.estimate_memory(self.job, {}, 1, 32), 32)
+        # The treewidth of the network is used if DPMC reported no width
+        treewidths = {self.job.network: 20}
+        self.assertEqual(
+            schedule.estimate_memory(self.job, treewidths, 1, 32), 32)
+        self.write_log('d02.new_inf', 'c Parsed join tree with ADD width 7\n'
+                       'c Parsed join tree with ADD width 12\n')
+        self.write_log('d02.new_enc', 'with ADD width 100\n')
+        self.assertEqual(schedule.reported_width(self.job), 12)
+        self.assertEqual(
+            schedule.estimate_memory(self.job, treewidths, 1, 32), 2)
+        self.assertEqual(
+            schedule.estimate_memory(self.job, treewidths, 4, 32), 4)
+
+    def test_out_of_memory(self):
+        self.write_log('d02.new_enc', 'Done\n')
+        self.assertFalse(schedule.out_of_memory(self.job))
+        self.write_log('cd05.new_inf', "terminate called after throwing an "
+                       "instance of 'std::bad_alloc'\n")
+        self.assertTrue(schedule.out_of_memory(self.job))
+
+    def test_next_job(self):
+        jobs = []
+        for memory in [16, 8, 2]:
+            job = schedule.Job('data/{}.net'.format(memory),
+                               'WITHOUT_EVIDENCE', None)
+            job.memory = memory
+            jobs.append(job)
+        self.assertIs(schedule.next_job(jobs, 10, 1), jobs[1])
+        self.assertIsNone(schedule.next_job(jobs, 1, 1))
+        self.assertIs(schedule.next_job(jobs, 1, 0), jobs[0])
+
+    def test_read_manifest(self):
+        with open('manifest.jsonl', 'w') as manifest:
+            manifest.write('{"job": "a/WITHOUT_EVIDENCE"}\n{"job": "b/W')
+        self.assertEqual(schedule.read_manifest('manifest.jsonl'),
+                         {'a/WITHOUT_EVIDENCE'})
+        self.assertEqual(schedule.read_manifest('missing.jsonl'), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""Compares the single-pass parser in common.BayesianNetwork with the previous
+regular-expression-based parser (that searched the remainder of the file once
+per node) in terms of both running time and the parsed structures, e.g.,
+
+python tools/benchmark_parser.py data/2004-pgm/*.net data/Grid/*/*.dne"""
+
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+
+import common
+
+NODE_RE = re.compile(r'\n+node (\w+)')
+POTENTIAL_RE = re.compile(r'\n+potential([^{]*){([^}]*)}')
+STATE_SPLITTER_RE = {'net': re.compile(r'"\s*"'), 'dne': re.compile(r',\s*')}
+STATES_RE = {
+    'dne': re.compile(r'states = \(([^()]*)\)'),
+    'net': re.compile(r'states = \(\s*"([^()]*)"\s*\)')
+}
+
+
+def legacy_parse(filename):
+    """The previous parser. Returns parents, values, and probabilities maps."""
+    parents, values, probabilities = {}, {}, {}
+    file_format = common.get_file_format(filename)
+    with open(filename, encoding=common.FILE_ENCODING) as f:
+        text = f.read()
+
+    for node in NODE_RE.finditer(text):
+        end_of_name = node.end()
+        name = node.group(1).lstrip().rstrip()
+        values[name] = STATE_SPLITTER_RE[file_format].split(
+            STATES_RE[file_format].search(text[end_of_name:]).group(1))
+        if file_format == 'dne':
+            parents_str = re.search(r'parents = \(([^()]*)\)',
+                                    text[end_of_name:]).group(1)
+            parents[name] = [
+                s.lstrip().rstrip() for s in parents_str.split(', ') if s != ''
+            ]
+            probs_str = re.search(r'probs = ([^;]*);',
+                                  text[end_of_name:]).group(1)
+            probabilities[name] = [
+                p for p in re.split(r'[, ()\n\t]+', probs_str) if p != ''
+            ]
+
+    if file_format == 'net':
+        for potential in POTENTIAL_RE.finditer(text):
+            header = re.findall(r'\w+', potential.group(1))
+            parents[header[0]] = header[1:]
+            probability_string = re.sub(r'%.*', '', potential.group(2))
+            probabilities[header[0]] = re.findall(r'\d+\.?\d*',
+                                                  probability_string)
+    return parents, values, probabilities
+
+
+def current_parse(filename):
+    """The current parser. Returns parents, values, and probabilities maps
+    (with probabilities as they appear in the file, as in legacy_parse)."""
+    bn = common.BayesianNetwork(filename, keep_strings=True)
+    return bn.parents, bn.values, bn.probability_strings
+
+
+def measure(parse, filename, repetitions):
+    """Returns the smallest running time (in seconds) out of all repetitions
+    and the parsed structures."""
+    best = None
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        structures = parse(filename)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, structures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the parser of Bayesian networks against the ' +
+        'previous implementation')
+    parser.add_argument('networks',
+                        metavar='network',
+                        nargs='+',
+                        help='Bayesian networks (in DNE/NET formats)')
+    parser.add_argument('-r',
+                        dest='repetitions',
+                        type=int,
+                        default=3,
+                        help='the number of times each file is parsed')
+    args = parser.parse_args()
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(
+        ['network', 'size', 'legacy_time', 'current_time', 'speedup', 'same'])
+    for filename in args.networks:
+        legacy_time, legacy = measure(legacy_parse, filename,
+                                      args.repetitions)
+        current_time, current = measure(current_parse, filename,
+                                        args.repetitions)
+        writer.writerow([
+            filename,
+            os.path.getsize(filename), '{:.6f}'.format(legacy_time),
+            '{:.6f}'.format(current_time), '{:.2f}'.format(
+                legacy_time / current_time), legacy == current
+        ])
+
+
+if __name__ == '__main__':
+    main()
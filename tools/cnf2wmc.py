@@ -0,0 +1,46 @@
+"""Converts WMC instances in the DIMACS CNF format (with weights in any of the
+formats supported by encode.py) to the binary format written by the --binary
+option of encode.py, e.g.,
+
+python tools/cnf2wmc.py data/2004-pgm/*.cnf
+
+writes data/2004-pgm/alarm.net.wmc for data/2004-pgm/alarm.net.cnf, etc."""
+
+import argparse
+import os
+
+import encode
+
+
+def convert(cnf_filename, wmc_filename):
+    """Converts a CNF file into a binary file. The file is read twice: first
+    for the header and the weights, and then to stream the clauses (which
+    write_binary_file parses in chunks), so the clauses are never all held
+    in memory as strings."""
+    num_variables = 0
+    weights = []
+    with open(cnf_filename) as cnf_file:
+        for line in cnf_file:
+            if line.startswith('p '):
+                num_variables = int(line.split()[2])
+            elif line.startswith('w') or line.startswith('c weights'):
+                weights.append(line)
+    encode.write_binary_file(wmc_filename, num_variables,
+                             encode.read_clauses(cnf_filename), weights)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert CNF files to the binary WMC format')
+    parser.add_argument('files',
+                        metavar='file',
+                        nargs='+',
+                        help='CNF files (each converted to a file with the ' +
+                        'same name but with .wmc instead of .cnf)')
+    args = parser.parse_args()
+    for cnf_filename in args.files:
+        convert(cnf_filename, os.path.splitext(cnf_filename)[0] + '.wmc')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,132 @@
 # A collection of functions and classes used in multiple Python scripts
 
+import glob
+import json
+import os
 import re
 import xml.etree.ElementTree as ET
 
+import numpy as np
+
 FILE_ENCODING = 'ISO-8859-1'
-NODE_RE = re.compile(r'\n+node (\w+)')
-POTENTIAL_RE = re.compile(r'\n+potential([^{]*){([^}]*)}')
-STATE_SPLITTER_RE = {'net': re.compile(r'"\s*"'), 'dne': re.compile(r',\s*')}
-STATES_RE = {
-    'dne': re.compile(r'states = \(([^()]*)\)'),
-    'net': re.compile(r'states = \(\s*"([^()]*)"\s*\)')
+# Commands for the planner and the executor of DPMC (for bash)
+LG = ('deps/DPMC/lg/build/lg "deps/DPMC/lg/solvers/htd-master/bin/htd_main ' +
+      '--opt width --iterations 1 --strategy challenge --print-progress ' +
+      '--preprocessing full"')
+DMC = 'deps/DPMC/DMC/dmc --pf=1e-3'
+COMMENT_RE = {'dne': r'//[^\n]*|/\*.*?\*/', 'net': r'%[^\n]*'}
+# The character that starts comments and a match of that character that does
+# not start a comment: a '/' starts a comment in DNE only if it is followed by
+# '/' or '*' (so, e.g., 'x/y' is a value), and a '%' always starts one in NET.
+# Any other character (e.g., '%' in DNE or '/' in NET) can be in a value.
+COMMENT_START = {'dne': '/', 'net': '%'}
+NOT_COMMENT_RE = {'dne': r'/(?![/*])', 'net': r'(?!)'}
+STRING_RE = r'"(?:[^"\\]|\\.)*"'
+# A name or a number (with runs of ordinary characters matched at once)
+WORD_RE = {
+    file_format: r'(?:[^\s{{}}()=;,|"{0}]|{1})[^\s{{}}()=;,|"{0}]*'
+    r'(?:{1}[^\s{{}}()=;,|"{0}]*)*'.format(COMMENT_START[file_format],
+                                          not_comment)
+    for file_format, not_comment in NOT_COMMENT_RE.items()
+}
+# Each match is a comment, a string (with quotes), or a word
+ATOM_RE = {
+    file_format: re.compile(
+        '{}|({})|({})'.format(comment, STRING_RE, WORD_RE[file_format]),
+        re.DOTALL)
+    for file_format, comment in COMMENT_RE.items()
+}
+# Each match is either a part of a value that has no braces and semicolons or
+# the header of a block (before '{')
+TEXT_RE = {
+    file_format: re.compile(
+        r'(?:[^{{}};="{}]+|{}|{}|{})*'.format(
+            COMMENT_START[file_format], NOT_COMMENT_RE[file_format],
+            STRING_RE, comment), re.DOTALL)
+    for file_format, comment in COMMENT_RE.items()
 }
+# Matches the beginning of the next statement (after whitespace and comments)
+STATEMENT_RE = {
+    file_format: re.compile(
+        r'(?:\s|{0})*(?:(?P<key>{1})(?:\s|{0})*=|(?P<close>}})|'
+        r'(?P<semicolon>;)|(?P<end>\Z)|(?P<header>))'.format(
+            comment, WORD_RE[file_format]), re.DOTALL)
+    for file_format, comment in COMMENT_RE.items()
+}
+
+
+def parse_atoms(text, start, end, file_format):
+    """Returns the list of words and strings (without quotes) in the given
+    range of the text, ignoring comments and punctuation."""
+    return [
+        string[1:-1] if string else word
+        for string, word in ATOM_RE[file_format].findall(text, start, end)
+        if string or word
+    ]
+
+
+def parse_assignments(text, file_format):
+    """Parses the text of a DNE or NET file in a single pass and yields a
+    (header, key, values) triple for every 'key = value;' statement. The header
+    consists of the words before the '{' of the innermost enclosing block
+    (e.g., ['node', 'a'] or ['potential', 'a', 'b']), and values is the
+    flattened list of words and strings of the value, with all punctuation
+    removed. The text is never copied: all regular expressions are matched
+    starting at the current position."""
+    headers = []
+    position = 0
+    while True:
+        statement = STATEMENT_RE[file_format].match(text, position)
+        position = statement.end()
+        kind = statement.lastgroup
+        if kind == 'end':
+            return
+        elif kind == 'key':
+            # The value ends with a semicolon (or a brace) outside of braces
+            start = position
+            depth = 0
+            while True:
+                position = TEXT_RE[file_format].match(text, position).end()
+                if position == len(text):
+                    raise ValueError('Unterminated value of {}'.format(
+                        statement.group(kind)))
+                delimiter = text[position]
+                position += 1
+                if delimiter == '{':
+                    depth += 1
+                elif depth > 0 and delimiter == '}':
+                    depth -= 1
+                elif depth == 0:
+                    break
+            yield (headers[-1] if headers else []), statement.group(
+                kind), parse_atoms(text, start, position - 1, file_format)
+            if delimiter == '}':
+                headers.pop()
+        elif kind == 'header':
+            end = TEXT_RE[file_format].match(text, position).end()
+            if end == len(text) or text[end] != '{':
+                raise ValueError(
+                    'Unexpected character at position {}'.format(position))
+            headers.append(parse_atoms(text, position, end, file_format))
+            position = end + 1
+        elif kind == 'close':
+            headers.pop()
 
 
 class BayesianNetwork:
-    parents = {}
-    values = {}
-    probabilities = {}
-    _last_variable = None
+    """A Bayesian network parsed from a DNE or NET file. Every instance has its
+    own parents, values, and probabilities maps (from variable names to lists
+    of parents, lists of values, and conditional probability tables,
+    respectively), so any number of networks can be parsed and encoded by the
+    same process.
+
+    The conditional probability table (CPT) of a variable is a contiguous
+    float64 array with one axis per parent (in the order of the parents) and
+    the last axis for the values of the variable itself. If keep_strings is
+    True, the probabilities are also kept as the (flat) lists of strings that
+    appear in the file in probability_strings."""
+    __slots__ = ('parents', 'values', 'probabilities', 'probability_strings',
+                 '_last_variable')
 
     def goal_value(self, variable):
         return ((self.values[variable].index('true'),
@@ -28,38 +137,127 @@ class BayesianNetwork:
         _, value = self.goal_value(self._last_variable)
         return (self._last_variable, value)
 
-    def __init__(self, filename):
+    def cpt_shape(self, variable):
+        """The shape of the CPT of the given variable."""
+        return tuple(
+            len(self.values[v])
+            for v in self.parents[variable] + [variable])
+
+    def __init__(self, filename, keep_strings=False):
+        self.parents = {}
+        self.values = {}
+        self.probabilities = {}
+        self.probability_strings = {} if keep_strings else None
+        self._last_variable = None
         file_format = get_file_format(filename)
         with open(filename, encoding=FILE_ENCODING) as f:
             text = f.read()
 
-        for node in NODE_RE.finditer(text):
-            end_of_name = node.end()
-            name = node.group(1).lstrip().rstrip()
-            self._last_variable = name
-            self.values[name] = STATE_SPLITTER_RE[file_format].split(
-                STATES_RE[file_format].search(text[end_of_name:]).group(1))
-            if file_format == 'dne':
-                parents_str = re.search(r'parents = \(([^()]*)\)',
-                                        text[end_of_name:]).group(1)
-                self.parents[name] = [
-                    s.lstrip().rstrip() for s in parents_str.split(', ')
-                    if s != ''
-                ]
-                probs_str = re.search(r'probs = ([^;]*);',
-                                      text[end_of_name:]).group(1)
-                self.probabilities[name] = [
-                    p for p in re.split(r'[, ()\n\t]+', probs_str) if p != ''
+        for header, key, values in parse_assignments(text, file_format):
+            if len(header) < 2:
+                continue
+            if header[0] == 'node':
+                name = header[1]
+                if key == 'states':
+                    self._last_variable = name
+                    self.values[name] = values
+                elif file_format == 'dne' and key == 'parents':
+                    self.parents[name] = values
+                elif file_format == 'dne' and key == 'probs':
+                    self._add_probabilities(name, values)
+            elif (file_format == 'net' and header[0] == 'potential'
+                  and key == 'data'):
+                self.parents[header[1]] = header[2:]
+                self._add_probabilities(header[1], values)
+
+        # Parents can be defined after their children, so the shapes of CPTs
+        # are known only at the end
+        for variable, probabilities in self.probabilities.items():
+            shape = self.cpt_shape(variable)
+            if probabilities.size != np.prod(shape, dtype=np.int64):
+                raise ValueError(
+                    'The CPT of {} has {} probabilities instead of {}'.format(
+                        variable, probabilities.size,
+                        np.prod(shape, dtype=np.int64)))
+            self.probabilities[variable] = probabilities.reshape(shape)
+
+    def prune(self, evidence, queries=()):
+        """Removes the parts of the network that do not affect the joint
+        probability of the evidence (a map from variables to their observed
+        values) and any values of the query variables. First, all barren nodes
+        (i.e., variables that are not ancestors of an evidence or query
+        variable) are removed. Then the CPTs of the children of evidence
+        variables are sliced at the observed values, removing the edges out of
+        evidence variables. Every remaining variable is then connected to an
+        evidence or query variable by a path that does not go through an
+        evidence variable, so no other part of the network is d-separated from
+        them. Returns the list of removed variables."""
+        relevant = set(evidence) | set(queries)
+        ancestors = set()
+        stack = list(relevant)
+        while stack:
+            variable = stack.pop()
+            if variable not in ancestors:
+                ancestors.add(variable)
+                stack += self.parents[variable]
+        removed = [v for v in self.values if v not in ancestors]
+        for variable in removed:
+            del self.parents[variable]
+            del self.values[variable]
+            del self.probabilities[variable]
+            if self.probability_strings is not None:
+                del self.probability_strings[variable]
+
+        for variable, parents in self.parents.items():
+            if all(parent not in evidence for parent in parents):
+                continue
+            index = tuple(
+                self.values[parent].index(evidence[parent]) if parent in
+                evidence else slice(None) for parent in parents)
+            self.probabilities[variable] = np.ascontiguousarray(
+                self.probabilities[variable][index])
+            self.parents[variable] = [p for p in parents if p not in evidence]
+            if self.probability_strings is not None:
+                self.probability_strings[variable] = [
+                    repr(p) for p in self.probabilities[variable].ravel()
                 ]
+        return removed
+
+    def write_net(self, filename):
+        """Writes the network to a file in the NET (Hugin) format."""
+        def table(probabilities):
+            if isinstance(probabilities[0], list):
+                return '(' + ' '.join(table(p) for p in probabilities) + ')'
+            return '(' + ' '.join(repr(p) for p in probabilities) + ')'
 
-        if file_format == 'net':
-            for potential in POTENTIAL_RE.finditer(text):
-                header = re.findall(r'\w+', potential.group(1))
-                self.parents[header[0]] = header[1:]
-                # Remove comments
-                probability_string = re.sub(r'%.*', '', potential.group(2))
-                self.probabilities[header[0]] = re.findall(
-                    r'\d+\.?\d*', probability_string)
+        lines = ['net', '{', '}']
+        for variable, values in self.values.items():
+            lines += [
+                'node {}'.format(variable), '{', '    states = ({});'.format(
+                    ' '.join('"{}"'.format(v) for v in values)), '}'
+            ]
+        for variable, parents in self.parents.items():
+            lines += [
+                'potential ({}{})'.format(
+                    variable, ' | ' + ' '.join(parents) if parents else ''),
+                '{', '    data = {};'.format(
+                    table(self.probabilities[variable].tolist())), '}'
+            ]
+        with open(filename, 'w', encoding=FILE_ENCODING) as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def _add_probabilities(self, variable, strings):
+        self.probabilities[variable] = np.array(strings, dtype=np.float64)
+        if self.probability_strings is not None:
+            self.probability_strings[variable] = strings
+
+
+def permute_parents(cpt, order):
+    """Reorders the rows of a CPT by permuting its parent axes: the i-th parent
+    of the returned CPT is the order[i]-th parent of the given CPT. The axis of
+    the variable itself remains the last one. Returns a view, i.e., no
+    probabilities are copied."""
+    return np.transpose(cpt, list(order) + [cpt.ndim - 1])
 
 
 def get_file_format(filename):
@@ -74,5 +272,24 @@ def parse_evidence(filename):
         yield (inst.attrib['id'], inst.attrib['value'])
 
 
+def parse_evidence_batch(path):
+    """Yields a (name, evidence) pair for every set of evidence in either a
+    directory of INST files (named after the files, in alphabetical order) or
+    a JSONL file, where evidence is a map from variables to their observed
+    values. Every line of a JSONL file is an object such as
+    {"name": "case1", "evidence": {"a": "true", "b": "false"}} (the name
+    defaults to the line number)."""
+    if os.path.isdir(path):
+        for filename in sorted(glob.glob(os.path.join(path, '*.inst'))):
+            yield os.path.basename(filename), dict(parse_evidence(filename))
+        return
+    with open(path) as jsonl_file:
+        for line_number, line in enumerate(jsonl_file, 1):
+            if line.strip():
+                record = json.loads(line)
+                yield (str(record.get('name', line_number)),
+                       record['evidence'])
+
+
 def empty_evidence(filename):
     return filename is None or ET.parse(filename).find('inst') is None
@@ -0,0 +1,117 @@
+"""Compares variants of an encoding (e.g., different at-most-one encodings of
+cw) on a collection of Bayesian networks. Every variant is a string of extra
+arguments for encode.py. For each network and variant, reports the numbers of
+variables, clauses, and weight lines of the encoding, the time taken to
+encode, and (optionally) the time and answer of DPMC, e.g.,
+
+python tools/compare_encodings.py data/2005-ijcai/*.net -v '' '-l 3' \\
+    '-a ladder' '-a commander' '-a binary' --dpmc
+
+(run from the root directory of the repository so that DPMC can be found)."""
+
+import argparse
+import csv
+import shlex
+import subprocess
+import sys
+import time
+
+import common
+import encode
+
+DPMC = common.DMC + ' --jf=- --jw={timeout} --cf={cnf} --wf {weight_format}'
+
+
+def count_lines(cnf_filename):
+    """Returns the numbers of variables, clauses, and weight lines in a CNF
+    file."""
+    num_weights = 0
+    with open(cnf_filename) as cnf_file:
+        for line in cnf_file:
+            if line.startswith('p cnf'):
+                _, _, num_variables, num_clauses = line.split()
+            elif line.startswith('w'):
+                num_weights += 1
+    return int(num_variables), int(num_clauses), num_weights
+
+
+def run_dpmc(cnf_filename, weight_format, timeout):
+    """Runs DPMC on the CNF file. Returns the time taken and the answer."""
+    command = '{} < {} | {}'.format(
+        common.LG, cnf_filename,
+        DPMC.format(timeout=timeout,
+                    cnf=cnf_filename,
+                    weight_format=weight_format))
+    start = time.perf_counter()
+    try:
+        process = subprocess.run(['bash', '-c', command],
+                                 stdout=subprocess.PIPE,
+                                 timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None, None
+    elapsed = time.perf_counter() - start
+    for line in process.stdout.decode('utf-8').splitlines():
+        if line.startswith('s wmc'):
+            return elapsed, line.split()[2]
+    return elapsed, None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare variants of an encoding on Bayesian networks')
+    parser.add_argument('networks',
+                        metavar='network',
+                        nargs='+',
+                        help='Bayesian networks (in DNE/NET formats)')
+    parser.add_argument('-e',
+                        dest='encoding',
+                        default='cw',
+                        help='the encoding (as in encode.py)')
+    parser.add_argument('-v',
+                        dest='variants',
+                        nargs='+',
+                        default=[''],
+                        help='extra arguments of encode.py for each variant')
+    parser.add_argument('--dpmc',
+                        action='store_true',
+                        help='also run DPMC on every encoding')
+    parser.add_argument('-w',
+                        dest='weight_format',
+                        type=int,
+                        default=5,
+                        help='the weight format of DPMC')
+    parser.add_argument('-t',
+                        dest='timeout',
+                        type=int,
+                        default=1000,
+                        help='the time limit for DPMC (in seconds)')
+    args = parser.parse_args()
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow([
+        'network', 'variant', 'variables', 'clauses', 'weights',
+        'encoding_time', 'inference_time', 'answer'
+    ])
+    for network in args.networks:
+        for variant in args.variants:
+            start = time.perf_counter()
+            encode.encode(
+                encode.parse_arguments([args.encoding, 'basic', network] +
+                                       shlex.split(variant)))
+            encoding_time = time.perf_counter() - start
+            inference_time, answer = None, None
+            if args.dpmc:
+                inference_time, answer = run_dpmc(network + '.cnf',
+                                                  args.weight_format,
+                                                  args.timeout)
+            writer.writerow([network, variant] +
+                            list(count_lines(network + '.cnf')) + [
+                                '{:.6f}'.format(encoding_time), None
+                                if inference_time is None else
+                                '{:.6f}'.format(inference_time), answer
+                            ])
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,15 +4,21 @@ support for memory limits, file formats, and to work around some bugs related
 to evidence encoding in Ace."""
 
 import argparse
+import bisect
 import csv
 import collections
 import itertools
+import os
 import re
 import resource
+import struct
 import subprocess
 from fractions import Fraction
 
+import numpy as np
+
 import common
+import encoding_cache
 
 EPSILON = 0.000001  # For comparing floating-point numbers
 SOFT_MEMORY_LIMIT = 0.95  # As a proportion of the hard memory limit
@@ -27,17 +33,39 @@ ACE_LEGACY = {
 }
 BN2CNF = ['deps/bn2cnf_linux', '-e', 'LOG', '-s', 'prime']
 C2D = ['deps/ace/c2d_linux']
-CNF4DPMC = ['tools/cnf4dpmc/cnf4dpmc', '-f']
+
+# The files that make up every encoder (the source code of the encoders) and
+# the external programs run by some of them. A change to any of these files
+# changes the encodings (see encoder_files).
+SOURCE_FILES = [
+    'tools/encode.py', 'tools/common.py', 'tools/encoding_cache.py'
+]
+EXTERNAL_ENCODER_FILES = {
+    'bklm16': ['deps/bn2cnf_linux', 'deps/ace/c2d_linux'],
+    'cd05': ['deps/ace'],
+    'cd06': ['deps/ace'],
+    'd02': ['deps/ace'],
+    'sbk05': ['deps/ace']
+}
+
+# The header of a binary WMC file: a magic number and the numbers of variables,
+# clauses, literals in clauses, weights, and literals in weights (see
+# write_binary_file)
+BINARY_HEADER = struct.Struct('<4s4xqqqqq')
+BINARY_MAGIC = b'WMC1'
+BINARY_CHUNK_SIZE = 100000  # The number of clauses parsed at once
 
 Goal = collections.namedtuple('Goal', ['variable', 'value', 'value_index'])
 
 
 class LiteralDict:
     """A bidirectional map between variables of a Bayesian network and literals
-    of a Boolean formula"""
-    _lit2var = {}
-    _var2lit = {}
-    next_lit = 1
+    of a Boolean formula. A variable can also be log-encoded, i.e., represented
+    by a list of bits (literals) instead of one literal per value, in which
+    case each value corresponds to a conjunction of literals (see
+    bit_pattern)."""
+    __slots__ = ('_lit2var', '_var2lit', '_var2bits', '_value2code',
+                 'next_lit')
 
     def add(self, variable, value, value2=None, literal=None):
         """Adds a variable-value pair to the collection. If no literal is
@@ -51,23 +79,63 @@ class LiteralDict:
             self._var2lit[(variable, value2)] = -literal
         self.next_lit = literal + 1
 
+    def add_log_encoded(self, variable, values):
+        """Adds a variable with the given list of values, represented by
+        ceil(log2(len(values))) new literals. The i-th value corresponds to the
+        binary representation of i."""
+        self._var2bits[variable] = [
+            self.new_literal()
+            for _ in range((len(values) - 1).bit_length())
+        ]
+        for code, value in enumerate(values):
+            self._value2code[(variable, value)] = code
+
+    def new_literal(self):
+        """Returns (as a string) a new literal that is not associated with any
+        variable-value pair, e.g., for an auxiliary variable of a
+        constraint."""
+        literal = self.next_lit
+        self.next_lit += 1
+        return str(literal)
+
     def get_literal(self, variable, value):
         """Get the literal associated with the variable-value pair
         (as a string)."""
         return str(self._var2lit[(variable, value)])
 
+    def get_literals(self, variable, value):
+        """Get the list of literals whose conjunction corresponds to the
+        variable-value pair (as strings). The list has one element unless the
+        variable is log-encoded."""
+        if variable in self._var2bits:
+            return bit_pattern(self._var2bits[variable],
+                               self._value2code[(variable, value)])
+        return [self.get_literal(variable, value)]
+
+    def get_bits(self, variable):
+        """Returns the list of literals that represent a log-encoded variable
+        (or None if the variable is not log-encoded)."""
+        return self._var2bits.get(variable)
+
     def __contains__(self, variable_and_value):
         """Checks if this variable-value pair associated with a literal"""
-        return variable_and_value in self._var2lit
+        return (variable_and_value in self._var2lit
+                or variable_and_value in self._value2code)
 
     def __len__(self):
         """Returns the number of elements in the collection."""
         return self.next_lit - 1
 
-    def __init__(self, bn=None):
+    def __init__(self, bn=None, log_values=None):
         """Given a Bayesian network, every binary variable is assigned one
-        literal, and every variable with n values is assigned n literals.
-        Otherwise, the collection is initialised as empty."""
+        literal, and every variable with n values is assigned n literals
+        (or ceil(log2(n)) literals if n is at least log_values). Otherwise, the
+        collection is initialised as empty."""
+        self._lit2var = {}
+        self._var2lit = {}
+        self._var2bits = {}
+        self._value2code = {}
+        self.next_lit = 1
         if bn is None:
             return
         for variable in bn.values:
@@ -77,74 +145,444 @@ class LiteralDict:
                 else:
                     self.add(variable, bn.values[variable][0],
                              bn.values[variable][1])
+            elif log_values is not None and len(
+                    bn.values[variable]) >= log_values:
+                self.add_log_encoded(variable, bn.values[variable])
             else:
                 for value in bn.values[variable]:
                     self.add(variable, value)
 
 
-def exactly_one_constraint(literals, encoding):
-    """Given a list of literals and encoding information, returns a list of
-    lines that implement the 'exactly one' constraint on the list of literals
-    (that can then be inserted into a CNF file)."""
-    return ['{} 0'.format(' '.join(literals))] + [
+def bit_pattern(bits, code):
+    """Returns the list of literals (one for each bit, the most significant bit
+    first) whose conjunction states that the bits represent the given
+    number."""
+    return [
+        ('' if (code >> (len(bits) - 1 - j)) & 1 else '-') + bit
+        for j, bit in enumerate(bits)
+    ]
+
+
+def unused_codes_constraint(bits, num_values):
+    """Returns a list of clauses that forbid the bits from representing any
+    number greater than or equal to num_values. The unused numbers are split
+    into aligned blocks of size 2^s, and each block is excluded by a single
+    clause on all but the s least significant bits."""
+    clauses = []
+    code = num_values
+    while code < 2**len(bits):
+        size = 0
+        while code % 2**(size + 1) == 0 and code + 2**(size + 1) <= 2**len(
+                bits):
+            size += 1
+        # The negation of the pattern of the block
+        prefix_length = len(bits) - size
+        clauses.append('{} 0'.format(' '.join(
+            bit_pattern(bits[:prefix_length],
+                        (code >> size) ^ (2**prefix_length - 1)))))
+        code += 2**size
+    return clauses
+
+
+def pairwise_at_most_one(literals, literal_dict):
+    """Forbids every pair of literals from being true at the same time, using
+    O(n^2) clauses and no auxiliary variables."""
+    return [
         '-{} -{} 0'.format(literals[i], literals[j])
         for i in range(len(literals)) for j in range(i + 1, len(literals))
     ]
 
 
-def bn2cnf(bn, literal_dict, encoding):
+def ladder_at_most_one(literals, literal_dict):
+    """The sequential counter (ladder) encoding with O(n) clauses and n - 1
+    auxiliary variables, where the i-th auxiliary variable is equivalent to the
+    disjunction of the first i literals (so that the auxiliary variables do
+    not change the model count)."""
+    clauses = []
+    previous = None
+    for literal in literals[:-1]:
+        current = literal_dict.new_literal()
+        clauses.append('-{} {} 0'.format(literal, current))
+        if previous is None:
+            clauses.append('-{} {} 0'.format(current, literal))
+        else:
+            clauses += [
+                '-{} {} 0'.format(previous, current),
+                '-{} -{} 0'.format(literal, previous),
+                '-{} {} {} 0'.format(current, previous, literal)
+            ]
+        previous = current
+    if previous is not None:
+        clauses.append('-{} -{} 0'.format(literals[-1], previous))
+    return clauses
+
+
+def commander_at_most_one(literals, literal_dict, group_size=3):
+    """The commander encoding: literals are split into groups of the given
+    size, each group gets a commander variable that is equivalent to the
+    disjunction of the group, pairwise at-most-one constraints are imposed
+    within each group, and the same encoding is applied recursively to the
+    commanders."""
+    if len(literals) <= group_size + 1:
+        return pairwise_at_most_one(literals, literal_dict)
+    clauses = []
+    commanders = []
+    for start in range(0, len(literals), group_size):
+        group = literals[start:start + group_size]
+        if len(group) == 1:
+            commanders.append(group[0])
+            continue
+        commander = literal_dict.new_literal()
+        clauses += pairwise_at_most_one(group, literal_dict)
+        clauses += ['-{} {} 0'.format(l, commander) for l in group]
+        clauses.append('-{} {} 0'.format(commander, ' '.join(group)))
+        commanders.append(commander)
+    return clauses + commander_at_most_one(commanders, literal_dict,
+                                           group_size)
+
+
+def binary_at_most_one(literals, literal_dict):
+    """The binary (bitwise) encoding with O(n log n) clauses and log n
+    auxiliary variables: each literal implies its index in binary. The
+    auxiliary variables are uniquely determined only if one of the literals is
+    true, so this encoding must be combined with an at-least-one clause."""
+    bits = [
+        literal_dict.new_literal()
+        for _ in range(max(len(literals) - 1, 0).bit_length())
+    ]
+    return [
+        '-{} {}{} 0'.format(literal, '' if (i >> j) & 1 else '-', bit)
+        for i, literal in enumerate(literals) for j, bit in enumerate(bits)
+    ]
+
+
+AT_MOST_ONE = {
+    'pairwise': pairwise_at_most_one,
+    'ladder': ladder_at_most_one,
+    'commander': commander_at_most_one,
+    'binary': binary_at_most_one
+}
+
+
+def parse_at_most_one(choices):
+    """Parses a comma-separated list of ENCODING or MIN_VALUES:ENCODING items
+    (e.g., 'pairwise,8:ladder') into a list of (MIN_VALUES, ENCODING) pairs
+    sorted by MIN_VALUES. An item without MIN_VALUES applies to all
+    variables."""
+    parsed = []
+    for item in choices.split(','):
+        min_values, _, encoding = item.rpartition(':')
+        if encoding not in AT_MOST_ONE:
+            raise argparse.ArgumentTypeError(
+                'unknown at-most-one encoding: {}'.format(encoding))
+        try:
+            parsed.append((int(min_values) if min_values else 0, encoding))
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                'invalid number of values: {}'.format(min_values))
+    return sorted(parsed)
+
+
+def select_at_most_one(choices, num_values):
+    """Selects the at-most-one encoding for a variable with the given number
+    of values out of the choices returned by parse_at_most_one."""
+    selected = 'pairwise'
+    for min_values, encoding in choices:
+        if num_values >= min_values:
+            selected = encoding
+    return selected
+
+
+def exactly_one_constraint(literals, encoding, literal_dict):
+    """Given a list of literals and the name of an at-most-one encoding,
+    returns a list of lines that implement the 'exactly one' constraint on the
+    list of literals (that can then be inserted into a CNF file). Auxiliary
+    variables (if any) are taken from the literal_dict."""
+    return (['{} 0'.format(' '.join(literals))] +
+            AT_MOST_ONE[encoding](literals, literal_dict))
+
+
+def limit_denominators(probabilities, as_strings=False):
+    """Rounds every probability in the given array to the closest fraction with
+    a denominator of at most one million (as Fraction.limit_denominator does).
+    Returns two arrays of the same shape: the rounded probabilities and their
+    complements (i.e., 1 - p, computed before the conversion to floats). If
+    as_strings is True, the arrays hold the string representations of the
+    floats instead. Each distinct probability is rounded only once."""
+    unique, inverse = np.unique(probabilities.ravel(), return_inverse=True)
+    # A probability with at most six decimal places is a fraction with a
+    # denominator of at most one million, and so is its complement
+    rounded = np.round(unique, 6)
+    complements = np.round(1 - unique, 6)
+    for i in np.flatnonzero(rounded != unique).tolist():
+        fraction = Fraction(repr(float(unique[i]))).limit_denominator()
+        rounded[i] = float(fraction)
+        complements[i] = float(1 - fraction)
+    if as_strings:
+        rounded = np.array([str(p) for p in rounded.tolist()], dtype=object)
+        complements = np.array([str(p) for p in complements.tolist()],
+                               dtype=object)
+    return (rounded[inverse].reshape(probabilities.shape),
+            complements[inverse].reshape(probabilities.shape))
+
+
+def parent_conditions(bn, literal_dict, variable):
+    """Returns an array of strings with an element for every row of the CPT of
+    the variable, where each element lists the literals that correspond to the
+    values of the parents in that row (each preceded by a space, with a
+    log-encoded parent contributing one literal per bit). Rows are
+    ordered as in the CPT (i.e., the value index of each parent is a digit of
+    the mixed-radix representation of the row number), so the array is built
+    one parent at a time as an outer 'product' of strings."""
+    conditions = np.array([''], dtype=object)
+    for parent in bn.parents[variable]:
+        literals = np.array([
+            ''.join(' ' + l
+                    for l in literal_dict.get_literals(parent, value))
+            for value in bn.values[parent]
+        ], dtype=object)
+        conditions = np.add.outer(conditions, literals).ravel()
+    return conditions
+
+
+def compress_rows(bn, literal_dict, variable, probabilities, complements):
+    """Collapses the rows of (a column of) the CPT of the variable that share
+    the same probability and complement, exploiting context-specific
+    independence. probabilities and complements are arrays of strings with an
+    axis for each parent (complements can also be a single string). The rows
+    are factored as a decision tree over the parents (in their order), where a
+    branch stops as soon as all of its rows are equal, and a parent is skipped
+    if none of the rows of the branch depend on it. Returns three arrays with
+    an element for each leaf of the tree: the literals of the parent values
+    on the path to the leaf (as in parent_conditions), the probability, and
+    the complement. If no rows can be collapsed, the result is the same as
+    with one element per row."""
+    parents = bn.parents[variable]
+    literals = [[
+        ''.join(' ' + l for l in literal_dict.get_literals(parent, value))
+        for value in bn.values[parent]
+    ] for parent in parents]
+    complements = np.broadcast_to(complements, probabilities.shape)
+    _, first, ids = np.unique(probabilities.ravel() + ' ' +
+                              complements.ravel(),
+                              return_index=True,
+                              return_inverse=True)
+    ids = ids.reshape(probabilities.shape)
+    leaves = []
+
+    def factor(ids, axes, conditions):
+        """Adds the leaves of the subtree with the given rows, where axes are
+        the indices of the parents that correspond to the axes of ids, and not
+        all rows are equal. Subtrees with all rows equal or only one parent
+        left are handled without recursion."""
+        relevant = [
+            a for a in range(ids.ndim)
+            if not (ids == ids.take([0], axis=a)).all()
+        ]
+        ids = ids[tuple(
+            slice(None) if a in relevant else 0 for a in range(ids.ndim))]
+        axes = [axes[a] for a in relevant]
+        rows = ids.reshape(ids.shape[0], -1)
+        constant = (rows == rows[:, :1]).all(axis=1).tolist()
+        for value, subtree in enumerate(ids):
+            subtree_conditions = conditions + literals[axes[0]][value]
+            if constant[value]:
+                leaves.append((subtree_conditions, subtree.flat[0]))
+            elif subtree.ndim == 1:
+                leaves.extend(
+                    (subtree_conditions + literal, i)
+                    for literal, i in zip(literals[axes[1]], subtree.tolist()))
+            else:
+                factor(subtree, axes[1:], subtree_conditions)
+
+    if (ids == ids.flat[0]).all():
+        leaves.append(('', ids.flat[0]))
+    else:
+        factor(ids, list(range(len(parents))), '')
+    conditions = np.array([c for c, _ in leaves], dtype=object)
+    rows = first[[i for _, i in leaves]]
+    return (conditions, probabilities.ravel()[rows],
+            complements.ravel()[rows])
+
+
+def bn2cnf(bn,
+           literal_dict,
+           at_most_one=((0, 'pairwise'), ),
+           compress=False):
     """Transforms a Bayesian network to a list of clauses. The
     return value is divided into two parts: regular clauses and weights.
+    at_most_one selects the at-most-one encoding for each variable with more
+    than two values (see parse_at_most_one) that is not log-encoded. If
+    compress is True, rows of CPTs with equal probabilities are collapsed into
+    weight clauses over only the relevant parents (see compress_rows).
     NOTE: This function has nothing to do with the external program with the
     same name."""
-    def construct_weights(variable, literal, probability_index,
-                          negate_probability):
-        clauses = []
-        for row in itertools.product(
-                *[bn.values[p] for p in bn.parents[variable]]):
-            conditions = [
-                literal_dict.get_literal(parent, parent_value)
-                for parent, parent_value in zip(bn.parents[variable], row)
-            ]
-            probability = Fraction(bn.probabilities[variable]
-                                   [probability_index]).limit_denominator()
-            clauses.append('w {} {} {}'.format(
-                ' '.join([literal] + conditions), float(probability),
-                float(negate_probability(probability))))
-            probability_index += len(bn.values[variable])
-        return clauses
+    def construct_weights(literal, conditions, probabilities, complements):
+        """Constructs a weight clause for every row of the CPT at once, where
+        conditions are the parent literals of each row, and probabilities and
+        complements are the relevant columns of the CPT (flattened in the order
+        of rows). All three are arrays of strings."""
+        return ('w ' + literal + conditions + ' ' + probabilities + ' ' +
+                complements).tolist()
+
+    def column_weights(literal, probabilities, complements, suffix=''):
+        """Constructs the weight clauses for a column of the CPT (i.e., an
+        array with an axis for each parent), where complements can also be a
+        single string. The suffix is appended to the conditions of every
+        clause."""
+        if compress:
+            conditions, probabilities, complements = compress_rows(
+                bn, literal_dict, variable, probabilities, complements)
+        else:
+            conditions = all_conditions
+            probabilities = probabilities.ravel()
+            if not isinstance(complements, str):
+                complements = complements.ravel()
+        return construct_weights(literal, conditions + suffix, probabilities,
+                                 complements)
 
     clauses = []
     weight_clauses = []
     for variable in bn.parents:
+        probabilities, complements = limit_denominators(
+            bn.probabilities[variable], as_strings=True)
+        if not compress:
+            all_conditions = parent_conditions(bn, literal_dict, variable)
         if len(bn.values[variable]) == 2:
             index, value = bn.goal_value(variable)
             literal = literal_dict.get_literal(variable, value)
-            weight_clauses += construct_weights(variable, literal, index,
-                                                lambda p: 1 - p)
+            weight_clauses += column_weights(literal,
+                                             probabilities[..., index],
+                                             complements[..., index])
+        elif literal_dict.get_bits(variable) is not None:
+            # Values 2t and 2t + 1 differ only in the last bit, so one weight
+            # clause on the last bit (conditioned on the other bits) covers
+            # both of them
+            bits = literal_dict.get_bits(variable)
+            num_values = probabilities.shape[-1]
+            padded = np.full(probabilities.shape[:-1] + (2**len(bits), ),
+                             str(0.0),
+                             dtype=object)
+            padded[..., :num_values] = probabilities
+            clauses += unused_codes_constraint(bits, num_values)
+            for t in range((num_values + 1) // 2):
+                prefix = ''.join(' ' + l for l in bit_pattern(bits[:-1], t))
+                weight_clauses += column_weights(bits[-1],
+                                                 padded[..., 2 * t + 1],
+                                                 padded[..., 2 * t], prefix)
         else:
             values = [
                 literal_dict.get_literal(variable, v)
                 for v in bn.values[variable]
             ]
-            clauses += exactly_one_constraint(values, encoding)
+            clauses += exactly_one_constraint(
+                values, select_at_most_one(at_most_one, len(values)),
+                literal_dict)
+            ones = str(1.0)
             for i, value in enumerate(values):
-                weight_clauses += construct_weights(variable, value, i,
-                                                    lambda p: 1)
+                weight_clauses += column_weights(value, probabilities[..., i],
+                                                 ones)
     return clauses, weight_clauses
 
 
+def negate(literal):
+    """Negates a literal (represented as a string)."""
+    return literal[1:] if literal.startswith('-') else '-' + literal
+
+
+def deterministic_weights(weight_clauses):
+    """Turns zero weights into hard clauses. For every weight clause
+    'w literal conditions... T F', T = 0 means that the literal is false
+    whenever the conditions hold, and F = 0 means that it is true. A weight
+    clause is dropped if each of its weights is either zero or one, since the
+    remaining weights then contribute a factor of one. Returns the hard
+    clauses and the remaining weight clauses."""
+    clauses = []
+    remaining = []
+    for line in weight_clauses:
+        words = line.split()
+        literal = words[1]
+        negated_conditions = [negate(l) for l in words[2:-2]]
+        weights = [float(words[-2]), float(words[-1])]
+        if weights[0] == 0:
+            clauses.append(' '.join(negated_conditions +
+                                    [negate(literal), '0']))
+        if weights[1] == 0:
+            clauses.append(' '.join(negated_conditions + [literal, '0']))
+        if any(w != 0 and w != 1 for w in weights):
+            remaining.append(line)
+    return clauses, remaining
+
+
+def propagate_units(clauses, weight_clauses):
+    """Simplifies the clauses and the weight clauses with respect to all
+    literals implied by unit propagation: satisfied clauses and weight clauses
+    with a false condition are removed, and false literals and true
+    conditions are removed from the rest. Every implied literal is kept as a
+    unit clause (so the weighted model count is unchanged). If unit
+    propagation finds a conflict, the (unsatisfiable) formula is returned
+    unchanged."""
+    parsed = [[int(l) for l in clause.split()[:-1]] for clause in clauses]
+    occurrences = collections.defaultdict(list)
+    for i, clause in enumerate(parsed):
+        for literal in clause:
+            occurrences[literal].append(i)
+    num_unassigned = [len(clause) for clause in parsed]
+    satisfied = [False] * len(parsed)
+    implied = []  # In the order of propagation
+    value = {}  # Maps a variable to its value
+    queue = [clause[0] for clause in parsed if len(clause) == 1]
+    while queue:
+        literal = queue.pop()
+        if abs(literal) in value:
+            if value[abs(literal)] != (literal > 0):
+                return clauses, weight_clauses
+            continue
+        value[abs(literal)] = literal > 0
+        implied.append(literal)
+        for i in occurrences[literal]:
+            satisfied[i] = True
+        for i in occurrences[-literal]:
+            if satisfied[i]:
+                continue
+            num_unassigned[i] -= 1
+            if num_unassigned[i] == 0:
+                return clauses, weight_clauses
+            if num_unassigned[i] == 1:
+                queue += [l for l in parsed[i] if abs(l) not in value]
+
+    true_literals = {str(literal) for literal in implied}
+    false_literals = {str(-literal) for literal in implied}
+    simplified = [
+        '{} 0'.format(' '.join(
+            str(l) for l in clause if str(l) not in false_literals))
+        for i, clause in enumerate(parsed) if not satisfied[i]
+    ]
+    simplified += ['{} 0'.format(literal) for literal in implied]
+    simplified_weights = []
+    for line in weight_clauses:
+        words = line.split()
+        conditions = words[2:-2]
+        if not false_literals.isdisjoint(conditions):
+            continue
+        if true_literals.isdisjoint(conditions):
+            simplified_weights.append(line)
+        else:
+            simplified_weights.append(' '.join(
+                words[:2] + [l for l in conditions if l not in true_literals] +
+                words[-2:]))
+    return simplified, simplified_weights
+
+
 def bn2uai(bn):
     """Represents the Bayesian network using the UAI format. Returns a list of
     string lines that can be written to a file and a list of variables of the
     network, where the index of a variable in this list is the numerical
     representation of the variable in the UAI format."""
     variables = list(bn.parents.keys())  # Fix an order on variables
-    parents = [[variables.index(v) for v in bn.parents[variables[variable]]]
+    variable_index = {v: i for i, v in enumerate(variables)}
+    parents = [[variable_index[v] for v in bn.parents[variables[variable]]]
                for variable in range(len(variables))]
-    probabilities = [
-        bn.probabilities[variables[v]] for v in range(len(variables))
-    ]
 
     # The header (the first four lines)
     lines = ['BAYES', str(len(variables))]
@@ -160,23 +598,13 @@ def bn2uai(bn):
 
     # Conditional probability tables
     for variable in range(len(variables)):
-        lines += [str(len(probabilities[variable]))]
-        # Assign each row of probabilities to a set of (parent_var, parent_val)
-        # pairs, then retrieve them in a different order
-        keys = itertools.product(*[[(p, v) for v in bn.values[variables[p]]]
-                                   for p in parents[variable]])
-        rearranged_probabilities = {}
-        num_values = len(bn.values[variables[variable]])
-        for i, key in enumerate(keys):
-            first_index = i * num_values
-            last_index = (i + 1) * num_values
-            rearranged_probabilities[frozenset(
-                key)] = probabilities[variable][first_index:last_index]
-        new_keys = itertools.product(*[[(p, v)
-                                        for v in bn.values[variables[p]]]
-                                       for p in sorted(parents[variable])])
-        for key in new_keys:
-            lines.append(' '.join(rearranged_probabilities[frozenset(key)]))
+        cpt = bn.probabilities[variables[variable]]
+        lines.append(str(cpt.size))
+        # The UAI format lists parents in the order of their indices
+        rows = common.permute_parents(
+            cpt, np.argsort(parents[variable], kind='stable')).reshape(
+                -1, cpt.shape[-1])
+        lines += [' '.join(repr(p) for p in row) for row in rows.tolist()]
     return lines, variables
 
 
@@ -231,20 +659,163 @@ def reencode_bn2cnf_weights(weights_filename, legacy_mode):
                           False), max(weights_map)
 
 
+def optimise_for_dpmc(num_variables, clauses, weight_lines, indicators=None):
+    """An in-process equivalent of tools/cnf4dpmc for encodings with weights
+    in the MiniC2D format (i.e., those of Ace and bn2cnf), except that the
+    constant factor is written exactly (cnf4dpmc rounds it to six
+    significant digits). All variables
+    except indicators are parameter variables, and they are removed: a clause
+    with a positive parameter literal becomes a weight line for its other
+    literals (or a constant factor if there are none), a clause with a
+    negative parameter literal is removed, and two consecutive weight lines
+    for a literal and its negation are merged. The remaining variables are
+    renumbered consecutively. Indicators (a set of variables) can be given
+    (e.g., from an LMAP file). Otherwise, they are the variables with both
+    weights equal to one. Returns the new number of variables, a generator of
+    the lines that are counted in the header (i.e., clauses and weight lines),
+    and the list of other lines (i.e., the constant factor). The clauses can
+    be any iterable of strings, and they are read one at a time, so only the
+    merged weight lines are kept in memory. The list of other lines is only
+    filled once the generator is exhausted."""
+    assert len(weight_lines) == 1 and weight_lines[0].startswith('c weights')
+    words = weight_lines[0].split()[2:]
+    weights = words[:2 * num_variables]
+    multiplier = (float(words[2 * num_variables])
+                  if len(words) > 2 * num_variables else 1)
+
+    def weight(literal):
+        return (weights[2 * literal - 2]
+                if literal > 0 else weights[-2 * literal - 1])
+
+    if indicators is None:
+        indicators = set(v for v in range(1, num_variables + 1)
+                         if float(weight(v)) == 1 and float(weight(-v)) == 1)
+    parameters = [
+        v for v in range(1, num_variables + 1) if v not in indicators
+    ]
+    is_parameter = set(parameters)
+
+    def rename(literal):
+        # Every variable moves down by the number of parameters before it
+        variable = abs(literal) - bisect.bisect_right(parameters, abs(literal))
+        return variable if literal > 0 else -variable
+
+    def status(clause):
+        # The status of a clause is 0 if it stays a clause, -1 if it is
+        # removed, and its parameter literal if it becomes a weight line
+        for literal in clause:
+            if abs(literal) in is_parameter:
+                if literal > 0 and float(weight(literal)) != 1:
+                    return literal
+                return -1
+        return 0
+
+    def mergeable(first, second):
+        return (first[1] > 0 and second[1] > 0 and len(first[0]) == 2
+                and len(second[0]) == 2 and second[0][0] == -first[0][0])
+
+    def merge(first, second):
+        positive, negative = ((first[1], second[1]) if first[0][0] < 0 else
+                              (second[1], first[1]))
+        return 'w {} {} {}'.format(rename(abs(first[0][0])), weight(positive),
+                                   weight(negative))
+
+    other_lines = []
+
+    def emit(clause, clause_status):
+        nonlocal multiplier
+        if clause_status == 0:
+            yield ''.join(str(rename(l)) + ' ' for l in clause) + '0'
+        elif clause_status > 0 and len(clause) == 1:
+            multiplier *= float(weight(clause_status))
+        elif clause_status > 0:
+            yield 'w' + ''.join(' ' + str(rename(-l)) for l in clause
+                                if l != clause_status) + ' {} 1'.format(
+                                    weight(clause_status))
+
+    def lines():
+        # Every clause is only compared with the next one, so a window of one
+        # clause is enough
+        merged = []
+        previous = None
+        for line in clauses:
+            clause = [int(w) for w in line.split()[:-1]]
+            current = (clause, status(clause))
+            if previous is not None and mergeable(previous, current):
+                merged.append(merge(previous, current))
+                previous = None
+                continue
+            if previous is not None:
+                yield from emit(*previous)
+            previous = current
+        if previous is not None:
+            yield from emit(*previous)
+        yield from merged
+        if multiplier != 1:
+            other_lines.append('w 0 {!r}'.format(multiplier))
+
+    return num_variables - len(parameters), lines(), other_lines
+
+
 # ============ Functions primarily responsible for parsing ============
 
 
-def identify_goal(text, bn_format):
-    """Looks at a Bayesian network string to determine which marginal
-    probability should be computed. Returns the name of the variable, its chosen
-    value, and the index of that value among all the values of the variable."""
-    goal_node, goal_node_end = [(i.group(1), i.end())
-                                for i in common.NODE_RE.finditer(text)][-1]
-    values = common.STATE_SPLITTER_RE[bn_format].split(
-        common.STATES_RE[bn_format].search(text[goal_node_end:]).group(1))
-    goal_value = 'true' if 'true' in values else values[0]
-    goal_value_index = values.index(goal_value)
-    return Goal(goal_node, goal_value, goal_value_index)
+def identify_goal(bn):
+    """Looks at a Bayesian network to determine which marginal probability
+    should be computed. Returns the name of the variable, its chosen value, and
+    the index of that value among all the values of the variable."""
+    goal_variable, goal_value = bn.goal()
+    return Goal(goal_variable, goal_value,
+                bn.values[goal_variable].index(goal_value))
+
+
+def query_variables(bn, args):
+    """Returns the list of query variables selected by the command-line
+    arguments: all variables for 'all', and no variables if no queries were
+    requested."""
+    if args.queries is None:
+        return []
+    if args.queries == 'all':
+        return list(bn.values)
+    variables = args.queries.split(',')
+    for variable in variables:
+        if variable not in bn.values:
+            raise ValueError('Unknown query variable: {}'.format(variable))
+    return variables
+
+
+def evidence_batch(bn, args):
+    """Returns the list of (name, evidence) pairs selected by the command-line
+    arguments (see common.parse_evidence_batch), checking that all variables
+    and values exist. The list is empty if no batch was requested."""
+    if args.evidence_batch is None:
+        return []
+    batch = list(common.parse_evidence_batch(args.evidence_batch))
+    for name, evidence in batch:
+        if len(name.split()) != 1:
+            raise ValueError('Invalid name of evidence: {!r}'.format(name))
+        for variable, value in evidence.items():
+            if value not in bn.values.get(variable, []):
+                raise ValueError('Unknown evidence in {}: {} = {}'.format(
+                    name, variable, value))
+    return batch
+
+
+def prune_network(bn, args, queries, batch=()):
+    """Removes the parts of the Bayesian network that are irrelevant to the
+    evidence and the query variables (or to the goal if there are neither) if
+    requested by the command-line arguments (see BayesianNetwork.prune). The
+    variables of a batch of evidence are kept as query variables since their
+    values differ from one set of evidence to another."""
+    if not args.prune:
+        return
+    evidence = ({} if common.empty_evidence(args.evidence) else dict(
+        common.parse_evidence(args.evidence)))
+    queries = list(queries) + sorted(
+        set(variable for _, e in batch for variable in e))
+    if not evidence and not queries:
+        queries = [bn.goal()[0]]
+    bn.prune(evidence, queries)
 
 
 def parse_bn2cnf_variables_file(variables_filename):
@@ -269,6 +840,7 @@ def parse_lmap(filename, goal, values):
     largest literal found in the file."""
     weights = {}
     max_literal = 0
+    goal_literal = None
     literal_dict = LiteralDict()
     for line in open(filename):
         if (line.startswith('cc$I') or line.startswith('cc$C')
@@ -322,140 +894,358 @@ def run_bn2cnf(bn, bn_filename, memory_limit):
     return literal_dict
 
 
-def run_legacy_ace(args, goal):
+def run_legacy_ace(args, goal, network_filename):
     """Runs the Ace compilation script with the options used for the original
     papers (available in Ace's readme.pdf file)."""
     run(
         ACE_LEGACY[args.encoding] + [
-            args.network, '-e',
+            network_filename, '-e',
             new_evidence_file(args.network, goal.variable, goal.value)
             if common.empty_evidence(args.evidence) else args.evidence
         ], args.memory)
 
 
-# ==================== Final output function ====================
+# ==================== Final output functions ====================
+
+
+def read_clauses(filename):
+    """Yields the clauses of a CNF file one at a time (as strings)."""
+    with open(filename) as cnf_file:
+        for line in cnf_file:
+            if line[0].isdigit() or line[0] == '-':
+                yield line.rstrip()
 
 
-def write_cnf_file(args, num_variables, clauses, weights):
-    """Write the full WMC instance to a file"""
-    header = 'p cnf {} {}'.format(num_variables, len(clauses))
+def read_lines(filename):
+    """Yields the lines of a file one at a time (without line breaks)."""
+    with open(filename) as lines_file:
+        for line in lines_file:
+            yield line.rstrip('\n')
+
+
+def count_clauses(filename):
+    """Counts the clauses of a CNF file without storing them."""
+    with open(filename) as cnf_file:
+        return sum(1 for line in cnf_file
+                   if line[0].isdigit() or line[0] == '-')
+
+
+def write_cnf_file(args, num_variables, clauses, weights, num_clauses=None):
+    """Write the full WMC instance to a file. The clauses can be any iterable
+    of strings (e.g., a generator that reads them from another file). They
+    are written one at a time to a temporary file that then replaces the CNF
+    file, so the whole instance is never held in memory, and the clauses can
+    be read from the file that is being replaced. If their number is not
+    given (and they are not a list), the clauses are first counted while
+    being written to another temporary file. The weights are only iterated
+    after all clauses."""
+    if args.binary:
+        write_binary_file(args.network + '.wmc', num_variables, clauses,
+                          weights)
+        return
     filename = args.network + '.cnf'
-    with open(filename, 'w') as cnf_file:
-        cnf_file.write('\n'.join([header] + clauses + weights) + '\n')
+    spooled = num_clauses is None and not isinstance(clauses, list)
+    if spooled:
+        num_clauses = 0
+        with open(filename + '.clauses', 'w') as clauses_file:
+            for clause in clauses:
+                clauses_file.write(clause + '\n')
+                num_clauses += 1
+        clauses = read_lines(filename + '.clauses')
+    elif num_clauses is None:
+        num_clauses = len(clauses)
+    written = 0
+    with open(filename + '.tmp', 'w') as cnf_file:
+        cnf_file.write('p cnf {} {}\n'.format(num_variables, num_clauses))
+        for clause in clauses:
+            cnf_file.write(clause + '\n')
+            written += 1
+        for weight in weights:
+            cnf_file.write(weight + '\n')
+    if spooled:
+        os.remove(filename + '.clauses')
+    if written != num_clauses:
+        os.remove(filename + '.tmp')
+        raise ValueError('Expected {} clauses but got {}'.format(
+            num_clauses, written))
+    os.replace(filename + '.tmp', filename)
+
+
+def parse_weight_line(line):
+    """Translates a weight line of a CNF file into a list of (literals, weight
+    if true, weight if false) triples, where the first literal is the weighted
+    one and the rest are its conditions (as in the weight lines of cw). A
+    triple without literals is a constant factor. Supports MiniC2D ('c
+    weights'), cachet, and DPMC weight lines."""
+    words = line.split()
+    if words[0] == 'c':
+        values = [float(w) for w in words[2:]]
+        triples = [([variable + 1], values[2 * variable],
+                    values[2 * variable + 1])
+                   for variable in range(len(values) // 2)]
+        if len(values) % 2 == 1:
+            triples.append(([], values[-1], values[-1]))
+        return triples
+    if len(words) == 3:
+        # Either a constant factor or a cachet weight
+        literal, weight = int(words[1]), float(words[2])
+        if literal == 0:
+            return [([], weight, weight)]
+        if weight == -1:
+            return [([literal], 1.0, 1.0)]
+        return [([literal], weight, 1 - weight)]
+    return [([int(w) for w in words[1:-2]], float(words[-2]),
+             float(words[-1]))]
+
+
+def write_binary_file(filename, num_variables, clauses, weights):
+    """Writes a WMC instance (with clauses and weight lines as in a CNF file)
+    to a binary file that can be memory-mapped without parsing. After the
+    header (BINARY_HEADER), the file consists of the following little-endian
+    arrays:
+    1. clause offsets (int64, one more than the number of clauses),
+    2. weight offsets (int64, one more than the number of weights),
+    3. weights if true and if false (float64, two per weight),
+    4. literals of clauses (int32),
+    5. literals of weights (int32),
+    where the literals of the i-th clause (weight) are between the i-th and
+    the (i+1)-th clause (weight) offset. Every weight is as returned by
+    parse_weight_line, so literal weights are weights without conditions.
+    All 64-bit arrays come first, so no padding is needed."""
+    # Clauses are parsed in chunks, so only their literals are kept in memory
+    clauses = iter(clauses)
+    chunks = [np.zeros(0, dtype=np.int32)]
+    while True:
+        chunk = list(itertools.islice(clauses, BINARY_CHUNK_SIZE))
+        if not chunk:
+            break
+        chunks.append(np.array(' '.join(chunk).split(), dtype=np.int32))
+    literals = np.concatenate(chunks)
+    ends = np.flatnonzero(literals == 0)
+    clause_offsets = np.zeros(len(ends) + 1, dtype='<i8')
+    clause_offsets[1:] = ends - np.arange(len(ends))
+    clause_literals = literals[literals != 0].astype('<i4')
+
+    weight_lengths = []
+    weight_values = []
+    weight_literals = []
+    for line in weights:
+        for literals, if_true, if_false in parse_weight_line(line):
+            weight_lengths.append(len(literals))
+            weight_values += [if_true, if_false]
+            weight_literals += literals
+    weight_offsets = np.zeros(len(weight_lengths) + 1, dtype='<i8')
+    np.cumsum(weight_lengths, out=weight_offsets[1:])
+
+    with open(filename, 'wb') as binary_file:
+        binary_file.write(
+            BINARY_HEADER.pack(BINARY_MAGIC, num_variables, len(ends),
+                               len(clause_literals), len(weight_lengths),
+                               len(weight_literals)))
+        for array in [
+                clause_offsets, weight_offsets,
+                np.array(weight_values, dtype='<f8'), clause_literals,
+                np.array(weight_literals, dtype='<i4')
+        ]:
+            array.tofile(binary_file)
+
+
+def write_queries_file(args, bn, queries, get_literals):
+    """Writes a line for every value of every query variable to a file: the
+    name of the variable, the value, and the literals (as returned by
+    get_literals) whose conjunction corresponds to the variable-value pair.
+    Adding these literals as unit clauses (or, equivalently, setting the
+    weights of their negations to zero) to the CNF file turns it into a WMC
+    instance for the probability of the variable-value pair (and evidence)."""
+    with open(args.network + '.queries', 'w') as queries_file:
+        for variable in queries:
+            for value in bn.values[variable]:
+                queries_file.write(' '.join([variable, value] +
+                                            get_literals(variable, value)) +
+                                   '\n')
+
+
+def write_evidence_file(args, batch, get_literals):
+    """Writes a line for every set of evidence in the batch to a file: the name
+    of the set and the literals (as returned by get_literals) whose
+    conjunction corresponds to the evidence. Each line is a small delta
+    against the shared CNF file (which has no evidence and no goal): adding
+    its literals as unit clauses turns the CNF file into a WMC instance for
+    the probability of that evidence."""
+    with open(args.network + '.evidence', 'w') as evidence_file:
+        for name, evidence in batch:
+            evidence_file.write(' '.join([name] + [
+                literal for variable, value in evidence.items()
+                for literal in get_literals(variable, value)
+            ]) + '\n')
 
 
 # ==================== Main encoding functions ====================
 
 
-def ace_encoder(args):
+def ace_encoder(args, bn):
     """This function is responsible for the entire encoding process for all
     encodings that use Ace."""
     # Identify the goal
-    with open(args.network, encoding=common.FILE_ENCODING) as network_file:
-        text = network_file.read()
-    bn_format = common.get_file_format(args.network)
-    goal = identify_goal(text, bn_format)
+    goal = identify_goal(bn)
+    queries = query_variables(bn, args)
+    batch = evidence_batch(bn, args)
+
+    # Ace reads the network from a file, so a pruned network is written to a
+    # new file
+    network_filename = args.network
+    if args.prune:
+        prune_network(bn, args, queries, batch)
+        network_filename = args.network + '.pruned.net'
+        bn.write_net(network_filename)
 
     if args.mode == 'legacy' and args.encoding != 'sbk05':
-        run_legacy_ace(args, goal)
+        run_legacy_ace(args, goal, network_filename)
         return
 
-    run(ACE + ['-' + args.encoding, args.network], args.memory)
-
-    values = {}  # Make a variable -> list of values map
-    for node in common.NODE_RE.finditer(text):
-        values[node.group(1)] = common.STATE_SPLITTER_RE[bn_format].split(
-            common.STATES_RE[bn_format].search(text[node.end():]).group(1))
+    run(ACE + ['-' + args.encoding, network_filename], args.memory)
 
     # Add evidence or goal
     weights, literal_dict, goal_literal, max_literal = parse_lmap(
-        args.network + '.lmap', goal, values)
-    with open(args.network + '.cnf') as cnf_file:
-        clauses = [
-            l.rstrip() for l in cnf_file if l[0].isdigit() or l[0] == '-'
-        ]
-    if common.empty_evidence(args.evidence):
-        clauses.append(encode_single_literal(goal_literal, args.encoding))
-    else:
+        network_filename + '.lmap', goal, bn.values)
+    clauses = []
+    if not common.empty_evidence(args.evidence):
         for variable, value in common.parse_evidence(args.evidence):
             clauses.append(
                 encode_single_literal(
                     literal_dict.get_literal(variable, value), args.encoding))
-    write_cnf_file(args, max_literal, clauses,
-                   encode_weights(weights, max_literal, args.mode == 'legacy'))
-    if (args.mode == 'optimised'):
-        run(CNF4DPMC + [args.network + '.cnf', '-l'])
+    elif not queries and not batch:
+        clauses.append(encode_single_literal(goal_literal, args.encoding))
+
+    def get_literals(variable, value):
+        return [literal_dict.get_literal(variable, value)]
+
+    if queries:
+        write_queries_file(args, bn, queries, get_literals)
+    if batch:
+        write_evidence_file(args, batch, get_literals)
+    # The clauses produced by Ace are streamed from its CNF file
+    cnf_filename = network_filename + '.cnf'
+    encoded_weights = encode_weights(weights, max_literal,
+                                     args.mode == 'legacy')
+    if args.mode == 'optimised':
+        indicators = set(
+            int(literal) for variable, values in bn.values.items()
+            for value in values
+            for literal in [literal_dict.get_literal(variable, value)]
+            if int(literal) > 0)
+        num_variables, lines, constants = optimise_for_dpmc(
+            max_literal, itertools.chain(read_clauses(cnf_filename),
+                                         clauses), encoded_weights,
+            indicators)
+        write_cnf_file(args, num_variables, lines, constants)
+    else:
+        write_cnf_file(args, max_literal,
+                       itertools.chain(read_clauses(cnf_filename), clauses),
+                       encoded_weights,
+                       count_clauses(cnf_filename) + len(clauses))
 
 
-def bn2cnf_encoder(args):
+def bn2cnf_encoder(args, bn):
     """This function is responsible for the entire encoding process for the
     bklm16 encoding (that uses the bn2cnf program)."""
-    bn = common.BayesianNetwork(args.network)
-    literal_dict = run_bn2cnf(bn, args.network, args.memory)
+    queries = query_variables(bn, args)
+    batch = evidence_batch(bn, args)
+    prune_network(bn, args, queries, batch)
+    variable_index = {
+        v: i
+        for i, v in enumerate(run_bn2cnf(bn, args.network, args.memory))
+    }
     encoded_weights, max_literal = reencode_bn2cnf_weights(
         args.network + '.uai.weights', args.mode == 'legacy')
     indicators = parse_bn2cnf_variables_file(args.network + '.uai.variables')
 
-    with open(args.network + '.cnf') as cnf_file:
-        clauses = [
-            l.rstrip() for l in cnf_file if l[0].isdigit() or l[0] == '-'
-        ]
-
     # Incorporate evidence (or select a goal)
+    clauses = []
     if not common.empty_evidence(args.evidence):
         for variable, value in common.parse_evidence(args.evidence):
-            clauses += indicators[(literal_dict.index(variable),
+            clauses += indicators[(variable_index[variable],
                                    bn.values[variable].index(value))]
-    else:
+    elif not queries and not batch:
         # Identify the goal formula
-        with open(args.network, encoding=common.FILE_ENCODING) as network_file:
-            text = network_file.read()
-        goal = identify_goal(text, common.get_file_format(args.network))
-        goal_variable_index = literal_dict.index(goal.variable)
-        clauses += indicators[(goal_variable_index, goal.value_index)]
+        goal = identify_goal(bn)
+        clauses += indicators[(variable_index[goal.variable],
+                               goal.value_index)]
 
-    # Put everything together and write to a file
-    write_cnf_file(args, max_literal, clauses, encoded_weights)
+    def get_literals(variable, value):
+        return [
+            clause.split()[0]
+            for clause in indicators[(variable_index[variable],
+                                      bn.values[variable].index(value))]
+        ]
+
+    if queries:
+        write_queries_file(args, bn, queries, get_literals)
+    if batch:
+        write_evidence_file(args, batch, get_literals)
+
+    # Put everything together and write to a file (streaming the clauses
+    # produced by bn2cnf from its CNF file)
+    cnf_filename = args.network + '.cnf'
+    if args.mode == 'optimised':
+        num_variables, lines, constants = optimise_for_dpmc(
+            max_literal, itertools.chain(read_clauses(cnf_filename),
+                                         clauses), encoded_weights)
+        write_cnf_file(args, num_variables, lines, constants)
+    else:
+        write_cnf_file(args, max_literal,
+                       itertools.chain(read_clauses(cnf_filename), clauses),
+                       encoded_weights,
+                       count_clauses(cnf_filename) + len(clauses))
 
     if args.mode == 'legacy':
         run(C2D + ['-in', args.network + '.cnf'], args.memory)
-    elif args.mode == 'optimised':
-        run(CNF4DPMC + [args.network + '.cnf'])
 
 
-def my_encoder(args):
+def my_encoder(args, bn):
     """This function is responsible for the entire encoding process for the cw
     encoding"""
-    bn = common.BayesianNetwork(args.network)
-    literal_dict = LiteralDict(bn)
-    clauses, weight_clauses = bn2cnf(bn, literal_dict, args.encoding)
+    queries = query_variables(bn, args)
+    batch = evidence_batch(bn, args)
+    prune_network(bn, args, queries, batch)
+    literal_dict = LiteralDict(bn, args.log_values)
+    clauses, weight_clauses = bn2cnf(bn, literal_dict, args.at_most_one,
+                                     args.compress)
 
     if not common.empty_evidence(args.evidence):
         clauses += [
-            encode_single_literal(literal_dict.get_literal(variable, value),
-                                  args.encoding)
+            encode_single_literal(literal, args.encoding)
             for variable, value in common.parse_evidence(args.evidence)
+            for literal in literal_dict.get_literals(variable, value)
         ]
-    else:
-        # Add a goal clause if necessary
-        literal = literal_dict.get_literal(*bn.goal())
-        clauses.append(encode_single_literal(literal, args.encoding))
+    elif not queries and not batch:
+        # Add goal clauses if necessary
+        clauses += [
+            encode_single_literal(literal, args.encoding)
+            for literal in literal_dict.get_literals(*bn.goal())
+        ]
+    if queries:
+        write_queries_file(args, bn, queries, literal_dict.get_literals)
+    if batch:
+        write_evidence_file(args, batch, literal_dict.get_literals)
+
+    if args.deterministic:
+        hard_clauses, weight_clauses = deterministic_weights(weight_clauses)
+        clauses, weight_clauses = propagate_units(clauses + hard_clauses,
+                                                  weight_clauses)
 
     write_cnf_file(args, len(literal_dict), clauses, weight_clauses)
 
 
-def moralisation_encoder(args):
-    bn = common.BayesianNetwork(args.network)
+def moralisation_encoder(args, bn):
     nodes = list(bn.parents)
+    node_index = {node: i for i, node in enumerate(nodes)}
     edges = set()
     for node_i, node in enumerate(nodes):
+        parents = [node_index[parent] for parent in bn.parents[node]]
+        edges.update(frozenset([node_i, parent]) for parent in parents)
         edges.update(
-            frozenset([node_i, nodes.index(parent)])
-            for parent in bn.parents[node])
-        edges.update(
-            frozenset([nodes.index(parent1),
-                       nodes.index(parent2)]) for parent1 in bn.parents[node]
-            for parent2 in bn.parents[node] if parent1 != parent2)
+            frozenset(pair) for pair in itertools.combinations(parents, 2))
     lines = ['p tw {} {}'.format(len(nodes), len(edges))]
     for edge in edges:
         lines.append(' '.join(str(n + 1) for n in edge))
@@ -463,16 +1253,17 @@ def moralisation_encoder(args):
         graph_file.write('\n'.join(lines) + '\n')
 
 
-def stats_encoder(args):
-    bn = common.BayesianNetwork(args.network)
-    probabilities = collections.Counter()
-    for _, probs in bn.probabilities.items():
-        probabilities.update([Fraction(p).limit_denominator() for p in probs])
-    total = sum(probabilities.values())
+def stats_encoder(args, bn):
+    total = 0
+    deterministic = 0  # The number of probabilities equal to zero or one
+    for cpt in bn.probabilities.values():
+        probabilities, _ = limit_denominators(cpt)
+        total += probabilities.size
+        deterministic += int(
+            np.count_nonzero((probabilities == 0) | (probabilities == 1)))
     stats = {
         'num_variables': len(bn.parents),
-        'zero_proportion': (probabilities[Fraction('0')] +
-                            probabilities[Fraction('1')]) / total
+        'zero_proportion': deterministic / total
     }
     with open(args.network + '.stats', 'w') as prob_file:
         writer = csv.DictWriter(prob_file, fieldnames=stats.keys())
@@ -480,9 +1271,9 @@ def stats_encoder(args):
         writer.writerow(stats)
 
 
-def main():
-    """Sets up all information about command-line arguments and redirects the
-    arguments to one out of three encoder functions."""
+def parse_arguments(arguments=None):
+    """Sets up all information about command-line arguments and parses them
+    (either from the command line or from the given list of strings)."""
     parser = argparse.ArgumentParser(
         description='Encode Bayesian networks into instances of ' +
         'weighted model counting (WMC)')
@@ -505,23 +1296,150 @@ def main():
     parser.add_argument('-e',
                         dest='evidence',
                         help='evidence file (in the INST format)')
+    parser.add_argument(
+        '-a',
+        dest='at_most_one',
+        type=parse_at_most_one,
+        default='pairwise',
+        help='the at-most-one encoding(s) used by cw for variables with ' +
+        'more than two values: a comma-separated list of ENCODING or ' +
+        'MIN_VALUES:ENCODING items, where ENCODING is one of ' +
+        ', '.join(AT_MOST_ONE) + ' (e.g., pairwise,8:ladder,32:commander)')
+    parser.add_argument(
+        '-l',
+        dest='log_values',
+        metavar='MIN_VALUES',
+        type=int,
+        help='make cw represent every variable with at least MIN_VALUES ' +
+        '(and more than two) values by ceil(log2(number of values)) bits ' +
+        'instead of one literal per value')
+    parser.add_argument(
+        '-c',
+        dest='compress',
+        action='store_true',
+        help='make cw collapse rows of CPTs with equal probabilities into ' +
+        'weight clauses over only the relevant parents')
+    parser.add_argument(
+        '-d',
+        dest='deterministic',
+        action='store_true',
+        help='make cw turn probabilities equal to zero or one into hard ' +
+        'clauses and simplify the formula by unit propagation')
+    parser.add_argument(
+        '-p',
+        dest='prune',
+        action='store_true',
+        help='remove the parts of the network that are irrelevant to the ' +
+        'evidence (or the goal) before encoding (for all encodings except ' +
+        'moralisation and stats; not in legacy mode)')
+    parser.add_argument(
+        '-q',
+        dest='queries',
+        help='encode the network without a goal and write the literals of ' +
+        'every value of the query variables to network.queries (a ' +
+        "comma-separated list of variables or 'all'; basic mode only)")
+    parser.add_argument(
+        '-b',
+        dest='evidence_batch',
+        help='encode the network without evidence and goal and write the ' +
+        'literals of every set of evidence in a directory of INST files or ' +
+        'a JSONL file to network.evidence (basic mode only)')
     parser.add_argument(
         '-m',
         dest='memory',
         help='the maximum amount of virtual memory available to underlying ' +
         'encoders (in GiB)')
-    args = parser.parse_args()
-
+    parser.add_argument(
+        '--binary',
+        action='store_true',
+        help='write the encoding to network.wmc in a binary format instead ' +
+        'of network.cnf (basic mode only, not for cw)')
+    parser.add_argument(
+        '--cache',
+        metavar='DIRECTORY',
+        help='reuse encodings of the same network, evidence, and options ' +
+        'from a cache in the given directory (and add new encodings to it)')
+    parser.add_argument('--cache-size',
+                        type=float,
+                        default=encoding_cache.DEFAULT_SIZE,
+                        help='the size budget of the cache (in GiB, ' +
+                        'default: {})'.format(encoding_cache.DEFAULT_SIZE))
+    parser.add_argument(
+        '--link',
+        action='store_true',
+        help='restore cached files as (read-only) hard links instead of ' +
+        'copies')
+    args = parser.parse_args(arguments)
+    if args.queries is not None and args.mode != 'basic':
+        parser.error('queries are supported only in basic mode')
+    # The legacy algorithms (e.g., evaluate) read the outputs of Ace for the
+    # original network
+    if args.prune and args.mode == 'legacy':
+        parser.error('pruning is not supported in legacy mode')
+    if args.binary and args.mode != 'basic':
+        parser.error('binary files are supported only in basic mode')
+    # The only reader of binary files (BinaryFormula) supports only literal
+    # weights, and cw has conditional weights
+    if args.binary and args.encoding == 'cw':
+        parser.error('binary files are not supported for cw')
+    if args.evidence_batch is not None:
+        if args.mode != 'basic':
+            parser.error('evidence batches are supported only in basic mode')
+        if args.evidence is not None:
+            parser.error('-b cannot be combined with -e')
+    return args
+
+
+def encoder_files(encoding):
+    """The files (and directories) on which the output of an encoding
+    depends."""
+    return SOURCE_FILES + EXTERNAL_ENCODER_FILES.get(encoding, [])
+
+
+def encode(args, bn=None):
+    """Restores the encoding from the cache (if enabled) or runs the encoder
+    and stores its output files in the cache. The network can be given as an
+    already parsed BayesianNetwork object (that the encoder may modify)."""
+    # Files restored as hard links must not be changed by the encoder
+    encoding_cache.break_links(args.network)
+    if args.cache is None:
+        run_encoder(args, bn)
+        return
+    cache = encoding_cache.EncodingCache(args.cache, args.cache_size,
+                                         args.link)
+    key = encoding_cache.encoding_key(
+        args, encoding_cache.source_version(encoder_files(args.encoding)))
+    if cache.restore(key, args.network):
+        print('...Restored the encoding from the cache')
+        return
+    before = encoding_cache.output_files(args.network)
+    run_encoder(args, bn)
+    cache.store(key, args.network, [
+        path
+        for path, mtime in encoding_cache.output_files(args.network).items()
+        if before.get(path) != mtime
+    ])
+
+
+def run_encoder(args, bn=None):
+    """Redirects the arguments to the right encoder function (parsing the
+    network if necessary)."""
+    if bn is None:
+        bn = common.BayesianNetwork(args.network)
     if args.encoding == 'moralisation':
-        moralisation_encoder(args)
+        moralisation_encoder(args, bn)
     elif args.encoding == 'stats':
-        stats_encoder(args)
+        stats_encoder(args, bn)
     elif args.encoding.startswith('cw'):
-        my_encoder(args)
+        my_encoder(args, bn)
     elif args.encoding == 'bklm16':
-        bn2cnf_encoder(args)
+        bn2cnf_encoder(args, bn)
     else:
-        ace_encoder(args)
+        ace_encoder(args, bn)
+
+
+def main():
+    encode(parse_arguments())
 
 
 if __name__ == '__main__':
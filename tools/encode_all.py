@@ -0,0 +1,230 @@
+"""Runs all the experiments of the Makefile (as in the WITHOUT_EVIDENCE and
+*_WITH_EVIDENCE recipes) on one Bayesian network in parallel. The network is
+parsed once, and every encoding runs in a forked process with its own copy of
+the network in its own directory (so that the encodings do not overwrite each
+other's files), followed by the algorithm used on it (run by the INFERENCE
+target of the Makefile in the same directory), e.g.,
+
+python tools/encode_all.py data/2004-pgm/alarm-1.inst.net \\
+    -e data/2004-pgm/alarm-1.inst -r results/2004-pgm/alarm-1.inst
+
+writes the d02 basic encoding to data/2004-pgm/alarm-1.inst.net.d02.basic/
+alarm-1.inst.net.cnf, its log to results/2004-pgm/alarm-1.inst.d02.new_enc, and
+the log of DPMC to results/2004-pgm/alarm-1.inst.d02.new_inf. As with
+'/usr/bin/time -v' in the Makefile, every encoding log ends with the resources
+used by the encoder (including external programs such as Ace), and the CPU time
+and memory of every encoding are limited as in the Makefile."""
+
+import argparse
+import os
+import resource
+import shutil
+import signal
+import sys
+import time
+import traceback
+
+import common
+import encode
+
+# As in the Makefile
+TIMEOUT = 1000
+MAX_MEMORY = 32  # In GiB
+
+# The encodings and modes in the same order as in the Makefile
+JOBS = [('d02', 'basic'), ('sbk05', 'basic'), ('bklm16', 'basic'),
+        ('cd05', 'legacy'), ('cd06', 'legacy'), ('d02', 'legacy'),
+        ('sbk05', 'legacy'), ('bklm16', 'legacy'), ('d02', 'optimised'),
+        ('cd05', 'optimised'), ('cd06', 'optimised'),
+        ('bklm16', 'optimised'), ('cd05', 'basic'), ('cd06', 'basic')]
+
+
+def log_filename(prefix, encoding, mode):
+    """The name of the log file of an encoding (as in the Makefile)."""
+    return '{}.{}{}.{}'.format(prefix, encoding,
+                               'pp' if mode == 'optimised' else '',
+                               'old_enc' if mode == 'legacy' else 'new_enc')
+
+
+def working_copy(network, encoding, mode):
+    """Links (or copies) the network into a new directory for the given
+    encoding and mode and returns the new filename of the network."""
+    directory = '{}.{}.{}'.format(network, encoding, mode)
+    os.makedirs(directory, exist_ok=True)
+    copy = os.path.join(directory, os.path.basename(network))
+    if os.path.lexists(copy):
+        os.remove(copy)
+    try:
+        os.link(network, copy)
+    except OSError:
+        shutil.copyfile(network, copy)
+    return copy
+
+
+def format_usage(command, status, elapsed, usage):
+    """Describes the resources used by a process in the same format as
+    '/usr/bin/time -v' (only the most important lines)."""
+    lines = []
+    if os.WIFSIGNALED(status):
+        lines.append('Command terminated by signal {}'.format(
+            os.WTERMSIG(status)))
+    cpu = usage.ru_utime + usage.ru_stime
+    # Rounded before splitting into minutes and seconds, so that, e.g.,
+    # 59.996s is 1:00.00 rather than 0:60.00
+    minutes, centiseconds = divmod(int(round(elapsed * 100)), 6000)
+    hours, minutes = divmod(minutes, 60)
+    seconds, centiseconds = divmod(centiseconds, 100)
+    lines += [
+        '\tCommand being timed: "{}"'.format(command),
+        '\tUser time (seconds): {:.2f}'.format(usage.ru_utime),
+        '\tSystem time (seconds): {:.2f}'.format(usage.ru_stime),
+        '\tPercent of CPU this job got: {:.0f}%'.format(
+            100 * cpu / elapsed if elapsed > 0 else 0),
+        '\tElapsed (wall clock) time (h:mm:ss or m:ss): ' +
+        ('{}:{:02d}:{:02d}'.format(hours, minutes, seconds) if hours > 0
+         else '{}:{:02d}.{:02d}'.format(minutes, seconds, centiseconds)),
+        '\tMaximum resident set size (kbytes): {}'.format(usage.ru_maxrss),
+        '\tMajor (requiring I/O) page faults: {}'.format(usage.ru_majflt),
+        '\tMinor (reclaiming a frame) page faults: {}'.format(
+            usage.ru_minflt),
+        '\tVoluntary context switches: {}'.format(usage.ru_nvcsw),
+        '\tInvoluntary context switches: {}'.format(usage.ru_nivcsw),
+        '\tFile system inputs: {}'.format(usage.ru_inblock),
+        '\tFile system outputs: {}'.format(usage.ru_oublock),
+        '\tExit status: {}'.format(
+            os.WEXITSTATUS(status) if os.WIFEXITED(status) else 0)
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def start(arguments, bn, log, timeout):
+    """Runs encode.py with the given arguments in a forked process that writes
+    its output to the log file. Returns the process ID."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid > 0:
+        return pid
+    status = 1
+    try:
+        log_fd = os.open(log, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.dup2(log_fd, 1)
+        os.dup2(log_fd, 2)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        if timeout:
+            resource.setrlimit(resource.RLIMIT_CPU, (timeout, timeout))
+        encode.encode(encode.parse_arguments(arguments), bn)
+        status = 0
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status)
+
+
+def start_inference(network, encoding, mode, results, args):
+    """Runs the algorithm used on an encoding (if any) on the copy of the
+    network with the INFERENCE target of the Makefile. Returns the process ID.
+    """
+    arguments = [
+        args.make, '-s', network + '/INFERENCE', 'ENCODING=' + encoding,
+        'MODE=' + mode, 'RESULTS=' + results
+    ]
+    arguments += [
+        'TIMEOUT={}'.format(args.timeout),
+        'MAX_MEMORY={}'.format(args.memory),
+        'MAX_MEMORY_KB={}'.format(int(0.95 * float(args.memory) * 1024**2))
+    ]
+    return os.spawnvp(os.P_NOWAIT, args.make, arguments)
+
+
+def parse_arguments(arguments=None):
+    """Parses the command-line arguments (either from the command line or
+    from the given list of strings)."""
+    parser = argparse.ArgumentParser(
+        description='Run all encodings of a Bayesian network in parallel')
+    parser.add_argument(
+        'network', help='a Bayesian network (in one of DNE/NET/Hugin formats)')
+    parser.add_argument('-e',
+                        dest='evidence',
+                        help='evidence file (in the INST format)')
+    parser.add_argument('-r',
+                        dest='results',
+                        help='the prefix of the names of log files ' +
+                        '(default: the name of the network)')
+    parser.add_argument('-j',
+                        dest='jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='the maximum number of encodings that run at ' +
+                        'the same time (default: the number of CPUs)')
+    parser.add_argument('-t',
+                        dest='timeout',
+                        type=int,
+                        default=TIMEOUT,
+                        help='the CPU time limit of every encoding and ' +
+                        'algorithm (in seconds, default: {})'.format(TIMEOUT))
+    parser.add_argument(
+        '-m',
+        dest='memory',
+        default=str(MAX_MEMORY),
+        help='the maximum amount of virtual memory available to underlying ' +
+        'encoders of every encoding and to every algorithm (in GiB, ' +
+        'default: {})'.format(MAX_MEMORY))
+    parser.add_argument('-n',
+                        dest='encode_only',
+                        action='store_true',
+                        help='only run the encodings (without inference)')
+    parser.add_argument('--make', default='make', help='the make command')
+    return parser.parse_args(arguments)
+
+
+def main():
+    args = parse_arguments()
+    bn = common.BayesianNetwork(args.network)
+    results = args.network if args.results is None else args.results
+    waiting = list(JOBS)
+    running = {}
+    num_failed = 0
+    while waiting or running:
+        while waiting and len(running) < args.jobs:
+            encoding, mode = waiting.pop(0)
+            arguments = [
+                encoding, mode,
+                working_copy(args.network, encoding, mode)
+            ]
+            if args.evidence is not None:
+                arguments += ['-e', args.evidence]
+            arguments += ['-m', args.memory]
+            log = log_filename(results, encoding, mode)
+            pid = start(arguments, bn, log, args.timeout)
+            running[pid] = (encoding, mode, arguments, log,
+                            time.perf_counter())
+        pid, status, usage = os.wait4(-1, 0)
+        if pid not in running:
+            continue
+        encoding, mode, arguments, log, start_time = running.pop(pid)
+        elapsed = time.perf_counter() - start_time
+        if arguments is None:  # Inference (logged by the Makefile)
+            print('inference on {} {} in {:.3f}s'.format(
+                encoding, mode, elapsed),
+                  flush=True)
+            continue
+        command = 'python tools/encode.py ' + ' '.join(arguments)
+        with open(log, 'a') as log_file:
+            log_file.write(format_usage(command, status, elapsed, usage))
+        if status != 0:
+            num_failed += 1
+        print('{} in {:.3f}s{}'.format(command, elapsed,
+                                       '' if status == 0 else ' (FAILED)'),
+              flush=True)
+        # As in the Makefile, the algorithm runs even if the encoding failed
+        if not args.encode_only:
+            pid = start_inference(arguments[2], encoding, mode, results, args)
+            running[pid] = (encoding, mode, None, None, time.perf_counter())
+    sys.exit(1 if num_failed > 0 else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Encodes many Bayesian networks without restarting the interpreter. Each line
+of the jobs file holds the command-line arguments of one run of encode.py,
+e.g.,
+
+cw basic data/2004-pgm/alarm.net -e data/2004-pgm/alarm-1.inst -m 32
+
+Empty lines and lines that start with '#' are ignored. A job that fails is
+reported and does not stop the remaining jobs."""
+
+import argparse
+import shlex
+import sys
+import time
+import traceback
+
+import encode
+
+
+def read_jobs(jobs_file):
+    """Yields the list of arguments of every job in the file."""
+    for line in jobs_file:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield shlex.split(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run many encodings (see encode.py) in a single process')
+    parser.add_argument(
+        'jobs',
+        type=argparse.FileType('r'),
+        help='a file with the arguments of encode.py on each line (or - ' +
+        'for standard input)')
+    args = parser.parse_args()
+
+    num_failed = 0
+    for job in read_jobs(args.jobs):
+        print('Encoding {}'.format(' '.join(job)), flush=True)
+        start = time.perf_counter()
+        try:
+            encode.encode(encode.parse_arguments(job))
+        except (Exception, SystemExit):
+            num_failed += 1
+            traceback.print_exc()
+            print('FAILED', flush=True)
+            continue
+        print('Done in {:.3f}s'.format(time.perf_counter() - start),
+              flush=True)
+    sys.exit(1 if num_failed > 0 else 0)
+
+
+if __name__ == '__main__':
+    main()
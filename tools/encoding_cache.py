@@ -0,0 +1,165 @@
+# A persistent cache of encodings, used by encode.py (see its --cache option)
+
+import glob
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+
+DEFAULT_SIZE = 10  # In GiB
+# Command-line arguments of encode.py that do not affect the encoding (the
+# memory limit does since external encoders might run out of memory)
+IGNORED_ARGUMENTS = ('cache', 'cache_size', 'link')
+
+
+def file_digest(path, digest):
+    """Adds the contents of a file (or of all files in a directory, together
+    with their names) to a hashlib object."""
+    if os.path.isdir(path):
+        for filename in sorted(os.listdir(path)):
+            digest.update(filename.encode())
+            file_digest(os.path.join(path, filename), digest)
+        return
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+
+
+def source_version(filenames):
+    """The version of an encoder, i.e., a hash of the names and contents of its
+    files (e.g., its source code and the external programs that it runs, some
+    of which might be missing), so that any change to the encoder invalidates
+    the cache."""
+    digest = hashlib.sha256()
+    for filename in filenames:
+        digest.update(filename.encode())
+        if os.path.exists(filename):
+            file_digest(filename, digest)
+    return digest.hexdigest()
+
+
+def encoding_key(args, version):
+    """Returns the key of an encoding: a hash of the version of the encoder, the
+    contents of all input files (i.e., the network, the evidence, and the batch
+    of evidence), and all other command-line arguments that affect the
+    encoding (e.g., encoding and mode). File names are not part of the key, so
+    a copy of a network shares its encodings with the original."""
+    digest = hashlib.sha256(version.encode())
+    for name, value in sorted(vars(args).items()):
+        if name in IGNORED_ARGUMENTS:
+            continue
+        digest.update('\0{}='.format(name).encode())
+        if name in ('network', 'evidence', 'evidence_batch') and value:
+            file_digest(value, digest)
+        else:
+            digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+def output_files(network):
+    """Maps every file written next to the network (i.e., whose name starts
+    with the name of the network and a dot) to its modification time."""
+    files = {}
+    for path in glob.glob(glob.escape(network) + '.*'):
+        if os.path.isfile(path):
+            files[path] = os.stat(path).st_mtime_ns
+    return files
+
+
+def break_links(network):
+    """Replaces every file next to the network that is a hard link (e.g., to an
+    entry of the cache) with a copy, so that writing to the file cannot change
+    the cache."""
+    for path in output_files(network):
+        if os.stat(path).st_nlink > 1:
+            copy = path + '.copy'
+            shutil.copyfile(path, copy)
+            os.replace(copy, path)
+
+
+class EncodingCache:
+    """A directory of encodings with least-recently-used eviction. Every entry
+    is a subdirectory named after the key of the encoding that holds all the
+    files written by the encoder (e.g., CNF, LMAP, and weights files), named
+    by what follows the name of the network. The modification time of a
+    subdirectory records when it was last used. The files of an entry are
+    read-only, and they are restored either as hard links (which takes the same
+    time regardless of their size) or as copies."""
+    def __init__(self, directory, size=DEFAULT_SIZE, link=False):
+        self.directory = directory
+        self.max_bytes = int(size * 1024**3)
+        self.link = link
+        os.makedirs(directory, exist_ok=True)
+
+    def restore(self, key, network):
+        """Recreates the files of an encoding next to the network. Returns False
+        if the encoding is not in the cache (including if another process
+        evicts it in the meantime, in which case the files restored so far are
+        removed)."""
+        entry = os.path.join(self.directory, key)
+        placed = []
+        try:
+            os.utime(entry)
+            for suffix in os.listdir(entry):
+                placed.append(network + suffix)
+                self._place(os.path.join(entry, suffix), network + suffix)
+        except FileNotFoundError:
+            for path in placed:
+                if os.path.lexists(path):
+                    os.remove(path)
+            return False
+        return True
+
+    def store(self, key, network, files):
+        """Adds the given files (written by the encoder next to the network) to
+        the cache and evicts the least recently used entries if the cache is
+        larger than its size budget."""
+        entry = os.path.join(self.directory, key)
+        if os.path.exists(entry):
+            return
+        # The entry is built under a temporary name and then renamed, so other
+        # processes never see a partial entry
+        temporary = tempfile.mkdtemp(dir=self.directory, prefix='.')
+        for path in files:
+            target = os.path.join(temporary, path[len(network):])
+            shutil.copyfile(path, target)
+            os.chmod(target, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        try:
+            os.rename(temporary, entry)
+        except OSError:  # Another process has stored the same encoding
+            shutil.rmtree(temporary)
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits into its
+        size budget."""
+        entries = []
+        total = 0
+        for key in os.listdir(self.directory):
+            entry = os.path.join(self.directory, key)
+            if key.startswith('.') or not os.path.isdir(entry):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(entry, suffix))
+                for suffix in os.listdir(entry))
+            entries.append((os.stat(entry).st_mtime_ns, size, entry))
+            total += size
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def _place(self, source, destination):
+        # An existing file is removed rather than overwritten since it might be
+        # a hard link to another entry
+        if os.path.lexists(destination):
+            os.remove(destination)
+        if self.link:
+            try:
+                os.link(source, destination)
+                return
+            except OSError:  # E.g., the cache is on a different file system
+                pass
+        shutil.copyfile(source, destination)
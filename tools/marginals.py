@@ -0,0 +1,158 @@
+"""Computes the marginal distributions of many variables of a Bayesian network
+(optionally given evidence) with a single encoding and a single join tree.
+The network is encoded once (see the -q option of encode.py), the join tree
+of the resulting CNF formula is constructed once, and DPMC is run once per
+variable-value pair on a copy of the formula where the pair is enforced by
+zero weights instead of additional clauses, so that the clauses (and thus the
+join tree) stay the same. For example,
+
+python tools/marginals.py data/2004-pgm/alarm.net -e data/2004-pgm/alarm-1.inst
+
+prints a CSV table with the probability of each value of each variable (run
+from the root directory of the repository so that DPMC can be found)."""
+
+import argparse
+import collections
+import csv
+import shlex
+import subprocess
+import sys
+import time
+
+import common
+import encode
+
+Query = collections.namedtuple('Query', ['variable', 'value', 'literals'])
+
+
+def read_queries(queries_filename):
+    """Parses a file written by encode.write_queries_file."""
+    with open(queries_filename) as queries_file:
+        for line in queries_file:
+            words = line.split()
+            yield Query(words[0], words[1], words[2:])
+
+
+def force_literals(lines, literals):
+    """Given the lines of a CNF file, returns new lines where all the given
+    literals are forced to be true by setting the weights of their negations
+    to zero. Literal weights (i.e., a 'c weights' line) are edited in place,
+    while for conditional weights (as in cw) a weight line without conditions
+    is added for each literal. The clauses remain the same."""
+    lines = list(lines)
+    for i, line in enumerate(lines):
+        if line.startswith('c weights'):
+            weights = line.split()
+            for literal in map(int, literals):
+                # Weights of a variable v are at positions 2v and 2v + 1
+                weights[2 * abs(literal) + (1 if literal > 0 else 0)] = '0'
+            lines[i] = ' '.join(weights)
+            return lines
+    for literal in map(int, literals):
+        lines.append('w {} {}'.format(abs(literal),
+                                      '1 0' if literal > 0 else '0 1'))
+    return lines
+
+
+def run_lg(cnf_filename, join_tree_filename, timeout):
+    """Constructs a join tree for the CNF file and writes it to a file."""
+    subprocess.run([
+        'bash', '-c', 'timeout {} {} < {} > {}'.format(
+            timeout, common.LG, cnf_filename, join_tree_filename)
+    ])
+
+
+def run_dmc(cnf_filename, join_tree_filename, weight_format):
+    """Runs the executor of DPMC with a precomputed join tree. Returns the
+    answer (or None if it could not be found in the output)."""
+    process = subprocess.run([
+        'bash', '-c', '{} --jf={} --cf={} --wf {}'.format(
+            common.DMC, join_tree_filename, cnf_filename, weight_format)
+    ],
+                             stdout=subprocess.PIPE)
+    for line in process.stdout.decode('utf-8').splitlines():
+        if line.startswith('s wmc'):
+            return float(line.split()[2])
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compute marginal probabilities with a single encoding')
+    parser.add_argument(
+        'network', help='a Bayesian network (in one of DNE/NET/Hugin formats)')
+    parser.add_argument('-e',
+                        dest='evidence',
+                        help='evidence file (in the INST format)')
+    parser.add_argument(
+        '-q',
+        dest='queries',
+        default='all',
+        help="a comma-separated list of query variables or 'all' (default)")
+    parser.add_argument('-c',
+                        dest='encoding',
+                        default='cw',
+                        help='the encoding (as in encode.py)')
+    parser.add_argument('-o',
+                        dest='options',
+                        default='',
+                        help='other options of encode.py (as one string)')
+    parser.add_argument('-w',
+                        dest='weight_format',
+                        type=int,
+                        default=5,
+                        help='the weight format of DPMC')
+    parser.add_argument('-t',
+                        dest='timeout',
+                        type=int,
+                        default=100,
+                        help='the time limit for constructing the join tree ' +
+                        '(in seconds)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    arguments = [args.encoding, 'basic', args.network, '-q', args.queries]
+    if args.evidence is not None:
+        arguments += ['-e', args.evidence]
+    encode.encode(
+        encode.parse_arguments(arguments + shlex.split(args.options)))
+    cnf_filename = args.network + '.cnf'
+    join_tree_filename = args.network + '.jt'
+    query_filename = args.network + '.query.cnf'
+    with open(cnf_filename) as cnf_file:
+        lines = cnf_file.read().splitlines()
+    print('Encoded in {:.3f}s'.format(time.perf_counter() - start),
+          file=sys.stderr)
+
+    start = time.perf_counter()
+    run_lg(cnf_filename, join_tree_filename, args.timeout)
+    print('Planned in {:.3f}s'.format(time.perf_counter() - start),
+          file=sys.stderr)
+
+    # Compute the answers and normalise them for each variable
+    start = time.perf_counter()
+    answers = collections.defaultdict(list)
+    for query in read_queries(args.network + '.queries'):
+        with open(query_filename, 'w') as query_file:
+            query_file.write(
+                '\n'.join(force_literals(lines, query.literals)) + '\n')
+        answers[query.variable].append(
+            (query.value,
+             run_dmc(query_filename, join_tree_filename, args.weight_format)))
+    print('Executed in {:.3f}s'.format(time.perf_counter() - start),
+          file=sys.stderr)
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['variable', 'value', 'wmc', 'probability'])
+    for variable, values in answers.items():
+        total = (None if any(answer is None for _, answer in values) else sum(
+            answer for _, answer in values))
+        for value, answer in values:
+            writer.writerow([
+                variable, value, answer,
+                answer / total if total else None
+            ])
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,13 @@
 import csv
 import glob
+import json
+import multiprocessing
 import os
 import re
 
+# Parsed result files, so that only new result files are parsed again
+STORE = 'results/parsed.json'
+
 directories = [
     ('Grid/Ratio_50/', 'Grid-50'),
     ('Grid/Ratio_75/', 'Grid-75'),
@@ -20,37 +25,48 @@ directories = [
 
 
 def parse(filename):
-    with open(filename) as f:
-        lines = f.read().splitlines()
+    # The lines are read one at a time, and reading stops at the running time
+    # reported by /usr/bin/time (which is always written after the output of
+    # the program)
     answer = None
     time = None
     width = None
-    for line in lines:
-        if line.lstrip().startswith('Elapsed') and not filename.endswith('.cw.new_inf'):
-            # Time
-            time_str = line.split()[7]
-            colon_i = time_str.index(':')
-            time = (60 * int(time_str[:colon_i]) +
-                    float(time_str[colon_i + 1:]))
-        elif filename.endswith('.new_inf') and line.startswith('* modelCount'):
-            answer = line.split()[2]  # ADDMC answer
-        elif filename.endswith('.new_inf') and line.startswith('s wmc'):
-            answer = line.split()[2]  # DPMC answer
-        elif filename.endswith('.new_inf') and 'with ADD width' in line:
-            width = line.split()[-1]
-        elif filename.endswith('.new_inf') and line.startswith('c seconds'):
-            time = line.split()[2]
-        elif filename.endswith('.bklm16.old_inf') and line[0].isdigit():
-            answer = line  # Query-DNNF answer
-        elif (filename.endswith('.sbk05.old_inf')
-              and line.startswith('Satisfying')):
-            answer = line.split()[2]  # Cachet answer
-        elif filename.endswith('.old_inf') and line.startswith('Pr(e) ='):
-            # Ace evaluation answer
-            try:
-                answer = re.match(r'[\d\.eE-]+', line.split()[2]).group(0)
-            except AttributeError:
-                answer = 'Inf'
+    use_elapsed = not filename.endswith('.cw.new_inf')
+    try:
+        f = open(filename)
+    except FileNotFoundError:
+        return time, answer, width
+    with f:
+        for line in f:
+            line = line.rstrip('\n')
+            if use_elapsed and line.lstrip().startswith('Elapsed'):
+                # Time
+                time_str = line.split()[7]
+                colon_i = time_str.index(':')
+                time = (60 * int(time_str[:colon_i]) +
+                        float(time_str[colon_i + 1:]))
+                break
+            elif filename.endswith('_enc'):
+                continue
+            elif filename.endswith('.new_inf') and line.startswith('* modelCount'):
+                answer = line.split()[2]  # ADDMC answer
+            elif filename.endswith('.new_inf') and line.startswith('s wmc'):
+                answer = line.split()[2]  # DPMC answer
+            elif filename.endswith('.new_inf') and 'with ADD width' in line:
+                width = line.split()[-1]
+            elif filename.endswith('.new_inf') and line.startswith('c seconds'):
+                time = line.split()[2]
+            elif filename.endswith('.bklm16.old_inf') and line[:1].isdigit():
+                answer = line  # Query-DNNF answer
+            elif (filename.endswith('.sbk05.old_inf')
+                  and line.startswith('Satisfying')):
+                answer = line.split()[2]  # Cachet answer
+            elif filename.endswith('.old_inf') and line.startswith('Pr(e) ='):
+                # Ace evaluation answer
+                try:
+                    answer = re.match(r'[\d\.eE-]+', line.split()[2]).group(0)
+                except AttributeError:
+                    answer = 'Inf'
     return time, answer, width
 
 
@@ -83,26 +99,103 @@ def parse_stats(filename):
         return next(reader)
 
 
-def parse_dir(directory, additional_data={}):
+def build_index():
+    # Treewidths and statistics of all networks (from all directories)
     treewidth = {}
-    for filename in glob.glob(directory + '*.td'):
-        if 'inst' not in filename:
-            treewidth[filename[:filename.rindex('.')]] = parse_td_file(
-                filename)
+    for directory, _ in directories:
+        for filename in glob.glob(os.path.join('results', directory, '*.td')):
+            if 'inst' not in filename:
+                treewidth[filename[:filename.rindex('.')]] = parse_td_file(
+                    filename)
     with open('results/tw_results.csv') as tw_file:
         reader = csv.DictReader(tw_file)
         for row in reader:
             treewidth[row['instance']] = row['treewidth']
 
     stats = {}
-    for filename in glob.glob('data' + directory[directory.index('/'):] + '*.stats'):
-        stats['results' + filename[filename.index('/'):filename.rindex('.')]] = parse_stats(filename)
+    for directory, _ in directories:
+        for filename in glob.glob(os.path.join('data', directory, '*.stats')):
+            stats['results' + filename[filename.index('/'):filename.rindex('.')]] = parse_stats(filename)
+    return treewidth, stats
+
+
+def lookup(index, filename, cache):
+    # The first of the possible network filenames that is in the index (all
+    # result files of an instance share the answer)
+    key = filename[:filename.rindex('.', 0, filename.rindex('.'))]
+    if key not in cache:
+        cache[key] = next((index[network_filename]
+                           for network_filename in network_filenames(filename)
+                           if network_filename in index), None)
+    return cache[key]
+
+
+def mtime(filename):
+    try:
+        return os.stat(filename).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def parse_pair(filename):
+    # Parses an inference log and the corresponding encoding log
+    inference_time, answer, width = parse(filename)
+    encoding_time, _, _ = parse(filename[:-3] + 'enc')
+    return filename, [
+        mtime(filename),
+        mtime(filename[:-3] + 'enc'), inference_time, answer, width,
+        encoding_time
+    ]
+
+
+def load_store():
+    # Previously parsed result files (with their modification times)
+    try:
+        with open(STORE) as store_file:
+            return json.load(store_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_store(store):
+    with open(STORE + '.tmp', 'w') as store_file:
+        json.dump(store, store_file)
+    os.replace(STORE + '.tmp', STORE)
+
+
+def main():
+    treewidth, stats = build_index()
+    store = load_store()
+    filenames = {}
+    for directory, dataset in directories:
+        for filename in glob.glob(
+                os.path.join('results', directory) + '*inf'):
+            filenames[filename] = dataset
+
+    # Only new and modified result files are parsed
+    new_filenames = [
+        filename for filename in filenames
+        if filename not in store or store[filename][:2] != [
+            mtime(filename), mtime(filename[:-3] + 'enc')
+        ]
+    ]
+    with multiprocessing.Pool() as pool:
+        for filename, parsed in pool.imap_unordered(parse_pair,
+                                                    new_filenames,
+                                                    chunksize=64):
+            store[filename] = parsed
+    for filename in list(store):
+        if filename not in filenames:
+            del store[filename]
+    save_store(store)
 
     data = []
-    for filename in glob.glob(directory + '*inf'):
-        d = additional_data.copy()
-        d['inference_time'], d['answer'], d['add_width'] = parse(filename)
-        d['encoding_time'], _, _ = parse(filename[:-3] + 'enc')
+    treewidth_cache = {}
+    stats_cache = {}
+    for filename, dataset in filenames.items():
+        d = {'dataset': dataset}
+        (d['inference_time'], d['answer'], d['add_width'],
+         d['encoding_time']) = store[filename][2:]
         parts = filename.split('.')
         instance = (parts[0] if parts[1] in [
             'inst', 'cd05', 'cd06', 'cw', 'sbk05', 'd02'
@@ -111,28 +204,19 @@ def parse_dir(directory, additional_data={}):
         d['novelty'], _ = parts[-1].split('_')
         d['encoding'] = parts[-2]
 
-        for network_filename in network_filenames(filename):
-            if network_filename in treewidth:
-                d['treewidth'] = treewidth[network_filename]
-                break
-        if 'treewidth' not in d:
+        network_treewidth = lookup(treewidth, filename, treewidth_cache)
+        if network_treewidth is not None:
+            d['treewidth'] = network_treewidth
+        else:
             print('Warning: {} has no corresponding tree decomposition file.'.
                   format(filename))
 
-        for network_filename in network_filenames(filename):
-            if network_filename in stats:
-                d.update(stats[network_filename])
-                break
+        network_stats = lookup(stats, filename, stats_cache)
+        if network_stats is not None:
+            d.update(network_stats)
 
         data.append(d)
-    return data
-
 
-def main():
-    data = []
-    for directory, dataset in directories:
-        data += parse_dir(os.path.join('results', directory),
-                          {'dataset': dataset})
     fieldnames = set()
     for d in data:
         fieldnames.update(d.keys())
@@ -143,4 +227,5 @@ def main():
             writer.writerow(d)
 
 
-main()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""Reruns only those experiments of the Makefile whose results are out of date.
+Every (instance, encoding, mode) triple of the WITHOUT_EVIDENCE and
+*_WITH_EVIDENCE targets produces an encoding log (e.g., .d02.new_enc) and
+usually an inference log (e.g., .d02.new_inf) in results/. A manifest
+(results/fingerprints.json by default) records, for each such file, the hashes
+of the network, the evidence, the encoder (its source code and the external
+programs it runs), and the solver that produced it. A triple is rerun (with
+the EXPERIMENT target of the Makefile, i.e., with the same commands as the
+other targets) if any of its files is missing or any of these hashes has
+changed since it was written, e.g.,
+
+python tools/rerun.py -j 16 2004-pgm DQMR/qmr-50
+
+only reruns the bklm16 triples if only bn2cnf changes. The triples of the same
+instance run one after another (since they write to the same files), while
+different instances run in parallel."""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import shutil
+import subprocess
+import threading
+
+import encode
+import encode_all
+import encoding_cache
+import schedule
+
+# As in the Makefile
+TIMEOUT = encode_all.TIMEOUT
+MAX_MEMORY = encode_all.MAX_MEMORY  # In GiB
+
+# The files of which the fingerprint of each solver consists (the fingerprint
+# of each encoder consists of encode.encoder_files)
+SOLVER_FILES = {
+    'dpmc': [
+        'deps/DPMC/lg/build/lg',
+        'deps/DPMC/lg/solvers/htd-master/bin/htd_main', 'deps/DPMC/DMC/dmc'
+    ],
+    'evaluate': ['deps/ace'],
+    'cachet': ['deps/cachet/cachet'],
+    'query-dnnf': ['tools/bklm16_wrapper.py', 'deps/query-dnnf/query-dnnf']
+}
+
+
+def solver(encoding, mode):
+    """The solver used on an encoding (as in the Makefile) or None if the
+    encoding is not used for inference."""
+    if mode != 'legacy':
+        return None if (encoding, mode) in [('cd05', 'basic'),
+                                            ('cd06', 'basic')] else 'dpmc'
+    return {
+        'sbk05': 'cachet',
+        'bklm16': 'query-dnnf'
+    }.get(encoding, 'evaluate')
+
+
+def fingerprint(filenames):
+    """A hash of the names and contents of the given files and directories
+    (some of which might be missing)."""
+    return encoding_cache.source_version(filenames)
+
+
+def command(network, evidence, encoding, mode, results, args):
+    """The make command that runs a triple and the files it writes to
+    results/."""
+    encoding_log = encode_all.log_filename(results, encoding, mode)
+    inference_log = encoding_log[:-len('enc')] + 'inf'
+    arguments = [
+        args.make, '-s', network + '/EXPERIMENT', 'ENCODING=' + encoding,
+        'MODE=' + mode, 'RESULTS=' + results,
+        'TIMEOUT={}'.format(args.timeout),
+        'MAX_MEMORY={}'.format(args.memory),
+        'MAX_MEMORY_KB={}'.format(int(0.95 * args.memory * 1024**2))
+    ]
+    if evidence is not None:
+        arguments.append('EVIDENCE=' + evidence)
+    outputs = [encoding_log]
+    if solver(encoding, mode) is not None:
+        outputs.append(inference_log)
+    return arguments, outputs
+
+
+class Manifest:
+    """The fingerprints of all result files, saved after every change."""
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.fingerprints = {}
+        if os.path.isfile(filename):
+            with open(filename) as manifest_file:
+                self.fingerprints = json.load(manifest_file)
+
+    def is_stale(self, outputs, fingerprints):
+        return any(
+            not os.path.isfile(output)
+            or self.fingerprints.get(output) != fingerprints
+            for output in outputs)
+
+    def update(self, outputs, fingerprints):
+        with self.lock:
+            for output in outputs:
+                self.fingerprints[output] = fingerprints
+            with open(self.filename + '.tmp', 'w') as manifest_file:
+                json.dump(self.fingerprints, manifest_file, indent=1,
+                          sort_keys=True)
+            os.replace(self.filename + '.tmp', self.filename)
+
+
+class Runner:
+    def __init__(self, args):
+        self.args = args
+        self.manifest = Manifest(args.manifest)
+        self.encoders = {
+            encoding: fingerprint(encode.encoder_files(encoding))
+            for encoding, _ in encode_all.JOBS
+        }
+        self.solvers = {
+            name: fingerprint(files)
+            for name, files in SOLVER_FILES.items()
+        }
+
+    def stale_triples(self, job):
+        """Lists the stale triples of a job of schedule.py (i.e., an
+        instance) as (encoding, mode, commands, outputs, fingerprints)."""
+        evidence = (None if job.target == 'WITHOUT_EVIDENCE' else
+                    job.instance)
+        # For instances with evidence, the Makefile works on a copy of the
+        # network named after the evidence file
+        network = (job.instance if evidence is None else '{}.{}'.format(
+            job.instance, job.target[:3].lower()))
+        results = os.path.join('results', job.instance[len('data/'):])
+        inputs = {
+            'network': fingerprint([job.network]),
+            'evidence': None if evidence is None else fingerprint([evidence])
+        }
+        triples = []
+        for encoding, mode in encode_all.JOBS:
+            arguments, outputs = command(network, evidence, encoding, mode,
+                                         results, self.args)
+            inference = solver(encoding, mode)
+            fingerprints = dict(inputs,
+                                encoder=self.encoders[encoding],
+                                solver=(None if inference is None else
+                                        self.solvers[inference]))
+            if self.manifest.is_stale(outputs, fingerprints):
+                triples.append(
+                    (encoding, mode, arguments, outputs, fingerprints))
+        return job, network, triples
+
+    def run(self, job, network, triples):
+        if network != job.network:
+            shutil.copyfile(job.network, network)
+        for encoding, mode, arguments, outputs, fingerprints in triples:
+            # Failures are recorded in the logs (as with '-' in the Makefile)
+            subprocess.run(arguments, stdout=subprocess.DEVNULL)
+            self.manifest.update(outputs, fingerprints)
+            print('{} {} {}'.format(job.instance, encoding, mode), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Rerun the experiments with out-of-date results')
+    parser.add_argument('directories',
+                        metavar='directory',
+                        nargs='*',
+                        default=sorted(schedule.DATASETS),
+                        help='directories of data/ (default: all of them)')
+    parser.add_argument('-j',
+                        dest='jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='the number of instances processed at the ' +
+                        'same time (default: the number of CPUs)')
+    parser.add_argument('-t',
+                        dest='timeout',
+                        type=int,
+                        default=TIMEOUT,
+                        help='the CPU time limit of every command (in ' +
+                        'seconds)')
+    parser.add_argument('-m',
+                        dest='memory',
+                        type=int,
+                        default=MAX_MEMORY,
+                        help='the memory limit of every command (in GiB)')
+    parser.add_argument('--manifest',
+                        default='results/fingerprints.json',
+                        help='the file with the fingerprints of all results')
+    parser.add_argument('--make', default='make', help='the make command')
+    parser.add_argument('-n',
+                        dest='dry_run',
+                        action='store_true',
+                        help='only print the stale triples')
+    args = parser.parse_args()
+    for directory in args.directories:
+        if directory not in schedule.DATASETS:
+            parser.error('unknown directory: {}'.format(directory))
+
+    runner = Runner(args)
+    work = []
+    for job in schedule.find_jobs(args.directories):
+        if job.network is None:
+            continue
+        job, network, triples = runner.stale_triples(job)
+        if triples:
+            work.append((job, network, triples))
+    print('{} stale triples in {} instances'.format(
+        sum(len(triples) for _, _, triples in work), len(work)))
+    if args.dry_run:
+        for job, _, triples in work:
+            for encoding, mode, _, _, _ in triples:
+                print('{} {} {}'.format(job.instance, encoding, mode))
+        return
+    with concurrent.futures.ThreadPoolExecutor(args.jobs) as executor:
+        for future in [executor.submit(runner.run, *item) for item in work]:
+            future.result()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+"""Runs the experiments of the Makefile (i.e., the WITHOUT_EVIDENCE and
+*_WITH_EVIDENCE targets) on many instances at the same time without running out
+of memory. Instead of giving every job the same memory limit (MAX_MEMORY), the
+memory needed by each instance is estimated from the size of its files and its
+treewidth (from results/tw_results.csv), and the jobs are packed onto the
+available cores so that their memory limits add up to at most the given
+budget. Jobs that run out of memory run again with twice as much memory (up to
+the largest memory limit). For example,
+
+python tools/schedule.py -j 16 -M 512 Grid/Ratio_50 2004-pgm
+
+runs 'make data/Grid/Ratio_50/50-12-4.dne/WITHOUT_EVIDENCE MAX_MEMORY=...' etc.
+(so the results are written to the same .new_enc/.new_inf/... files as
+before). Every finished job is recorded in a manifest (results/schedule.jsonl
+by default) together with its memory limit, running time, exit status, and
+output files, and jobs that are already in the manifest are skipped, so an
+interrupted campaign can be resumed by running the same command again. Jobs
+that ran out of memory are only recorded once they had the largest memory
+limit."""
+
+import argparse
+import csv
+import glob
+import json
+import math
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+
+# For each directory of data/: the files that define instances and the target
+# of the Makefile that runs all the experiments on an instance
+DATASETS = {
+    'Grid/Ratio_50': ('*.dne', 'WITHOUT_EVIDENCE'),
+    'Grid/Ratio_75': ('*.dne', 'WITHOUT_EVIDENCE'),
+    'Grid/Ratio_90': ('*.dne', 'WITHOUT_EVIDENCE'),
+    'DQMR/qmr-100': ('*.dne', 'WITHOUT_EVIDENCE'),
+    'DQMR/qmr-50': ('*.inst', 'DNE_WITH_EVIDENCE'),
+    'DQMR/qmr-60': ('*.inst', 'DNE_WITH_EVIDENCE'),
+    'DQMR/qmr-70': ('*.inst', 'DNE_WITH_EVIDENCE'),
+    'Plan_Recognition/without_evidence': ('*.dne', 'WITHOUT_EVIDENCE'),
+    'Plan_Recognition/with_evidence': ('*.inst', 'DNE_WITH_EVIDENCE'),
+    '2004-pgm': ('*.inst', 'NET_WITH_EVIDENCE'),
+    '2005-ijcai': ('*.inst', 'NET_WITH_EVIDENCE'),
+    '2006-ijar': ('*.inst', 'NET_WITH_EVIDENCE'),
+}
+
+# The memory model (in bytes): a constant overhead (the Python interpreter,
+# the JVM of Ace, etc.), a multiple of the size of the input files (the
+# encodings), and a multiple of the size of the largest tensor of DPMC (which
+# is exponential in the width of the join tree of the CNF formula)
+OVERHEAD = 1024**3
+SIZE_FACTOR = 200
+TENSOR_FACTOR = 4 * 8
+# The width of a join tree of an encoding is larger than the treewidth of the
+# network (e.g., every value of a variable is a separate variable of the CNF
+# formula), so, if DPMC has not reported the width yet, the treewidth is
+# multiplied by this factor
+WIDTH_FACTOR = 2
+
+# Lines in the logs of a job that mean that a program ran out of memory
+# (Python, C++, Java, and other programs, respectively)
+OUT_OF_MEMORY = re.compile(
+    r'MemoryError|std::bad_alloc|java\.lang\.OutOfMemoryError|'
+    r'Cannot allocate memory|out of memory', re.IGNORECASE)
+
+
+class Job:
+    """An instance (i.e., a network or an evidence file in data/) and the
+    target of the Makefile that runs the experiments on it."""
+    def __init__(self, instance, target, network):
+        self.instance = instance
+        self.target = target
+        self.network = network
+        self.memory = None  # In GiB
+
+    @property
+    def name(self):
+        return '{}/{}'.format(self.instance, self.target)
+
+
+def network_filename(instance, extension):
+    """The network of an evidence file (found in the same way as in the
+    Makefile)."""
+    for filename in [
+            re.sub(r'-[a-z0-9]+\.inst$', '.' + extension, instance),
+            os.path.splitext(instance)[0] + '.' + extension
+    ]:
+        if os.path.isfile(filename):
+            return filename
+    return None
+
+
+def find_jobs(directories):
+    """Lists the jobs of the given directories (relative to data/)."""
+    jobs = []
+    for directory in directories:
+        pattern, target = DATASETS[directory]
+        for instance in sorted(
+                glob.glob(os.path.join('data', directory, pattern))):
+            if target == 'WITHOUT_EVIDENCE':
+                network = instance
+            else:
+                network = network_filename(instance, target[:3].lower())
+            jobs.append(Job(instance, target, network))
+    return jobs
+
+
+def read_treewidths(filename):
+    """Maps the filenames of networks (in data/) to their treewidths."""
+    treewidths = {}
+    if not os.path.isfile(filename):
+        return treewidths
+    with open(filename) as tw_file:
+        for row in csv.DictReader(tw_file):
+            instance = row['instance']
+            if instance.startswith('results/'):
+                instance = 'data/' + instance[len('results/'):]
+            treewidths[instance] = int(row['treewidth'])
+    return treewidths
+
+
+def reported_width(job):
+    """The largest width of a join tree reported by DPMC in the logs of the job
+    (from an earlier run) or None."""
+    width = None
+    for filename in output_files(job):
+        if not filename.endswith('.new_inf'):
+            continue
+        with open(filename, errors='replace') as log:
+            for line in log:
+                if 'with ADD width' in line:
+                    try:
+                        width = max(width or 0, int(line.split()[-1]))
+                    except ValueError:
+                        continue
+    return width
+
+
+def estimate_memory(job, treewidths, min_memory, max_memory):
+    """Estimates the memory needed by a job (in GiB, rounded up) from the sizes
+    of its files and the width of the join trees of its encodings, i.e., the
+    largest width reported by DPMC or else the treewidth of its network times
+    WIDTH_FACTOR. Jobs with unknown widths get the maximum amount of memory."""
+    width = reported_width(job)
+    if width is None and job.network in treewidths:
+        width = WIDTH_FACTOR * treewidths[job.network]
+    if width is None:
+        return max_memory
+    size = sum(
+        os.path.getsize(filename) for filename in {job.instance, job.network})
+    # Large widths would overflow the float
+    estimate = (OVERHEAD + SIZE_FACTOR * size +
+                TENSOR_FACTOR * 2.0**min(width, 100))
+    return min(max_memory,
+               max(min_memory, int(math.ceil(estimate / 1024**3))))
+
+
+def read_manifest(filename):
+    """Returns the names of the jobs recorded in the manifest."""
+    finished = set()
+    if not os.path.isfile(filename):
+        return finished
+    with open(filename) as manifest:
+        for line in manifest:
+            try:
+                finished.add(json.loads(line)['job'])
+            except (ValueError, KeyError):  # E.g., a partially written line
+                continue
+    return finished
+
+
+def output_files(job):
+    """The files written by a job to results/."""
+    stem = os.path.join('results', job.instance[len('data/'):])
+    return sorted(filename for filename in glob.glob(glob.escape(stem) + '.*')
+                  if filename.endswith(('_enc', '_inf')))
+
+
+def out_of_memory(job):
+    """Checks whether any program of a finished job ran out of memory."""
+    for filename in output_files(job):
+        with open(filename, errors='replace') as log:
+            if any(OUT_OF_MEMORY.search(line) for line in log):
+                return True
+    return False
+
+
+def start(job, make):
+    """Starts a job with its memory limit (as in MAX_MEMORY and
+    MAX_MEMORY_KB of the Makefile)."""
+    return subprocess.Popen([
+        make, job.name, 'MAX_MEMORY={}'.format(job.memory),
+        'MAX_MEMORY_KB={}'.format(int(0.95 * job.memory * 1024**2))
+    ],
+                            stdout=subprocess.DEVNULL,
+                            start_new_session=True)
+
+
+def next_job(pending, free_memory, num_running):
+    """Chooses the largest job that fits into the free memory. If nothing is
+    running, the largest job runs regardless of the memory budget (since it
+    would never fit otherwise)."""
+    for job in pending:
+        if job.memory <= free_memory:
+            return job
+    if num_running == 0 and pending:
+        return pending[0]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the experiments on many instances in parallel')
+    parser.add_argument('directories',
+                        metavar='directory',
+                        nargs='*',
+                        default=sorted(DATASETS),
+                        help='directories of data/ (default: all of them)')
+    parser.add_argument('-j',
+                        dest='jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='the number of cores (default: all of them)')
+    parser.add_argument(
+        '-M',
+        dest='budget',
+        type=int,
+        default=(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') //
+                 1024**3),
+        help='the total amount of memory of all running jobs (in GiB, ' +
+        'default: all physical memory)')
+    parser.add_argument('--min-memory',
+                        type=int,
+                        default=2,
+                        help='the smallest memory limit of a job (in GiB)')
+    parser.add_argument('--max-memory',
+                        type=int,
+                        default=32,
+                        help='the largest memory limit of a job (in GiB)')
+    parser.add_argument('--treewidths',
+                        default='results/tw_results.csv',
+                        help='a CSV file with treewidths of networks')
+    parser.add_argument('--manifest',
+                        default='results/schedule.jsonl',
+                        help='the file that records finished jobs')
+    parser.add_argument('--make', default='make', help='the make command')
+    parser.add_argument('-n',
+                        dest='dry_run',
+                        action='store_true',
+                        help='only print the jobs and their memory limits')
+    args = parser.parse_args()
+    for directory in args.directories:
+        if directory not in DATASETS:
+            parser.error('unknown directory: {}'.format(directory))
+
+    treewidths = read_treewidths(args.treewidths)
+    finished = read_manifest(args.manifest)
+    pending = []
+    for job in find_jobs(args.directories):
+        if job.name in finished:
+            continue
+        if job.network is None:
+            print('Skipping {}: no network found'.format(job.instance),
+                  file=sys.stderr)
+            continue
+        job.memory = estimate_memory(job, treewidths, args.min_memory,
+                                     args.max_memory)
+        pending.append(job)
+    # Largest first, so that small jobs fill the gaps left by large ones
+    pending.sort(key=lambda job: job.memory, reverse=True)
+    print('{} jobs to run ({} already finished)'.format(
+        len(pending), len(finished)))
+    if args.dry_run:
+        for job in pending:
+            print('{} {}'.format(job.memory, job.name))
+        return
+
+    running = {}
+    free_memory = args.budget
+    # E.g., when the batch system stops the scheduler, so that the jobs are
+    # stopped as well
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    try:
+        while pending or running:
+            while len(running) < args.jobs:
+                job = next_job(pending, free_memory, len(running))
+                if job is None:
+                    break
+                pending.remove(job)
+                free_memory -= job.memory
+                running[start(job, args.make).pid] = (job, time.time())
+            pid, status = os.wait()
+            if pid not in running:
+                continue
+            job, start_time = running.pop(pid)
+            free_memory += job.memory
+            if job.memory < args.max_memory and out_of_memory(job):
+                job.memory = min(2 * job.memory, args.max_memory)
+                pending.append(job)
+                pending.sort(key=lambda job: job.memory, reverse=True)
+                print('{} ran out of memory, trying again with {} GiB'.format(
+                    job.name, job.memory),
+                      flush=True)
+                continue
+            record = {
+                'job': job.name,
+                'memory': job.memory,
+                'start': start_time,
+                'time': time.time() - start_time,
+                'status': (os.WEXITSTATUS(status) if os.WIFEXITED(status)
+                           else -os.WTERMSIG(status)),
+                'outputs': output_files(job)
+            }
+            with open(args.manifest, 'a') as manifest:
+                manifest.write(json.dumps(record) + '\n')
+            print('{} finished in {:.0f}s with status {} ({} left)'.format(
+                job.name, record['time'], record['status'],
+                len(pending) + len(running)),
+                  flush=True)
+    finally:
+        # Interrupted jobs are not in the manifest, so they run again on resume
+        for pid in running:
+            try:
+                os.killpg(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+if __name__ == '__main__':
+    main()